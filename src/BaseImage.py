@@ -1,9 +1,11 @@
 #!/usr/bin/env python
 """ In this script, the image arguments are initialized into PIL.Image classes."""
 
+import io
 import sys
 import pathlib
 
+import numpy as np
 from PIL import Image
 from utils.validation_util import validate_filename
 
@@ -16,21 +18,39 @@ class BaseImage(object):
        average color for each square of the base image.
 
        Attributes:
-           filename: (string) name of the file
+           filename: (string) name of the file. An already decoded PIL image,
+                              a (height, width, channels) uint8 array, the
+                              encoded image bytes or a file object are also
+                              accepted.
            img: (PIL.image) image from the file read in
+           draft_size: (tuple) Optional. If given, formats that support it
+                               (JPEG) are decoded at the smallest reduced
+                               scale that is still at least this size.
+                               Default: None
+           full_size: (tuple) size of the image at full resolution
     """
 
     @validate_filename
-    def __init__(self, filename):
+    def __init__(self, filename, draft_size=None):
         """Initializes BaseImage with filename and image."""
         self.name = filename
+        self.draft_size = draft_size
+        self.full_size = None
         self.img = self._get_img(filename)
 
+    @property
+    def is_drafted(self):
+        """Whether the image was decoded at a reduced scale."""
+        return self.img.size != self.full_size
+
     def _get_img(self, filename):
-        """Retrieves the image from the specified filename.
+        """Retrieves the image from the specified filename. If a draft_size
+           was given, the decoder is asked for a reduced scale first; formats
+           without a draft mode are decoded at full resolution.
 
            Args:
-               filename: (string) the name of the file
+               filename: (string) the name of the file, or a PIL image,
+                                  array, bytes or file object
 
            Returns:
                image: (PIL.image) the image
@@ -39,14 +59,31 @@ class BaseImage(object):
                 FileNotFoundError: if file not found
         """
 
+        if isinstance(filename, Image.Image):
+            self.full_size = filename.size
+            return filename
+        if isinstance(filename, np.ndarray):
+            image = Image.fromarray(np.ascontiguousarray(filename))
+            self.full_size = image.size
+            return image
+        if isinstance(filename, (bytes, bytearray, memoryview)):
+            filename = io.BytesIO(filename)
+
         try:
             with Image.open(filename) as image:
+                self.full_size = image.size
+                if self.draft_size:
+                    image.draft(image.mode, tuple(self.draft_size))
 
                 # PIL can be "lazy" so need to explicitly load image
                 image.load()
 
                 return image
         except OSError:
+            # File objects, e.g. image bytes, have no path to check
+            if not isinstance(filename, (str, pathlib.PurePath)):
+                raise
+
             # Check if the file does in fact exist
 
             # Check if the python version is 3.6 or greater
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+"""In this script, many input images are turned into mosaics against one source library."""
+
+import os
+import glob
+import time
+import multiprocessing
+
+from MosaicLibrary import MosaicLibrary
+from utils.metrics import Metrics
+
+# set in the batch and in each worker process to the loaded renderer
+_worker_renderer = None
+
+
+def expand_inputs(patterns=(), list_file=None):
+    """Lists the input images of a batch from file names or glob patterns
+       and from a list file of one file name or pattern per line.
+
+       Args:
+           patterns: (iterable) Optional. File names or glob patterns
+           list_file: (string) Optional. File listing more names or patterns.
+                               Blank lines and lines starting with # are skipped.
+
+       Returns:
+           (list) the input images in the given order, each listed once
+
+       Raises:
+           ValueError: if no input images were found
+    """
+
+    patterns = list(patterns)
+    if list_file:
+        with open(list_file, "r") as lines:
+            patterns += [line.strip() for line in lines if line.strip() and not line.startswith("#")]
+
+    filenames = []
+    for pattern in patterns:
+        matched = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        filenames += [fn for fn in matched if fn.endswith(".png") or fn.endswith(".jpg")
+                      or fn.endswith(".jpeg")]
+    filenames = list(dict.fromkeys(filenames))
+    if not filenames:
+        raise ValueError("Error. No input images were found for the batch.")
+    return filenames
+
+
+def _init_worker(options):
+    """Loads the renderer once per worker process. Forked workers inherit the
+       renderer already loaded by the batch."""
+    global _worker_renderer
+    if _worker_renderer is None:
+        _worker_renderer = BatchRenderer(**options)
+
+
+def _render_in_worker(filename):
+    return _worker_renderer.render_one(filename)
+
+
+def print_result(result):
+    """Prints the outcome of one rendered input image."""
+    filename, output_filename, seconds, regions, error = result
+    if error:
+        print(f"{filename}: failed after {seconds:.2f}s: {error}")
+    else:
+        print(f"{filename} -> {output_filename}: {regions} regions in {seconds:.2f}s")
+
+
+class BatchReport(object):
+    """BatchReport collects the time taken for each input image of a batch
+       and the throughput of the whole batch.
+
+       Attributes:
+           load_seconds: (float) time spent loading the library and index
+           wall_seconds: (float) time from the first to the last render
+           results: (list) (filename, output file name, seconds, regions,
+                           error) of each input image
+    """
+
+    def __init__(self, load_seconds=0.0):
+        """Initializes BatchReport with load_seconds."""
+        self.load_seconds = load_seconds
+        self.wall_seconds = 0.0
+        self.results = []
+
+    def add(self, result):
+        self.results.append(result)
+
+    def summary(self):
+        """Returns the per-image times and the aggregate throughput."""
+        rendered = [result for result in self.results if not result[4]]
+        seconds = sorted(result[2] for result in rendered)
+        regions = sum(result[3] for result in rendered)
+        wall = self.wall_seconds or float("inf")
+        return {
+            "images": len(rendered),
+            "failed": len(self.results) - len(rendered),
+            "regions": regions,
+            "load_seconds": self.load_seconds,
+            "wall_seconds": self.wall_seconds,
+            "images_per_second": len(rendered) / wall,
+            "regions_per_second": regions / wall,
+            "mean_seconds": sum(seconds) / len(seconds) if seconds else 0.0,
+            "median_seconds": seconds[len(seconds) // 2] if seconds else 0.0,
+            "max_seconds": seconds[-1] if seconds else 0.0,
+        }
+
+    def __str__(self):
+        s = self.summary()
+        return (f"Rendered {s['images']} images ({s['failed']} failed) in {s['wall_seconds']:.2f}s "
+                f"after loading the library in {s['load_seconds']:.2f}s: "
+                f"{s['images_per_second']:.2f} images/s, {s['regions_per_second']:.0f} regions/s, "
+                f"per image mean {s['mean_seconds']:.2f}s, median {s['median_seconds']:.2f}s, "
+                f"max {s['max_seconds']:.2f}s.")
+
+
+class BatchRenderer(object):
+    """BatchRenderer turns many input images into mosaics against the same
+       source library. Unlike PhotoMosaic.create_mosaic, which opens the
+       library and builds the color index for every mosaic, the library is
+       loaded once as a MosaicLibrary and shared by every input. With more
+       than one worker, the inputs are rendered in a pool of processes, each
+       of which loads the library once; forked workers share the one loaded
+       by the batch. The library load, every render and the whole batch are
+       timed in metrics, and the rendered and failed inputs, regions and
+       bytes written are counted, as the results come back to the batch.
+
+       Attributes:
+           directory: (string) image directory
+           piece_width: (int) the width of the box region. Default: 25
+           piece_height: (int) the height of the box region. Default: 25
+           match_mode: (string) "index", "batched" or "lut". Default: "index"
+           lut_bins: (int) bins per RGB channel of the color LUT. Default: 32
+           cells: (int) sub-cells along each side of the descriptors. Default: 1
+           workers: (int) number of processes rendering inputs. Default: 1
+           output_dir: (string) directory the mosaics are saved to. Default: "."
+           default_img_dir: (string) Optional. Describes the default image
+                                     directory. Default: img_sets
+           metrics: (Metrics) timers and counters of the batch. Default: a new one
+           mosaic_library: (MosaicLibrary) the loaded library
+           load_seconds: (float) time spent loading the library and index
+    """
+
+    def __init__(self, directory, piece_width=25, piece_height=25, match_mode="index", lut_bins=32,
+                 workers=1, output_dir=".", default_img_dir="img_sets", cells=1, metrics=None):
+        """Initializes BatchRenderer and loads the source library."""
+        self.directory = directory
+        self.piece_width = piece_width
+        self.piece_height = piece_height
+        self.match_mode = match_mode
+        self.lut_bins = lut_bins
+        self.workers = max(1, int(workers))
+        self.output_dir = output_dir
+        self.default_img_dir = default_img_dir
+        self.cells = cells
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.mosaic_library = MosaicLibrary(directory, piece_width, piece_height, match_mode, lut_bins,
+                                            default_img_dir, cells=cells)
+        self.load_seconds = self.mosaic_library.load_seconds
+        self.metrics.add_time("library_load", self.load_seconds)
+        self.metrics.labels.update(library=self.mosaic_library.s_img_p.img_dir,
+                                   library_size=len(self.mosaic_library.library))
+
+    @property
+    def options(self):
+        """The arguments that load the same renderer in a worker process."""
+        return {"directory": self.directory, "piece_width": self.piece_width,
+                "piece_height": self.piece_height, "match_mode": self.match_mode,
+                "lut_bins": self.lut_bins, "output_dir": self.output_dir,
+                "default_img_dir": self.default_img_dir, "cells": self.cells}
+
+    def output_filename(self, filename):
+        """Returns the mosaic file of an input image."""
+        stem = os.path.splitext(os.path.basename(filename))[0]
+        return os.path.join(self.output_dir, f"mosaic_{stem}_{self.mosaic_library.s_img_p.img_dir}.png")
+
+    def render_one(self, filename):
+        """Renders the mosaic of one input image with the loaded library.
+           Errors are returned rather than raised so one bad input does not
+           stop the batch.
+
+           Args:
+               filename: (string) the input image
+
+           Returns:
+               (string, string, float, int, string) the input image, the
+               mosaic file, seconds taken, number of regions and the error,
+               or None if it was rendered
+        """
+
+        started = time.perf_counter()
+        output_filename = self.output_filename(filename)
+        try:
+            mosaic = self.mosaic_library.render(filename)
+            mosaic.save(output_filename)
+        except (OSError, ValueError) as error:
+            return filename, None, time.perf_counter() - started, 0, str(error)
+        return (filename, output_filename, time.perf_counter() - started,
+                self.mosaic_library.regions(mosaic), None)
+
+    def render(self, filenames, progress=print_result):
+        """Renders the mosaics of the input images.
+
+           Args:
+               filenames: (list) the input images
+               progress: (function) Optional. Called with the result of each
+                                    input image, in order. Default: print_result
+
+           Returns:
+               (BatchReport) the time taken for each input and the throughput
+        """
+
+        global _worker_renderer
+        report = BatchReport(self.load_seconds)
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+        started = time.perf_counter()
+        if self.workers == 1:
+            results = map(self.render_one, filenames)
+            for result in results:
+                report.add(result)
+                self._record(result)
+                if progress:
+                    progress(result)
+        else:
+            _worker_renderer = self
+            try:
+                with multiprocessing.Pool(self.workers, _init_worker, (self.options,)) as pool:
+                    for result in pool.imap(_render_in_worker, filenames):
+                        report.add(result)
+                        self._record(result)
+                        if progress:
+                            progress(result)
+            finally:
+                _worker_renderer = None
+        report.wall_seconds = time.perf_counter() - started
+        self.metrics.add_time("batch", report.wall_seconds)
+        return report
+
+    def _record(self, result):
+        """Adds the outcome of one input image to the metrics."""
+        filename, output_filename, seconds, regions, error = result
+        if error:
+            self.metrics.count("failed_images")
+            return
+        self.metrics.add_time("render", seconds)
+        self.metrics.count("images")
+        self.metrics.count("regions", regions)
+        self.metrics.count("bytes_written", os.path.getsize(output_filename))
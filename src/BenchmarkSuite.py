@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+"""In this script, the stages of making a mosaic are timed on synthetic inputs and libraries."""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+
+import numpy as np
+import PIL
+from PIL import Image
+
+from ColorIndex import ColorIndex
+from ColorLUT import ColorLUT, build_table
+from MosaicLibrary import MosaicLibrary
+from Photomosaic import PhotoMosaic
+from SourceImageProcessor import SourceImageProcessor
+
+RESULTS_VERSION = 1
+# a stage is a regression when its median time grows by more than this share
+DEFAULT_THRESHOLD = 0.25
+
+
+def synthetic_colors(count, seed=0):
+    """Returns (count, 3) float32 average colors spread over the RGB cube."""
+    return np.random.RandomState(seed).uniform(0, 255, size=(count, 3)).astype(np.float32)
+
+
+def synthetic_image(megapixels, seed=0):
+    """Creates a 4:3 input image of about megapixels million pixels: smooth
+       color gradients, so the regions differ like a photograph, plus noise.
+
+       Returns:
+           (PIL.image) the RGB image
+    """
+
+    rng = np.random.RandomState(seed)
+    width = max(1, int(round((megapixels * 1e6 * 4 / 3) ** 0.5)))
+    height = max(1, int(round(megapixels * 1e6 / width)))
+    coarse = rng.randint(0, 256, size=(12, 16, 3)).astype(np.uint8)
+    image = np.asarray(Image.fromarray(coarse).resize((width, height), Image.BILINEAR), dtype=np.int16)
+    image = image + rng.randint(-12, 13, size=(height, width, 1), dtype=np.int16)
+    return Image.fromarray(np.clip(image, 0, 255).astype(np.uint8))
+
+
+def write_source_images(directory, count, size=(160, 120), seed=0):
+    """Writes count JPEG source images of random color blocks to directory."""
+    rng = np.random.RandomState(seed)
+    os.makedirs(directory, exist_ok=True)
+    width, height = size
+    for i in range(count):
+        blocks = rng.randint(0, 256, size=(3, 4, 3)).astype(np.uint8)
+        Image.fromarray(blocks).resize((width, height), Image.NEAREST).save(
+            os.path.join(directory, f"{i:06d}.jpg"), quality=90)
+
+
+def time_call(func, repeat=3):
+    """Calls func repeat times and returns the seconds each call took."""
+    seconds = []
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - started)
+    return seconds
+
+
+def environment():
+    """Describes the machine and library versions the benchmarks ran on."""
+    return {"python": platform.python_version(), "numpy": np.__version__, "pillow": PIL.__version__,
+            "platform": platform.platform(), "processor": platform.processor(),
+            "cpus": os.cpu_count()}
+
+
+class BenchmarkSuite(object):
+    """BenchmarkSuite times each stage of making a mosaic separately and end
+       to end, on synthetic inputs and libraries generated from a fixed seed,
+       so every run measures the same work:
+
+       - region_stats: average colors of the regions of an input image
+         (PhotoMosaic.get_avg_color_for_regions), per region engine
+       - index_build, lut_build: building the ColorIndex and the color LUT
+         of a library of source colors
+       - match: matching every region to the source colors
+         (PhotoMosaic.match_regions), per match mode
+       - preprocess: building the source library, thumbnails and pyramid
+         from source images (SourceImageProcessor.build_source_library)
+       - library_load, render: loading a MosaicLibrary and rendering one
+         mosaic in memory
+       - create_mosaic: the whole PhotoMosaic.create_mosaic, saving the mosaic
+
+       Every combination of sources and megapixels is measured. The median
+       of repeat runs is reported with the other runs, and results are saved
+       as JSON that compare_results checks against a stored baseline.
+
+       Attributes:
+           sources: (list) library sizes, in source colors, to match against
+           megapixels: (list) input image sizes, in millions of pixels
+           source_images: (int) source images for preprocessing and the end
+                                to end stages. Default: 200
+           piece_size: (int) the width and height of the regions. Default: 25
+           repeat: (int) runs of each stage. Default: 3
+           seed: (int) seed of the synthetic data. Default: 0
+           progress: (function) called with the name and record of each stage.
+                                Default: None
+    """
+
+    REGION_ENGINES = ("numpy", "sat")
+    MATCH_MODES = ("index", "batched", "lut")
+
+    def __init__(self, sources=(1000,), megapixels=(1,), source_images=200, piece_size=25,
+                 repeat=3, seed=0, progress=None):
+        """Initializes BenchmarkSuite with the sizes to measure."""
+        if not sources or not megapixels or min(sources) < 1 or min(megapixels) <= 0:
+            raise ValueError("Error. Need at least one library size and input image size.")
+        if source_images < 1:
+            raise ValueError("Error. Need at least one source image.")
+        self.sources = list(sources)
+        self.megapixels = list(megapixels)
+        self.source_images = source_images
+        self.piece_size = piece_size
+        self.repeat = repeat
+        self.seed = seed
+        self.progress = progress
+        self.benchmarks = {}
+
+    @property
+    def config(self):
+        return {"sources": self.sources, "megapixels": self.megapixels,
+                "source_images": self.source_images, "piece_size": self.piece_size,
+                "repeat": self.repeat, "seed": self.seed}
+
+    def record(self, name, seconds, items=None, unit=None):
+        """Keeps the timings of a stage.
+
+           Args:
+               name: (string) the stage, with its sizes
+               seconds: (list) seconds of each run
+               items: (int) Optional. Items handled per run, e.g. regions
+               unit: (string) Optional. What the items are
+        """
+
+        median = statistics.median(seconds)
+        result = {"seconds": median, "min_seconds": min(seconds), "runs": seconds}
+        if items:
+            result.update({"items": items, "unit": unit,
+                           "items_per_second": items / median if median else float("inf")})
+        self.benchmarks[name] = result
+        if self.progress:
+            self.progress(name, result)
+
+    def run(self):
+        """Runs every stage in a temporary directory.
+
+           Returns:
+               (dict) the environment, the config and the timings of each stage
+        """
+
+        self.benchmarks = {}
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                os.makedirs("img_sets/img_jsons")
+                photo_mosaics = {}
+                for megapixels in self.megapixels:
+                    input_name = f"input_{megapixels}mp.png"
+                    synthetic_image(megapixels, self.seed).save(input_name)
+                    photo_mosaics[megapixels] = self.run_region_stats(input_name, megapixels)
+                for sources in self.sources:
+                    self.run_matching(photo_mosaics, sources)
+                self.run_end_to_end()
+            finally:
+                os.chdir(cwd)
+        return {"version": RESULTS_VERSION, "environment": environment(), "config": self.config,
+                "benchmarks": self.benchmarks}
+
+    def photo_mosaic(self, filename, **kwargs):
+        return PhotoMosaic(filename=filename, directory="sources", piece_width=self.piece_size,
+                           piece_height=self.piece_size, **kwargs)
+
+    def run_region_stats(self, filename, megapixels):
+        """Times the average colors of the regions, per region engine.
+
+           Returns:
+               (PhotoMosaic) the mosaic of the input image, for matching
+        """
+
+        photo_mosaic = None
+        for engine in self.REGION_ENGINES:
+            photo_mosaic = self.photo_mosaic(filename, region_engine=engine)
+
+            def region_stats():
+                photo_mosaic._summed_area_table = None
+                photo_mosaic.get_avg_color_for_regions()
+
+            self.record(f"region_stats/{engine}/mp={megapixels}", time_call(region_stats, self.repeat),
+                        len(photo_mosaic.regions_with_colors), "regions")
+        return photo_mosaic
+
+    def run_matching(self, photo_mosaics, sources):
+        """Times building the index and LUT of a library and matching the
+           regions of each input image against it, per match mode.
+
+           Args:
+               photo_mosaics: (dict) PhotoMosaic of each input size
+               sources: (int) number of source colors in the library
+        """
+
+        colors = synthetic_colors(sources, self.seed)
+        self.record(f"index_build/sources={sources}", time_call(lambda: ColorIndex(colors), self.repeat),
+                    sources, "sources")
+        self.record(f"lut_build/sources={sources}", time_call(lambda: build_table(colors), self.repeat),
+                    sources, "sources")
+
+        color_index = ColorIndex(colors)
+        color_lut = ColorLUT.build(f"sources_{sources}.lut", colors)
+        for megapixels, photo_mosaic in photo_mosaics.items():
+            for mode in self.MATCH_MODES:
+                photo_mosaic.match_mode = mode
+                self.record(f"match/{mode}/sources={sources}/mp={megapixels}",
+                            time_call(lambda: photo_mosaic.match_regions(colors, color_lut, color_index),
+                                      self.repeat), len(photo_mosaic.regions_with_colors), "regions")
+            photo_mosaic.match_mode = "index"
+
+    def run_end_to_end(self):
+        """Times preprocessing the source images, loading the library,
+           rendering in memory and create_mosaic, for each input size."""
+
+        write_source_images("sources", self.source_images, seed=self.seed)
+        s_img_p = SourceImageProcessor("sources")
+        s_img_p.create_img_subdirs()
+
+        def preprocess():
+            s_img_p.build_source_library(progress=None)
+
+        self.record(f"preprocess/images={self.source_images}", time_call(preprocess, self.repeat),
+                    self.source_images, "images")
+
+        load = time_call(lambda: MosaicLibrary("sources", self.piece_size, self.piece_size), self.repeat)
+        self.record(f"library_load/images={self.source_images}", load)
+        mosaic_library = MosaicLibrary("sources", self.piece_size, self.piece_size)
+        for megapixels in self.megapixels:
+            input_name = f"input_{megapixels}mp.png"
+            regions = len(self.photo_mosaic(input_name).regions_with_colors)
+            self.record(f"render/mp={megapixels}", time_call(lambda: mosaic_library.render(input_name),
+                                                             self.repeat), regions, "regions")
+            self.record(f"create_mosaic/mp={megapixels}",
+                        time_call(lambda: self.photo_mosaic(input_name).create_mosaic("mosaic.png"),
+                                  self.repeat), regions, "regions")
+
+
+def compare_results(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Compares the median time of each stage with a baseline.
+
+       Args:
+           results: (dict) results of BenchmarkSuite.run
+           baseline: (dict) earlier results
+           threshold: (float) share by which a stage may slow down before it
+                              is a regression. Default: 0.25
+
+       Returns:
+           (list) (name, baseline seconds, seconds, ratio, status) of every
+           stage, where status is "regression", "improvement", "ok", "new"
+           or "missing"
+    """
+
+    current, previous = results["benchmarks"], baseline["benchmarks"]
+    comparison = []
+    for name in list(previous) + [name for name in current if name not in previous]:
+        if name not in current:
+            comparison.append((name, previous[name]["seconds"], None, None, "missing"))
+            continue
+        if name not in previous:
+            comparison.append((name, None, current[name]["seconds"], None, "new"))
+            continue
+        before, after = previous[name]["seconds"], current[name]["seconds"]
+        ratio = after / before if before else float("inf")
+        if ratio > 1 + threshold:
+            status = "regression"
+        elif ratio < 1 / (1 + threshold):
+            status = "improvement"
+        else:
+            status = "ok"
+        comparison.append((name, before, after, ratio, status))
+    return comparison
+
+
+def print_record(name, record):
+    """Prints the timings of one stage."""
+    rate = f", {record['items_per_second']:,.0f} {record['unit']}/s" if "items" in record else ""
+    print(f"{name:<45} {record['seconds']:.4f}s (min {record['min_seconds']:.4f}s){rate}")
+
+
+def print_comparison(comparison, threshold=DEFAULT_THRESHOLD):
+    """Prints the comparison with the baseline and returns the number of regressions."""
+    print(f"Compared with the baseline (threshold {threshold:.0%}):")
+    for name, before, after, ratio, status in comparison:
+        if ratio is None:
+            print(f"{name:<45} {status}")
+        else:
+            print(f"{name:<45} {before:.4f}s -> {after:.4f}s ({ratio:.2f}x) {status}")
+    return sum(status == "regression" for *_, status in comparison)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times the stages of making a mosaic on synthetic data")
+    parser.add_argument("--sources", help="enter the library sizes in source colors", type=int,
+                        nargs="+", default=[1000])
+    parser.add_argument("--megapixels", help="enter the input image sizes in megapixels", type=float,
+                        nargs="+", default=[1])
+    parser.add_argument("--source-images", help="enter the number of source images to preprocess",
+                        type=int, default=200)
+    parser.add_argument("--piece-size", help="enter the size of the mosaic pieces", type=int, default=25)
+    parser.add_argument("--repeat", help="enter the runs of each stage", type=int, default=3)
+    parser.add_argument("--seed", help="enter the seed of the synthetic data", type=int, default=0)
+    parser.add_argument("--output", help="enter the JSON file the results are saved to", type=str,
+                        default="benchmark_results.json")
+    parser.add_argument("--baseline", help="enter a results JSON file to compare against", type=str)
+    parser.add_argument("--threshold", help="enter the slowdown share counted as a regression",
+                        type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    suite = BenchmarkSuite(args.sources, args.megapixels, args.source_images, args.piece_size,
+                           args.repeat, args.seed, progress=print_record)
+    results = suite.run()
+    with open(args.output, "w") as out:
+        json.dump(results, out, indent=2)
+    print(f"Saved the results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get("config") != results["config"]:
+            print("The baseline was run with a different config; only matching stages are compared.")
+        if print_comparison(compare_results(results, baseline, args.threshold), args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
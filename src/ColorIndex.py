@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+"""In this script, a spatial index is built over the source image colors."""
+
+import threading
+import numpy as np
+
+
+class ColorIndex(object):
+    """ColorIndex is a KD-tree over the average colors of the source images.
+       It is built once per source library and answers exact nearest
+       neighbour queries, so the cost of matching an input region grows
+       logarithmically with the number of source images instead of linearly.
+
+       The tree is stored in flat lists. Each node covers a contiguous range
+       of the colors (sorted so that every subtree is contiguous) and is
+       split on the dimension with the largest spread at the median value.
+       Nodes with leaf_size colors or fewer are leaves and are scanned
+       directly.
+
+       Every query is counted: a query answered from the first leaf it
+       reaches is a leaf hit, while one that has to scan further leaves
+       because a closer color may lie across a split is a backtrack. The
+       counters are updated under a lock, so one index can be queried from
+       several threads at once.
+
+       Attributes:
+           colors: (numpy.ndarray) (n, dims) array of the source image colors
+           leaf_size: (int) maximum number of colors kept in a leaf. Default: 16
+           queries: (int) number of queries answered
+           leaf_hits: (int) number of queries that scanned a single leaf
+           backtracks: (int) number of queries that scanned more than one leaf
+           leaves_scanned: (int) number of leaves scanned by all queries
+    """
+
+    def __init__(self, colors, leaf_size=16):
+        """Initializes ColorIndex with the colors and builds the tree."""
+        self.colors = np.asarray(colors, dtype=np.float64)
+        if self.colors.ndim != 2 or not len(self.colors):
+            raise ValueError("Error. ColorIndex needs a non-empty (n, dims) array of colors.")
+        self.leaf_size = max(1, int(leaf_size))
+        self.queries = 0
+        self.leaf_hits = 0
+        self.backtracks = 0
+        self.leaves_scanned = 0
+        self._lock = threading.Lock()
+
+        self._order = np.arange(len(self.colors))
+        self._starts, self._ends = [], []
+        self._split_dims, self._split_values = [], []
+        self._lefts, self._rights = [], []
+        self._build()
+        self._sorted_colors = self.colors[self._order]
+
+    @classmethod
+    def from_json_data(cls, json_data, leaf_size=16):
+        """Builds the index from the {thumbnail name: color} JSON dictionary.
+
+           Returns:
+               names: (list) thumbnail names, in the same order as the index
+               index: (ColorIndex) the index
+        """
+
+        names = list(json_data.keys())
+        return names, cls([json_data[name] for name in names], leaf_size)
+
+    def __len__(self):
+        return len(self.colors)
+
+    def _new_node(self, start, end):
+        self._starts.append(start)
+        self._ends.append(end)
+        self._split_dims.append(-1)
+        self._split_values.append(0.0)
+        self._lefts.append(-1)
+        self._rights.append(-1)
+        return len(self._starts) - 1
+
+    def _build(self):
+        """Builds the tree iteratively, partitioning self._order in place."""
+
+        stack = [self._new_node(0, len(self.colors))]
+        while stack:
+            node = stack.pop()
+            start, end = self._starts[node], self._ends[node]
+            if end - start <= self.leaf_size:
+                continue
+            members = self.colors[self._order[start:end]]
+            spread = members.max(axis=0) - members.min(axis=0)
+            dim = int(np.argmax(spread))
+            if spread[dim] == 0:
+                continue
+
+            mid = (end - start) // 2
+            partition = np.argpartition(members[:, dim], mid)
+            self._order[start:end] = self._order[start:end][partition]
+            self._split_dims[node] = dim
+            self._split_values[node] = float(self.colors[self._order[start + mid], dim])
+
+            self._lefts[node] = self._new_node(start, start + mid)
+            self._rights[node] = self._new_node(start + mid, end)
+            stack.extend((self._lefts[node], self._rights[node]))
+
+    def query(self, color):
+        """Finds the source color closest to the given color.
+
+           Args:
+               color: (tuple) the color to match, e.g. (r, g, b)
+
+           Returns:
+               (int, float) position of the closest source color and its
+               Euclidean distance
+        """
+
+        position, distance, leaves = self._search(color)
+        self._count([leaves])
+        return position, distance
+
+    def _search(self, color):
+        """Searches the tree for the closest source color.
+
+           Returns:
+               (int, float, int) position of the closest source color, its
+               Euclidean distance and the number of leaves scanned
+        """
+
+        point = np.asarray(color, dtype=np.float64)
+        coords = point.tolist()
+        best_dist, best_pos = float("inf"), -1
+        leaves = 0
+        stack = [(0, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if bound >= best_dist:
+                continue
+            dim = self._split_dims[node]
+            if dim < 0:
+                leaves += 1
+                start, end = self._starts[node], self._ends[node]
+                dists = ((self._sorted_colors[start:end] - point) ** 2).sum(axis=1)
+                nearest = int(np.argmin(dists))
+                if dists[nearest] < best_dist:
+                    best_dist, best_pos = float(dists[nearest]), start + nearest
+                continue
+
+            diff = coords[dim] - self._split_values[node]
+            near, far = (self._lefts[node], self._rights[node]) if diff < 0 \
+                else (self._rights[node], self._lefts[node])
+
+            # The far child is pushed first so the near child is searched first
+            stack.append((far, max(bound, diff * diff)))
+            stack.append((near, bound))
+        return int(self._order[best_pos]), best_dist ** 0.5, leaves
+
+    def _count(self, leaves):
+        """Adds queries that scanned the given numbers of leaves to the counters.
+
+           Returns:
+               (dict) queries, leaf_hits, backtracks and leaves_scanned of
+               these queries
+        """
+
+        backtracks = sum(1 for scanned in leaves if scanned > 1)
+        counts = {"queries": len(leaves), "leaf_hits": len(leaves) - backtracks,
+                  "backtracks": backtracks, "leaves_scanned": sum(leaves)}
+        with self._lock:
+            self.queries += counts["queries"]
+            self.leaf_hits += counts["leaf_hits"]
+            self.backtracks += counts["backtracks"]
+            self.leaves_scanned += counts["leaves_scanned"]
+        return counts
+
+    def query_many(self, colors, stats=None):
+        """Finds the closest source color for each of the given colors.
+
+           Args:
+               colors: (numpy.ndarray) (m, dims) array of colors to match
+               stats: (dict) Optional. Receives the queries, leaf_hits,
+                             backtracks and leaves_scanned of these queries
+                             alone, whatever other threads query meanwhile
+
+           Returns:
+               (numpy.ndarray) int64 array of the m closest source positions
+        """
+
+        colors = np.asarray(colors, dtype=np.float64)
+        matches = np.empty(len(colors), dtype=np.int64)
+        leaves = []
+        for i, color in enumerate(colors):
+            matches[i], _, scanned = self._search(color)
+            leaves.append(scanned)
+        counts = self._count(leaves)
+        if stats is not None:
+            stats.update(counts)
+        return matches
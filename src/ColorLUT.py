@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+"""In this script, the closest source image for every quantized color is precomputed."""
+
+import os
+import time
+import struct
+
+import numpy as np
+
+from utils.matching import batched_nearest, DEFAULT_MEMORY_BUDGET
+
+MAGIC = b"PMLUT\x00\x00\x00"
+VERSION = 1
+
+# magic, version, bins, library count, build seconds, max error, mean error, data offset
+HEADER = struct.Struct("<8sIIQdddQ")
+DATA_OFFSET = 64
+INDEX_DTYPE = np.dtype("<u4")
+
+# random colors compared against exact matching to measure the error
+ERROR_SAMPLES = 20000
+
+
+def lut_path_for(library_path, bins):
+    """Returns the LUT file for a library file and number of bins per channel."""
+    return f"{os.path.splitext(library_path)[0]}_lut{bins}.lut"
+
+
+def bin_centres(bins):
+    """Returns the (bins^3, 3) RGB centres of the bins, in LUT order."""
+    centres = (np.arange(bins, dtype=np.float64) + 0.5) * (256 / bins)
+    return np.stack(np.meshgrid(centres, centres, centres, indexing="ij"), axis=-1).reshape(-1, 3)
+
+
+def error_bound(bins):
+    """Returns the largest extra distance a LUT match can have over the exact
+       match. A color is at most half a bin diagonal from its bin centre, and
+       the match of the centre is exact, so by the triangle inequality the
+       extra distance is at most one bin diagonal."""
+    return np.sqrt(3) * 256 / bins
+
+
+def build_table(source_colors, bins=32, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """Matches the centre of every bin to its closest source color.
+
+       Args:
+           source_colors: (numpy.ndarray) (n, 3) array of source colors
+           bins: (int) number of bins per RGB channel. Default: 32
+           memory_budget: (int) bytes for one chunk of batched distances
+
+       Returns:
+           (numpy.ndarray) (bins, bins, bins) uint32 source image indices
+    """
+
+    if not 1 <= bins <= 256:
+        raise ValueError("Error. A LUT needs between 1 and 256 bins per channel.")
+    source_colors = np.asarray(source_colors)
+    if source_colors.ndim != 2 or source_colors.shape[1] != 3:
+        raise ValueError("Error. A LUT can only be built from RGB source colors.")
+    matches = batched_nearest(bin_centres(bins), source_colors, memory_budget)
+    return matches.astype(INDEX_DTYPE).reshape(bins, bins, bins)
+
+
+def lookup(table, colors):
+    """Looks up the source image index for each color in a LUT table.
+
+       Args:
+           table: (numpy.ndarray) (bins, bins, bins) source image indices
+           colors: (numpy.ndarray) (m, 3) RGB colors in [0, 255]
+
+       Returns:
+           (numpy.ndarray) int64 array of the m source image indices
+    """
+
+    bins = table.shape[0]
+    cells = np.clip((np.asarray(colors, dtype=np.float64) * (bins / 256)).astype(np.int64), 0, bins - 1)
+    return table[cells[:, 0], cells[:, 1], cells[:, 2]].astype(np.int64)
+
+
+def measure_error(table, source_colors, samples=ERROR_SAMPLES, seed=0):
+    """Compares LUT matching against exact matching on random colors.
+
+       Args:
+           table: (numpy.ndarray) (bins, bins, bins) source image indices
+           source_colors: (numpy.ndarray) (n, 3) array of source colors
+           samples: (int) number of random colors. Default: 20000
+           seed: (int) seed of the random colors. Default: 0
+
+       Returns:
+           (float, float) the largest and the mean extra distance of the LUT
+           match over the exact match
+    """
+
+    sources = np.asarray(source_colors, dtype=np.float64)
+    colors = np.random.RandomState(seed).uniform(0, 256, (samples, 3))
+    lut_dists = np.linalg.norm(colors - sources[lookup(table, colors)], axis=1)
+    exact_dists = np.linalg.norm(colors - sources[batched_nearest(colors, sources)], axis=1)
+    errors = lut_dists - exact_dists
+    return float(errors.max()), float(errors.mean())
+
+
+class ColorLUT(object):
+    """ColorLUT opens a LUT file holding the closest source image of a library
+       for every bin of a quantized RGB color cube, e.g. 32x32x32 bins. The
+       table is built once per library, so matching a region color is a
+       single array lookup instead of a search of the library. A color is
+       matched to the closest source image of its bin centre, which can
+       differ from its exact match by at most error_bound(bins); the error
+       measured against exact matching is stored with the table.
+
+       Attributes:
+           path: (string) the LUT file
+           bins: (int) number of bins per RGB channel
+           count: (int) number of source images in the library it was built for
+           build_seconds: (float) time taken to build the table
+           max_error: (float) largest measured extra distance over exact matching
+           mean_error: (float) mean measured extra distance over exact matching
+           table: (numpy.ndarray) memory-mapped (bins, bins, bins) uint32 indices
+    """
+
+    def __init__(self, path):
+        """Initializes ColorLUT by memory-mapping the LUT file."""
+        self.path = path
+        data = np.memmap(path, dtype=np.uint8, mode="r")
+        if len(data) < DATA_OFFSET:
+            raise ValueError(f"Error. {path} is not a color LUT.")
+        magic, version, self.bins, self.count, self.build_seconds, self.max_error, \
+            self.mean_error, data_at = HEADER.unpack(data[:HEADER.size].tobytes())
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Error. {path} is not a version {VERSION} color LUT.")
+        table_end = data_at + self.bins ** 3 * INDEX_DTYPE.itemsize
+        self.table = data[data_at:table_end].view(INDEX_DTYPE).reshape(self.bins, self.bins, self.bins)
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+
+    def lookup(self, colors):
+        """Returns the source image index for each (m, 3) RGB color."""
+        return lookup(self.table, colors)
+
+    def report(self):
+        """Describes the build time, size and error of the LUT."""
+        return (f"{self.bins}^3 bins for {self.count} source images, {self.nbytes / 2 ** 20:.1f} MiB, "
+                f"built in {self.build_seconds:.2f}s, error over exact matching: "
+                f"max {self.max_error:.2f} (bound {error_bound(self.bins):.2f}), "
+                f"mean {self.mean_error:.3f}")
+
+    @staticmethod
+    def build(path, source_colors, bins=32, memory_budget=DEFAULT_MEMORY_BUDGET):
+        """Builds a LUT file for the colors of a library.
+
+           Args:
+               path: (string) the LUT file
+               source_colors: (numpy.ndarray) (n, 3) array of source colors
+               bins: (int) number of bins per RGB channel. Default: 32
+               memory_budget: (int) bytes for one chunk of batched distances
+
+           Returns:
+               (ColorLUT) the LUT
+        """
+
+        start = time.perf_counter()
+        table = build_table(source_colors, bins, memory_budget)
+        build_seconds = time.perf_counter() - start
+        max_error, mean_error = measure_error(table, source_colors)
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as out:
+            out.write(HEADER.pack(MAGIC, VERSION, bins, len(source_colors), build_seconds,
+                                  max_error, mean_error, DATA_OFFSET))
+            out.write(b"\x00" * (DATA_OFFSET - HEADER.size))
+            out.write(table.tobytes())
+        os.replace(tmp_path, path)
+        return ColorLUT(path)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""In this script, a reduced-dimension index is built over multi-cell source descriptors."""
+
+import numpy as np
+
+from ColorIndex import ColorIndex
+
+# dimensions the descriptors are projected onto
+DEFAULT_COMPONENTS = 6
+
+
+class DescriptorIndex(object):
+    """DescriptorIndex answers nearest neighbour queries over descriptors
+       with more values than an RGB color, e.g. the 12 or 27 sub-cell colors
+       of cell_descriptors. A KD-tree prunes poorly in that many dimensions,
+       so the descriptors are first projected onto their principal components
+       (the directions in which the source descriptors vary most) and a
+       ColorIndex is built over the projections. The neighbouring sub-cells
+       of a thumbnail are strongly correlated, so a few components keep most
+       of the variance and a query costs about as much as an RGB query. The
+       match is exact in the projected space and approximate in the full one;
+       explained_variance tells how much of the spread the projection keeps.
+
+       Attributes:
+           descriptors: (numpy.ndarray) (n, dims) array of the source descriptors
+           components: (int) dimensions of the projection. Default: 6
+           mean: (numpy.ndarray) (dims) mean source descriptor
+           basis: (numpy.ndarray) (dims, components) principal directions
+           explained_variance: (float) share of the descriptor variance kept
+                                       by the projection
+           index: (ColorIndex) KD-tree over the projected source descriptors
+    """
+
+    def __init__(self, descriptors, components=DEFAULT_COMPONENTS, leaf_size=16):
+        """Initializes DescriptorIndex with the descriptors, fits the
+           projection and builds the index."""
+        self.descriptors = np.asarray(descriptors, dtype=np.float64)
+        if self.descriptors.ndim != 2 or not len(self.descriptors):
+            raise ValueError("Error. DescriptorIndex needs a non-empty (n, dims) array of descriptors.")
+        if components < 1:
+            raise ValueError("Error. A projection needs at least one component.")
+        self.components = min(int(components), self.descriptors.shape[1])
+
+        self.mean = self.descriptors.mean(axis=0)
+        centred = self.descriptors - self.mean
+        _, singular_values, directions = np.linalg.svd(centred, full_matrices=False)
+        self.basis = directions[:self.components].T
+        variance = singular_values ** 2
+        self.explained_variance = float(variance[:self.components].sum() / variance.sum()) \
+            if variance.sum() else 1.0
+        self.index = ColorIndex(centred @ self.basis, leaf_size)
+
+    def __len__(self):
+        return len(self.descriptors)
+
+    def project(self, descriptors):
+        """Projects descriptors onto the principal components.
+
+           Args:
+               descriptors: (numpy.ndarray) (m, dims) array of descriptors
+
+           Returns:
+               (numpy.ndarray) (m, components) projected descriptors
+        """
+
+        return (np.asarray(descriptors, dtype=np.float64) - self.mean) @ self.basis
+
+    def query_many(self, descriptors, stats=None):
+        """Finds the closest source descriptor for each of the given descriptors.
+
+           Args:
+               descriptors: (numpy.ndarray) (m, dims) array of descriptors to match
+               stats: (dict) Optional. Receives the query counts of the
+                             index, see ColorIndex.query_many
+
+           Returns:
+               (numpy.ndarray) int64 array of the m closest source positions
+        """
+
+        return self.index.query_many(self.project(descriptors), stats)
+
+    def report(self):
+        """Returns the size of the projection as a sentence."""
+        return (f"Descriptor index of {len(self)} x {self.descriptors.shape[1]} values projected onto "
+                f"{self.components} components, keeping {self.explained_variance:.1%} of the variance.")
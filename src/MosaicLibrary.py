@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""In this script, mosaics are rendered in memory from a preloaded source library."""
+
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+from ColorIndex import ColorIndex
+from DescriptorIndex import DescriptorIndex
+from Photomosaic import PhotoMosaic, MATCH_MODES
+from SourceImageProcessor import SourceImageProcessor
+from utils.profiling import Profiler
+
+
+def encode_image(image, format="png", **params):
+    """Encodes an image in memory.
+
+       Args:
+           image: (PIL.image) the image
+           format: (string) Optional. PIL format name, e.g. "png" or "jpeg".
+                            Default: "png"
+           params: Optional. Encoder options passed to PIL, e.g. quality=90
+
+       Returns:
+           (bytes) the encoded image
+    """
+
+    buffer = io.BytesIO()
+    image.save(buffer, format, **params)
+    return buffer.getvalue()
+
+
+class MosaicLibrary(object):
+    """MosaicLibrary holds a source library loaded once: the library, its
+       thumbnails at the piece size and its color index (or color LUT), and
+       renders mosaics in memory from it. Input images can be a file name,
+       a PIL image, a uint8 array or the encoded bytes, and the mosaic is
+       returned as a PIL image or as encoded bytes, so nothing is written to
+       disk and failures are raised rather than exiting. Rendering only reads
+       the loaded library, apart from the query counters of the color index,
+       which are updated under a lock, so one MosaicLibrary can render from
+       several threads at once.
+
+       Attributes:
+           directory: (string) image directory
+           piece_width: (int) the width of the box region. Default: 25
+           piece_height: (int) the height of the box region. Default: 25
+           match_mode: (string) "index", "batched" or "lut". Default: "index"
+           lut_bins: (int) bins per RGB channel of the color LUT. Default: 32
+           cells: (int) sub-cells along each side of the region and thumbnail
+                        descriptors. Default: 1, the average color
+           default_img_dir: (string) Optional. Describes the default image
+                                     directory. Default: img_sets
+           resident: (boolean) Copies the thumbnail atlas into memory instead
+                               of paging it in from the file. Default: False
+           library: (SourceLibrary) the source library
+           source_colors: (numpy.ndarray) the colors, or the descriptors with
+                                          cells above 1, matched against
+           thumbnails: (numpy.ndarray) (count, piece_height, piece_width, 3)
+                                       thumbnails of the library
+           load_seconds: (float) time spent loading the library and index
+    """
+
+    def __init__(self, directory, piece_width=25, piece_height=25, match_mode="index", lut_bins=32,
+                 default_img_dir="img_sets", resident=False, cells=1):
+        """Initializes MosaicLibrary and loads the source library, thumbnails
+           and color index or color LUT."""
+        if match_mode not in MATCH_MODES:
+            raise ValueError(f"Error. Match mode must be one of {MATCH_MODES}.")
+        if cells > 1 and match_mode == "lut":
+            raise ValueError("Error. Multi-cell descriptors need the index or batched match mode.")
+        self.directory = directory
+        self.piece_width = piece_width
+        self.piece_height = piece_height
+        self.match_mode = match_mode
+        self.lut_bins = lut_bins
+        self.default_img_dir = default_img_dir
+        self.resident = resident
+        self.cells = cells
+
+        started = time.perf_counter()
+        self.s_img_p = SourceImageProcessor(directory, default_img_dir=default_img_dir)
+        self.library = self.s_img_p.read_source_library()
+        atlas = self.s_img_p.read_thumbnail_atlas(self.library, (piece_width, piece_height))
+        self.thumbnails = np.array(atlas.thumbnails) if resident else atlas.thumbnails
+        if cells > 1:
+            self.source_colors = self.s_img_p.read_descriptor_library(self.library, cells,
+                                                                      (piece_width, piece_height)).colors
+        else:
+            self.source_colors = self.library.colors
+        if resident:
+            self.source_colors = np.array(self.source_colors)
+        self.color_index = None
+        if match_mode == "index":
+            self.color_index = ColorIndex(self.source_colors) if cells == 1 else \
+                DescriptorIndex(self.source_colors)
+        self.color_lut = self.s_img_p.read_color_lut(self.library, lut_bins) if match_mode == "lut" else None
+        self.load_seconds = time.perf_counter() - started
+
+    @property
+    def nbytes(self):
+        """Approximates the memory held by the library, thumbnails and LUT."""
+        lut_bytes = self.color_lut.nbytes if self.color_lut is not None else 0
+        return self.thumbnails.nbytes + self.source_colors.nbytes + lut_bytes
+
+    def render(self, image, format=None, profile=None, **params):
+        """Renders the mosaic of an input image.
+
+           Args:
+               image: (string, PIL.image, numpy.ndarray or bytes) the input
+                      image file name, decoded image, (height, width, 3)
+                      uint8 array or encoded image
+               format: (string) Optional. Encodes the mosaic in this PIL
+                                format, e.g. "png". Default: None
+               profile: (string or Profiler) Optional. Profiles the render
+                                             and writes the profile files to
+                                             this prefix, tagged with the
+                                             input, library and piece sizes.
+                                             Default: None
+               params: Optional. Encoder options, see encode_image
+
+           Returns:
+               (PIL.image or bytes) the mosaic, encoded if a format was given
+
+           Raises:
+               ValueError, OSError: if the input image cannot be read
+        """
+
+        if profile is not None:
+            profiler = Profiler(profile) if isinstance(profile, str) else profile
+            with profiler:
+                photo_mosaic, mosaic = self._render(image, format, **params)
+                profiler.tag(**photo_mosaic.profile_tags())
+            return mosaic
+        return self._render(image, format, **params)[1]
+
+    def _render(self, image, format=None, **params):
+        photo_mosaic = PhotoMosaic(filename=image, directory=self.directory,
+                                   piece_width=self.piece_width, piece_height=self.piece_height,
+                                   match_mode=self.match_mode, lut_bins=self.lut_bins, cells=self.cells)
+        photo_mosaic.metrics.labels.update(library=self.s_img_p.img_dir, library_size=len(self.library))
+        matches = photo_mosaic.match_regions(self.source_colors, self.color_lut, self.color_index)
+        mosaic = photo_mosaic.assemble_mosaic(matches, self.fetch_thumbnail)
+        return photo_mosaic, mosaic if format is None else encode_image(mosaic, format, **params)
+
+    def regions(self, mosaic):
+        """Returns the number of regions of a mosaic rendered by this library."""
+        width, height = mosaic.size
+        return (width // self.piece_width) * (height // self.piece_height)
+
+    def fetch_thumbnail(self, match, size):
+        """Returns the thumbnail of a library entry, see PhotoMosaic.thumbnail_fetcher."""
+        return Image.fromarray(np.ascontiguousarray(self.thumbnails[match]))
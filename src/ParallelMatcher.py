@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+"""In this script, the regions of a mosaic are matched by several processes through shared memory."""
+
+import os
+import math
+import threading
+import multiprocessing
+import numpy as np
+
+from collections import Counter
+from multiprocessing import shared_memory
+
+from ColorIndex import ColorIndex
+from DescriptorIndex import DescriptorIndex
+from utils.matching import batched_nearest, DEFAULT_MEMORY_BUDGET
+
+PARALLEL_MATCH_MODES = ("index", "batched")
+# bands queued for each worker when band_rows is not given
+BANDS_PER_WORKER = 4
+
+# set in the parent and in each worker process to
+# (region grid, source colors, match grid, color index, memory budget)
+_worker_state = None
+# held by the match setting _worker_state in the parent
+_match_lock = threading.Lock()
+
+
+def build_index(source_colors):
+    """Builds a ColorIndex over average colors, or a DescriptorIndex over
+       multi-cell descriptors."""
+    if source_colors.shape[1] == 3:
+        return ColorIndex(source_colors)
+    return DescriptorIndex(source_colors)
+
+
+class SharedArray(object):
+    """SharedArray is a numpy array stored in a block of shared memory, so
+       several processes read and write it without copying or pickling it.
+       The process that creates the block unlinks it; other processes attach
+       to it by name with spec.
+
+       Attributes:
+           shm: (multiprocessing.shared_memory.SharedMemory) the block
+           array: (numpy.ndarray) the array over the block
+           owner: (boolean) the block was created here and is unlinked on close
+    """
+
+    def __init__(self, shape, dtype, name=None):
+        """Initializes SharedArray, creating a block of shape and dtype or
+           attaching to the block called name."""
+        shape, dtype = tuple(shape), np.dtype(dtype)
+        self.owner = name is None
+        if self.owner:
+            size = max(1, int(np.prod(shape)) * dtype.itemsize)
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf)
+
+    @classmethod
+    def from_array(cls, array):
+        """Creates a block holding a copy of array."""
+        shared = cls(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    @property
+    def spec(self):
+        """(name, shape, dtype) other processes attach with."""
+        return self.shm.name, self.array.shape, self.array.dtype.str
+
+    def close(self):
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _init_worker(specs, memory_budget, use_index):
+    """Attaches a worker process to the shared arrays. Forked workers inherit
+       the arrays and the color index of the parent instead; spawned workers
+       build the index from the shared source colors."""
+    global _worker_state
+    if _worker_state is None:
+        regions, sources, grid = (SharedArray(shape, dtype, name) for name, shape, dtype in specs)
+        index = build_index(sources.array) if use_index else None
+        _worker_state = (regions, sources, grid, index, memory_budget)
+
+
+def _match_band(band):
+    """Matches the regions of the grid rows [start, end) and writes the
+       matches into the shared match grid.
+
+       Returns:
+           (tuple) start row, end row, worker process id, and the leaf hits,
+           backtracks and leaves scanned of the color index
+    """
+
+    start, end = band
+    regions, sources, grid, index, memory_budget = _worker_state
+    block = regions.array[start:end]
+    colors = block.reshape(-1, block.shape[-1])
+    counts = (0, 0, 0)
+    if index is None:
+        matches = batched_nearest(colors, sources.array, memory_budget)
+    else:
+        stats = {}
+        matches = index.query_many(colors, stats)
+        counts = (stats["leaf_hits"], stats["backtracks"], stats["leaves_scanned"])
+    grid.array[start:end] = matches.reshape(block.shape[:2])
+    return (start, end, os.getpid()) + counts
+
+
+class ParallelMatcher(object):
+    """ParallelMatcher matches the regions of a mosaic in several worker
+       processes. The region colors, laid out as a rows x cols grid, the
+       source colors and the grid of matches are placed in shared memory,
+       so the workers read and write them in place: only the row numbers of
+       a band and a few counters pass between processes, never the colors,
+       the matches or the images. The grid is split into bands of band_rows
+       rows and each worker takes the next band from a shared queue as soon
+       as it finishes one, so a worker on bands that match quickly (e.g. the
+       flat sky of a photo, answered from the first leaf of the color index)
+       simply takes more of them. The color index is built once, before the
+       workers are forked, so they share it as well. The workers find the
+       shared arrays through a module global, so matches started from
+       several threads of one process run one after the other.
+
+       Attributes:
+           source_colors: (numpy.ndarray) (n, dims) average colors or
+                                          descriptors of the source images
+           match_mode: (string) "index" or "batched". Default: "index"
+           workers: (int) number of processes matching bands. Default: 2
+           band_rows: (int) grid rows in a band. Default: enough for 4 bands
+                            per worker
+           memory_budget: (int) bytes for one chunk of batched distances.
+                                Default: 64 MiB
+           color_index: (ColorIndex) the color index, or DescriptorIndex, of the
+                                     index match mode. Default: built from
+                                     source_colors
+           bands: (collections.Counter) number of bands each worker process
+                                        matched in the last match
+           leaf_hits: (int) leaf hits of the color index in the last match
+           backtracks: (int) backtracks of the color index in the last match
+           leaves_scanned: (int) leaves scanned by the color index in the last match
+    """
+
+    def __init__(self, source_colors, match_mode="index", workers=2, band_rows=None,
+                 memory_budget=DEFAULT_MEMORY_BUDGET, color_index=None):
+        """Initializes ParallelMatcher with the source colors and builds the
+           color index of the index match mode."""
+        if match_mode not in PARALLEL_MATCH_MODES:
+            raise ValueError(f"Error. Parallel match mode must be one of {PARALLEL_MATCH_MODES}.")
+        if band_rows is not None and band_rows < 1:
+            raise ValueError("Error. A band needs at least one row.")
+        self.source_colors = np.ascontiguousarray(source_colors, dtype=np.float64)
+        if self.source_colors.ndim != 2 or not len(self.source_colors):
+            raise ValueError("Error. There are no source colors to match against.")
+        self.match_mode = match_mode
+        self.workers = max(1, int(workers))
+        self.band_rows = band_rows
+        self.memory_budget = memory_budget
+        if match_mode == "index" and color_index is None:
+            color_index = build_index(self.source_colors)
+        self.color_index = color_index if match_mode == "index" else None
+        self.bands = Counter()
+        self.leaf_hits = 0
+        self.backtracks = 0
+        self.leaves_scanned = 0
+
+    def band_ranges(self, rows):
+        """Splits rows grid rows into [start, end) bands."""
+        band_rows = self.band_rows or max(1, math.ceil(rows / (self.workers * BANDS_PER_WORKER)))
+        return [(start, min(start + band_rows, rows)) for start in range(0, rows, band_rows)]
+
+    def match_grid(self, region_grid):
+        """Finds the closest source color for every region of a grid.
+
+           Args:
+               region_grid: (numpy.ndarray) (rows, cols, dims) region colors
+                                            or descriptors
+
+           Returns:
+               (numpy.ndarray) (rows, cols) int64 grid of matched source positions
+        """
+
+        global _worker_state
+        region_grid = np.asarray(region_grid, dtype=np.float64)
+        if region_grid.ndim != 3 or region_grid.shape[2] != self.source_colors.shape[1]:
+            raise ValueError("Error. Regions must be a (rows, cols, dims) grid with the dims "
+                             "of the source colors.")
+        self.bands = Counter()
+        self.leaf_hits = self.backtracks = self.leaves_scanned = 0
+        bands = self.band_ranges(region_grid.shape[0])
+
+        with _match_lock, SharedArray.from_array(region_grid) as regions, \
+                SharedArray.from_array(self.source_colors) as sources, \
+                SharedArray(region_grid.shape[:2], np.int64) as grid:
+            _worker_state = (regions, sources, grid, self.color_index, self.memory_budget)
+            try:
+                if self.workers == 1 or len(bands) == 1:
+                    self._add_results(map(_match_band, bands))
+                else:
+                    specs = (regions.spec, sources.spec, grid.spec)
+                    with multiprocessing.Pool(min(self.workers, len(bands)), _init_worker,
+                                              (specs, self.memory_budget, self.color_index is not None)) as pool:
+                        self._add_results(pool.imap_unordered(_match_band, bands, chunksize=1))
+                return grid.array.copy()
+            finally:
+                _worker_state = None
+
+    def _add_results(self, results):
+        for start, end, pid, leaf_hits, backtracks, leaves_scanned in results:
+            self.bands[pid] += 1
+            self.leaf_hits += leaf_hits
+            self.backtracks += backtracks
+            self.leaves_scanned += leaves_scanned
+
+    def match(self, region_colors, cols, rows):
+        """Finds the closest source color for every region, given in the
+           column by column order of PhotoMosaic.regions_with_colors.
+
+           Args:
+               region_colors: (numpy.ndarray) (cols * rows, dims) region colors
+                                              or descriptors
+               cols: (int) regions across the mosaic
+               rows: (int) regions down the mosaic
+
+           Returns:
+               (numpy.ndarray) int64 array of the matched source positions, in
+               the order of region_colors
+        """
+
+        region_colors = np.asarray(region_colors, dtype=np.float64)
+        grid = region_colors.reshape(cols, rows, -1).transpose(1, 0, 2)
+        return self.match_grid(grid).T.reshape(-1)
+
+    def report(self):
+        """Returns how the bands were shared between the workers as a sentence."""
+        return (f"{sum(self.bands.values())} bands matched by {len(self.bands)} processes "
+                f"({', '.join(str(count) for count in sorted(self.bands.values(), reverse=True))}).")
@@ -1,16 +1,34 @@
 #!/usr/bin/env python
 """In this script, a mosaic is created based on an input image."""
 
-import sys
+import os
 import math
+import numpy as np
 
 from PIL import Image
 from collections import defaultdict
 
 from BaseImage import BaseImage
+from ColorIndex import ColorIndex
+from ColorLUT import build_table, lookup
+from DescriptorIndex import DescriptorIndex
+from ParallelMatcher import ParallelMatcher
 from SourceImageProcessor import SourceImageProcessor
-from utils.helpers import round_to_nearest_10, Logger
-from utils.validation_util import validate_directory, validate_json_data
+from ThumbnailAtlas import thumbnail_to_array
+from ThumbnailCache import ThumbnailCache
+from ThumbnailPyramid import ThumbnailPyramid
+from utils.assembly import assemble_grid
+from utils.helpers import Logger
+from utils.matching import batched_nearest, DEFAULT_MEMORY_BUDGET
+from utils.metrics import Metrics
+from utils.region_stats import image_to_array, mean_colors_for_grid, grid_boxes, quadtree_boxes, \
+    cell_descriptors, SummedAreaTable
+from utils.validation_util import validate_directory
+
+
+REGION_ENGINES = ("numpy", "sat", "pil")
+MATCH_MODES = ("index", "batched", "lut")
+TILINGS = ("uniform", "adaptive")
 
 
 class PhotoMosaic(BaseImage):
@@ -24,15 +42,46 @@ class PhotoMosaic(BaseImage):
        with one of the source images--which also have a corresponding
        average color--and the squares. To look for the "closest" match for a
        3-valued tuple, the Euclidean distance is implemented. In an effort
-       to optimize runtime, an index is utilized to match an input
-       img color-tuple to see which source images are the closest match.
-       A rough hashing is done where the keys are the color-tuples, and
-       each value in the color-tuple is rounded to the nearest tens digit.
-       The values in this dictionary-index are lists of source images.
-
-       We can then round the current input region color-tuple to the nearest
-       tens digit for R, G, and B and try to index it. If it doesn't exist,
-       then we search all the source images.
+       to optimize runtime, a KD-tree (ColorIndex) is built once over the
+       source image colors and queried for the exact nearest source image
+       of every region, so the matching cost grows logarithmically with the
+       number of source images. Alternatively, the "batched" match mode
+       stacks all region colors and all source colors into arrays and finds
+       every match at once, in chunks bounded by a memory budget.
+
+       The average colors for the regions can be calculated with one of three
+       engines. The "numpy" engine converts the trimmed base image into an
+       array once and averages every box with a single reshape, weighting
+       each pixel equally. The "sat" engine builds a summed-area table of the
+       input image once, after which the average color of any box is found
+       in constant time; get_avg_color_for_grid reuses it for other piece
+       sizes and grid offsets. The "pil" engine crops every box and averages
+       its distinct colors with BaseImage.get_avg_color.
+
+       With "adaptive" tiling, the input image is instead divided by a
+       quadtree: it starts from tiles of piece size * 2^quadtree_levels and
+       splits every tile whose color variance exceeds variance_threshold,
+       down to the piece size. Flat areas are then covered by a few large
+       thumbnails, so far fewer regions are matched and pasted.
+
+       With cells above 1, the regions and source thumbnails are described
+       by the average colors of a cells x cells grid of sub-cells instead of
+       one average color, so a match also follows the structure inside a
+       region. The "index" match mode then queries a DescriptorIndex, which
+       searches a few principal components of the descriptors, and the
+       "batched" match mode compares the full descriptors.
+
+       With workers above 1, the regions of a uniform tiling are matched by
+       that many processes with ParallelMatcher: the region colors, source
+       colors and matches are kept in shared memory and every process takes
+       the next band of grid rows as soon as it is done with one. The "lut"
+       match mode is a single table lookup and always runs in one process.
+
+       Every stage is timed and counted in metrics: decoding the input,
+       the region statistics, loading the library, matching (with the leaf
+       hits and backtracks of the color index), assembly and saving, along
+       with the regions, thumbnail opens and bytes read and written. Pass
+       the same Metrics to several mosaics to add up their runs.
 
        Attributes:
            filename: (string) file name: Default None.
@@ -40,30 +89,146 @@ class PhotoMosaic(BaseImage):
            piece_width: (int) the width of the box region
            piece_height: (int) the height of the box region
            palette: (PIL.image type)
+           region_engine: (string) "numpy", "sat" or "pil". Default: "numpy"
+           match_mode: (string) "index", "batched" or "lut". Default: "index"
+           lut_bins: (int) bins per RGB channel of the color LUT. Default: 32
+           memory_budget: (int) bytes for one chunk of batched distances.
+                                Default: 64 MiB
+           thumbnail_cache: (ThumbnailCache) decoded source thumbnails. Can be
+                                             shared between mosaics. Default: None
+           use_atlas: (boolean) Reads the thumbnails from the thumbnail atlas
+                                of each region size instead of the thumbnail
+                                pyramid or files. Default: False
+           tiling: (string) "uniform" or "adaptive". Default: "uniform"
+           quadtree_levels: (int) times an adaptive tile can be split. Default: 2
+           variance_threshold: (float) color variance above which an adaptive
+                                       tile is split. Default: 400
+           cells: (int) sub-cells along each side of a region descriptor.
+                        Default: 1, the average color
+           workers: (int) processes matching the regions. Default: 1
+           metrics: (Metrics) timers and counters of the stages. Default: a new one
            debug: (boolean) Starts logger as a debugger tool. Default: False
 
     """
 
     @validate_directory
     def __init__(self, filename=None, directory=None, piece_width=25,
-                 piece_height=25, debug=False):
+                 piece_height=25, region_engine="numpy", match_mode="index", lut_bins=32,
+                 memory_budget=DEFAULT_MEMORY_BUDGET, thumbnail_cache=None,
+                 use_atlas=False, tiling="uniform", quadtree_levels=2, variance_threshold=400,
+                 cells=1, workers=1, metrics=None, debug=False):
         """Initializes PhotoMosaic with filename, directory, piece_width size
            and piece_height size."""
-        super().__init__(filename)
+        self.metrics = metrics if metrics is not None else Metrics()
+        with self.metrics.timer("decode_input"):
+            super().__init__(filename)
+        if isinstance(filename, str) and os.path.isfile(filename):
+            self.metrics.count("bytes_read", os.path.getsize(filename))
         self.directory = directory
 
         self.piece_width = piece_width
         self.piece_height = piece_height
+        if region_engine not in REGION_ENGINES:
+            raise ValueError(f"Error. Region engine must be one of {REGION_ENGINES}.")
+        self.region_engine = region_engine
+        if match_mode not in MATCH_MODES:
+            raise ValueError(f"Error. Match mode must be one of {MATCH_MODES}.")
+        self.match_mode = match_mode
+        self.lut_bins = lut_bins
+        self.memory_budget = memory_budget
+        self._summed_area_table = None
+        self.thumbnail_cache = thumbnail_cache if thumbnail_cache is not None else ThumbnailCache()
+        self.use_atlas = use_atlas
+        if tiling not in TILINGS:
+            raise ValueError(f"Error. Tiling must be one of {TILINGS}.")
+        self.tiling = tiling
+        self.quadtree_levels = quadtree_levels
+        self.variance_threshold = variance_threshold
+        if cells > 1 and (match_mode == "lut" or tiling == "adaptive"):
+            raise ValueError("Error. Multi-cell descriptors need uniform tiling and the "
+                             "index or batched match mode.")
+        self.cells = cells
+        self.workers = max(1, int(workers))
         self.palette = self.img.convert('P', palette=Image.ADAPTIVE, colors=16)
-        self.regions_with_colors = self.get_avg_color_for_regions()
+        with self.metrics.timer("region_stats"):
+            self.regions_with_colors = self.get_avg_color_for_regions()
+        self.metrics.count("regions", len(self.regions_with_colors))
 
         # Logger
         self.the_logger = None if not debug else Logger(log_file_name='test_log_1.log')
 
     def get_avg_color_for_regions(self):
         """Determine the average color for each box region of the input image."""
+        if self.tiling == "adaptive":
+            return self.get_avg_color_for_adaptive_regions()
+        if self.region_engine == "numpy":
+            return self.get_avg_color_for_regions_vectorized()
+        if self.region_engine == "sat":
+            return self.get_avg_color_for_grid(self.piece_width, self.piece_height)
         return {box: self.get_avg_color(self.img.crop(box)) for box in self.divvy_into_box_regions()}
 
+    def get_avg_color_for_regions_vectorized(self):
+        """Determine the average color for each box region by converting the
+           trimmed base image into an array once. The boxes are returned in
+           the same order as divvy_into_box_regions."""
+
+        pixels = image_to_array(self.create_trimmed_mosaic_base())
+        grid = mean_colors_for_grid(pixels, self.piece_width, self.piece_height)
+        rows, cols = grid.shape[:2]
+        return {self.calculate_box_region(i, j): tuple(grid[j, i].tolist())
+                for i in range(cols) for j in range(rows)}
+
+    def get_avg_color_for_adaptive_regions(self):
+        """Determine the quadtree regions of the input image and their
+           average colors from the summed-area table."""
+
+        boxes = quadtree_boxes(self.summed_area_table, self.piece_width, self.piece_height,
+                               self.quadtree_levels, self.variance_threshold)
+        colors = self.summed_area_table.means(boxes)
+        return {tuple(box.tolist()): tuple(color.tolist()) for box, color in zip(boxes, colors)}
+
+    def get_cell_descriptors_for_regions(self):
+        """Determine the cells x cells sub-cell descriptor of each box region.
+
+           Returns:
+               (numpy.ndarray) (regions, cells * cells * 3) descriptors, in the
+               order of regions_with_colors
+        """
+
+        pixels = image_to_array(self.create_trimmed_mosaic_base())
+        grid = cell_descriptors(pixels, self.piece_width, self.piece_height, self.cells)
+        return grid.transpose(1, 0, 2).reshape(-1, grid.shape[-1])
+
+    @property
+    def summed_area_table(self):
+        """The summed-area table of the input image, built on first use. The
+           squared colors are included for adaptive tiling."""
+        if self._summed_area_table is None:
+            self._summed_area_table = SummedAreaTable(image_to_array(self.img),
+                                                      squares=self.tiling == "adaptive")
+        return self._summed_area_table
+
+    def get_avg_color_for_grid(self, piece_width, piece_height, offset=(0, 0)):
+        """Determine the average color for each box of a grid of any piece
+           size and offset from the summed-area table, without going over the
+           pixels again.
+
+           Args:
+               piece_width: (int) the width of the box region
+               piece_height: (int) the height of the box region
+               offset: (tuple) (left, top) of the first box. Default: (0, 0)
+
+           Returns:
+               (dict) average color of each box, in the same order as
+               divvy_into_box_regions
+        """
+
+        grid = self.summed_area_table.grid_means(piece_width, piece_height, offset)
+        width, height = self.img.size
+        boxes = grid_boxes(width, height, piece_width, piece_height, offset)
+        rows = grid.shape[0]
+        return {box: tuple(grid[n % rows, n // rows].tolist()) for n, box in enumerate(boxes)}
+
     def divvy_into_box_regions(self): 
         """Crops image into width x height boxes."""
         width, height = self.img.size 
@@ -86,41 +251,245 @@ class PhotoMosaic(BaseImage):
         bottom = top + self.piece_height 
         return left, top, right, bottom
 
-    def create_mosaic(self):
-        """Instantiates a SourceImageProcessor and reads in the JSON data of
-           the thumbnails and average color tuples. Next, an index is created
-           to start matching input image regions to the source image JSON.
-           Once a closet match is found, then the source thumbnail is directly
-           pasted onto the region of the input image.
+    def create_mosaic(self, output_filename=None):
+        """Renders the mosaic with render_mosaic and saves it.
+
+           Args:
+               output_filename: (string) Optional. The file to save to.
+                                         Default: mosaic_[INPUT]_[IMG_DIR].png
+
+           Returns:
+               (string) the file the mosaic was saved to
+
+           Raises:
+               ValueError: if the mosaic cannot be made from the stored img dir
         """
 
-        mosaic = self.create_trimmed_mosaic_base()
-        s_img_p = SourceImageProcessor(self.directory, (25, 25))
+        s_img_p = SourceImageProcessor(self.directory, metrics=self.metrics)
+        mosaic = self.render_mosaic(s_img_p)
+        output_filename = output_filename or f"mosaic_{self.name[:-4]}_{s_img_p.img_dir}.png"
+        print("saving mosaic")
+        with self.metrics.timer("save"):
+            mosaic.save(output_filename)
+        self.metrics.count("bytes_written", os.path.getsize(output_filename))
+        return output_filename
+
+    def render_mosaic(self, s_img_p=None):
+        """Instantiates a SourceImageProcessor and opens the source library of
+           the thumbnails and average color tuples. Next, every input image
+           region is matched to a source image, giving an array of source
+           image indices. The mosaic is then assembled from the matched
+           source thumbnails. To render many mosaics from a library loaded
+           once, see MosaicLibrary.
 
-        # Calling in source image thumbnails via JSON dictionary
-        json_data = s_img_p.read_source_avg_colors()[0]
+           Args:
+               s_img_p: (SourceImageProcessor) Optional. Processor of the image
+                                               directory. Default: a new one
 
-        json_index = self.get_index(json_data)
-        try: 
-            for region, region_color in self.regions_with_colors.items():
+           Returns:
+               (PIL.image) the mosaic
+        """
 
-                # self.the_logger.log_message(f"REGION: {region}, REGION_COLOR: {region_color}")
+        s_img_p = s_img_p or SourceImageProcessor(self.directory, metrics=self.metrics)
+        self.metrics.labels.setdefault("library", s_img_p.img_dir)
 
-                source_img_match = self.find_closest_match_with_index(region_color, json_index)
+        # Calling in source image thumbnails via the memory-mapped library
+        with self.metrics.timer("library_load"):
+            library = s_img_p.read_source_library()
+            self.metrics.labels["library_size"] = len(library)
+            fetch_thumbnail = self.thumbnail_fetcher(s_img_p, library)
 
-                # self.the_logger.log_message(f"index result for {region_color}, {source_img_match}")
+            color_lut = s_img_p.read_color_lut(library, self.lut_bins) if self.match_mode == "lut" else None
+            source_colors = library.colors if self.cells == 1 else \
+                s_img_p.read_descriptor_library(library, self.cells,
+                                                (self.piece_width, self.piece_height)).colors
+        matches = self.match_regions(source_colors, color_lut)
+        return self.assemble_mosaic(matches, fetch_thumbnail)
 
-                if not source_img_match:
-                    source_img_match = self.euclidean_match_with_json_data(region_color, json_data)
-                thumbnail_img = Image.open(source_img_match["image_match"])
-                upper_left = (region[0], region[1])
-                img_mask = thumbnail_img.convert("RGBA")
+    def profile_tags(self):
+        """Describes the render for profiles, so profiles of different runs
+           can be compared: the input size, the library and its size (once
+           it is loaded), the piece size, the regions and the match mode."""
+
+        width, height = self.img.size
+        return {"input": self.name if isinstance(self.name, str) else type(self.name).__name__,
+                "input_size": f"{width}x{height}", "input_megapixels": width * height / 1e6,
+                "library": self.metrics.labels.get("library"),
+                "library_size": self.metrics.labels.get("library_size"),
+                "piece_size": f"{self.piece_width}x{self.piece_height}",
+                "regions": len(self.regions_with_colors), "match_mode": self.match_mode}
+
+    def assemble_mosaic(self, matches, fetch_thumbnail, out=None):
+        """Assembles the mosaic from the matched source thumbnails. With
+           uniform tiling, the distinct matched thumbnails are stacked into
+           one array and the whole mosaic is gathered from it at once, see
+           assemble_grid. Adaptive tiles differ in size, so they are pasted
+           onto the trimmed mosaic base instead.
+
+           Args:
+               matches: (numpy.ndarray) source image index for each region
+               fetch_thumbnail: (function) returns the thumbnail of a source
+                                           image index at a size, see
+                                           thumbnail_fetcher
+               out: (numpy.ndarray) Optional. A (height, width, 3) uint8 buffer
+                                    of the trimmed size the uniform mosaic is
+                                    written into. Default: a new array
+
+           Returns:
+               (PIL.image) the mosaic
+        """
+
+        with self.metrics.timer("assemble"):
+            return self._assemble_mosaic(matches, fetch_thumbnail, out)
+
+    def _assemble_mosaic(self, matches, fetch_thumbnail, out=None):
+        if self.tiling == "adaptive":
+            mosaic = self.create_trimmed_mosaic_base()
+            self.paste_matches(mosaic, matches, fetch_thumbnail)
+            return mosaic
+
+        size = (self.piece_width, self.piece_height)
+        distinct, grid = np.unique(np.asarray(matches, dtype=np.int64), return_inverse=True)
+        self.metrics.count("thumbnails_fetched", len(distinct))
+        thumbnails = np.zeros((len(distinct), self.piece_height, self.piece_width, 3), dtype=np.uint8)
+        for i, match in enumerate(distinct):
+            thumbnails[i] = thumbnail_to_array(fetch_thumbnail(int(match), size), size)
+
+        # regions_with_colors is ordered column by column
+        cols, rows = self.img.width // self.piece_width, self.img.height // self.piece_height
+        return Image.fromarray(assemble_grid(grid.reshape(cols, rows).T, thumbnails, out))
+
+    def match_regions(self, source_colors, color_lut=None, color_index=None):
+        """Matches every region of the input image to its closest source color.
+           With the "index" match mode, each region queries a ColorIndex. With
+           the "batched" match mode, all region colors are matched against all
+           source colors at once in chunks that fit the memory budget. With
+           the "lut" match mode, each region color is looked up in a color LUT
+           of lut_bins^3 quantized colors. With cells above 1, the region
+           descriptors are matched against the source descriptors instead.
+           With workers above 1, the index and batched match modes run in
+           several processes, see match_in_parallel.
+
+           Args:
+               source_colors: (numpy.ndarray) the average colors, or the
+                                              descriptors, of the source images
+               color_lut: (ColorLUT) Optional. The cached color LUT of the
+                                     library. Default: built from source_colors
+               color_index: (ColorIndex) Optional. A prebuilt color index, or
+                                         DescriptorIndex, of the library.
+                                         Default: built from source_colors
+
+           Returns:
+               (numpy.ndarray) index of the matched source image for each
+               region, in the order of regions_with_colors
+        """
+
+        with self.metrics.timer("match"):
+            if self.cells > 1:
+                region_colors = self.get_cell_descriptors_for_regions()
+            else:
+                region_colors = np.array(list(self.regions_with_colors.values()), dtype=np.float64)
+            self.metrics.count(f"{self.match_mode}_matches", len(region_colors))
+            if self.workers > 1 and self.tiling == "uniform" and self.match_mode != "lut":
+                return self.match_in_parallel(region_colors, source_colors, color_index)
+            if self.match_mode == "batched":
+                return batched_nearest(region_colors, source_colors, self.memory_budget)
+            if self.match_mode == "lut":
+                if color_lut is None:
+                    return lookup(build_table(source_colors, self.lut_bins, self.memory_budget), region_colors)
+                return color_lut.lookup(region_colors)
+            if color_index is None:
+                color_index = ColorIndex(source_colors) if self.cells == 1 else DescriptorIndex(source_colors)
+            return self.query_index(color_index, region_colors)
+
+    def query_index(self, color_index, region_colors):
+        """Queries a ColorIndex or DescriptorIndex for every region and counts
+           the leaf hits and backtracks of the queries in metrics."""
+
+        stats = {}
+        matches = color_index.query_many(region_colors, stats)
+        for name in ("leaf_hits", "backtracks", "leaves_scanned"):
+            self.metrics.count(f"index_{name}", stats[name])
+        return matches
+
+    def match_in_parallel(self, region_colors, source_colors, color_index=None):
+        """Matches the region grid in workers processes with ParallelMatcher
+           and counts the bands and the color index queries in metrics."""
+
+        cols, rows = self.img.width // self.piece_width, self.img.height // self.piece_height
+        matcher = ParallelMatcher(source_colors, self.match_mode, self.workers,
+                                  memory_budget=self.memory_budget, color_index=color_index)
+        matches = matcher.match(region_colors, cols, rows)
+        self.metrics.count("match_bands", sum(matcher.bands.values()))
+        if self.match_mode == "index":
+            self.metrics.count("index_leaf_hits", matcher.leaf_hits)
+            self.metrics.count("index_backtracks", matcher.backtracks)
+            self.metrics.count("index_leaves_scanned", matcher.leaves_scanned)
+        return matches
+
+    def thumbnail_fetcher(self, s_img_p, library):
+        """Creates the function the paste stage uses to get the thumbnail of
+           a source image at a region size. Thumbnails come from the thumbnail
+           atlas of that size with use_atlas. Otherwise they come from the
+           closest level of the thumbnail pyramid (see
+           ThumbnailPyramid.level_for), or from the thumbnail cache if the
+           library has no complete pyramid, resized if the region is not the
+           size of the stored thumbnail.
+
+           Args:
+               s_img_p: (SourceImageProcessor) processor of the image directory
+               library: (SourceLibrary) the source library
+
+           Returns:
+               (function) takes a source image index and a (width, height)
+               size and returns the thumbnail
+        """
+
+        if self.use_atlas:
+            atlases = {}
+
+            def fetch_thumbnail(match, size):
+                if size not in atlases:
+                    atlases[size] = s_img_p.read_thumbnail_atlas(library, size)
+                return atlases[size].image(match)
+        else:
+            pyramid = ThumbnailPyramid(library.path, s_img_p.pyramid_levels)
+
+            def fetch_thumbnail(match, size):
+                level = pyramid.level_for(size)
+                if level is not None and len(pyramid.atlases[level]) == len(library):
+                    thumbnail = pyramid.atlases[level].image(match)
+                    self.metrics.count("pyramid_thumbnails")
+                else:
+                    misses = self.thumbnail_cache.misses
+                    thumbnail = self.thumbnail_cache.get(library.names[match])
+                    self.metrics.count("thumbnail_opens", self.thumbnail_cache.misses - misses)
+                return thumbnail if thumbnail.size == size else thumbnail.resize(size, Image.LANCZOS)
+        return fetch_thumbnail
+
+    def paste_matches(self, mosaic, matches, fetch_thumbnail):
+        """Pastes the matched source thumbnail onto each region of the mosaic.
+           The regions are grouped by their match, so each distinct thumbnail
+           is fetched once per mosaic for each region size.
+
+           Args:
+               mosaic: (PIL.image) the trimmed mosaic base
+               matches: (numpy.ndarray) source image index for each region
+               fetch_thumbnail: (function) returns the thumbnail of a source
+                                           image index at a size, see
+                                           thumbnail_fetcher
+        """
+
+        regions_by_match = defaultdict(list)
+        for region, match in zip(self.regions_with_colors, matches):
+            size = (region[2] - region[0], region[3] - region[1])
+            regions_by_match[(int(match), size)].append((region[0], region[1]))
+        self.metrics.count("thumbnails_fetched", len(regions_by_match))
+
+        for (match, size), upper_lefts in regions_by_match.items():
+            thumbnail_img = fetch_thumbnail(match, size)
+            for upper_left in upper_lefts:
                 mosaic.paste(thumbnail_img, upper_left)
-            print("saving mosaic")
-            mosaic.save(f"mosaic_{self.name[:-4]}_{s_img_p.img_dir}.png")
-        except ValueError as v:
-            print(f"Unexpected error came up after trying to use stored img dir to save mosaic: {v}")
-            sys.exit(1)
 
     def create_trimmed_mosaic_base(self):
         """Uneven input images will result in the sides of the image not
@@ -137,46 +506,6 @@ class PhotoMosaic(BaseImage):
         mosaic_height = self.piece_height * count
         return mosaic.crop((0, 0, mosaic_width, mosaic_height))
 
-    @staticmethod
-    def get_index(json_data):
-        """For each thumbnail picture in the JSON data dictionary, retrieve
-           the original pixel values and round up or down depending on the
-           value. Save this new tuple into the index dictionary."""
-
-        index = defaultdict(list)
-        if validate_json_data(json_data):
-            for name, color in json_data.items():
-                *new_color, = map(round_to_nearest_10, color)
-                index[tuple(new_color)].append((name, color))
-            return index
-
-    def find_closest_match_with_index(self, region_color, index):
-        *translated, = map(round_to_nearest_10, region_color)
-        if tuple(translated) in index:
-            source_images = index.get(tuple(translated))
-            min_dist = sys.maxsize
-            result = {"image_match": 0}
-            for name, color in source_images:
-                dist = self.calculate_euclidean_dist(region_color, color)
-                if dist < min_dist:
-                    min_dist = dist
-                    result["image_match"] = name
-            return result
-
-    def euclidean_match_with_json_data(self, region_color, source_img_data):
-        """Euclidean distance matching with the JSON dictionary. This only
-           occurs if there was not a match with the index.
-        """
-
-        min_dist = sys.maxsize
-        result = {'image_match': 0}
-        for name, color in source_img_data.items():
-            dist = self.calculate_euclidean_dist(region_color, color)
-            if dist < min_dist:
-                min_dist = dist
-                result['image_match'] = name
-        return result
-
     @staticmethod
     def calculate_euclidean_dist(rgb_tup1, rgb_tup2):
         return math.sqrt(sum([(a - b)**2 for a, b in zip(rgb_tup1, rgb_tup2)]))
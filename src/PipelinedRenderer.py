@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""In this script, a mosaic is rendered band by band in concurrent pipeline stages."""
+
+from PIL import Image
+
+from TiledRenderer import TiledRenderer
+from utils.matching import DEFAULT_MEMORY_BUDGET
+from utils.pipeline import Pipeline
+from utils.streaming_io import iter_image_bands, StreamingPNGWriter
+
+
+class PipelinedRenderer(TiledRenderer):
+    """PipelinedRenderer renders a mosaic band by band like TiledRenderer,
+       but runs the phases of a band as concurrent stages instead of one
+       after the other: decoding the input band, averaging its regions,
+       matching them, assembling the band from the thumbnail atlas and
+       encoding it into the output PNG. The stages are threads linked by
+       bounded queues, so while one band is encoded and written the next is
+       matched and the one after is decoded. Reading the input, zlib
+       compression and the numpy work release the GIL, which lets them
+       overlap. At most queue_size bands wait between two stages, so memory
+       stays bounded by the band height. The queue depth and busy time of
+       every stage is kept in pipeline after each render.
+
+       Attributes:
+           queue_size: (int) number of bands each queue can hold. Default: 2
+           pipeline: (Pipeline) the stages, with the stats of the last render
+    """
+
+    def __init__(self, directory, piece_width=25, piece_height=25, band_rows=8,
+                 match_mode="index", lut_bins=32, memory_budget=DEFAULT_MEMORY_BUDGET,
+                 default_img_dir="img_sets", cells=1, queue_size=2):
+        """Initializes PipelinedRenderer and loads the source library,
+           thumbnail atlas and color index or color LUT."""
+        super().__init__(directory, piece_width, piece_height, band_rows, match_mode, lut_bins,
+                         memory_budget, default_img_dir, cells)
+        self.queue_size = queue_size
+        self.pipeline = None
+
+    def render(self, filename, output_filename=None):
+        """Renders the mosaic of an input image to a PNG file.
+
+           Args:
+               filename: (string) the input image
+               output_filename: (string) Optional. The PNG file to write.
+                                         Default: mosaic_[INPUT]_[IMG_DIR].png
+
+           Returns:
+               (string) the PNG file written
+        """
+
+        with Image.open(filename) as image:
+            width, height = image.size
+        cols, rows = width // self.piece_width, height // self.piece_height
+        output_filename = output_filename or f"mosaic_{filename[:-4]}_{self.s_img_p.img_dir}.png"
+        band_height = self.band_rows * self.piece_height
+
+        def decode():
+            for top, band in iter_image_bands(filename, band_height):
+                if top >= rows * self.piece_height:
+                    break
+                yield band
+
+        with StreamingPNGWriter(output_filename, cols * self.piece_width,
+                                rows * self.piece_height) as writer:
+            self.pipeline = Pipeline([
+                ("stats", self.band_colors),
+                ("match", self.match_colors),
+                ("assemble", self.assemble_band),
+                ("encode", writer.write_rows),
+            ], self.queue_size)
+            self.pipeline.run(decode(), "decode")
+        return output_filename
@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+"""In this script, mosaics are rendered by a long-running local HTTP service."""
+
+import os
+import re
+import json
+import time
+import argparse
+import threading
+
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from MosaicLibrary import MosaicLibrary, encode_image
+from ThumbnailPyramid import PYRAMID_LEVELS
+
+# 512 MiB of resident libraries
+DEFAULT_LIBRARY_CACHE_BYTES = 512 * 2 ** 20
+# largest accepted input image
+MAX_REQUEST_BYTES = 64 * 2 ** 20
+# latencies kept for the percentiles
+RECENT_REQUESTS = 1000
+# largest piece side a request can ask for: the largest pyramid level, so a
+# request never makes the service build and keep an atlas of bigger thumbnails
+MAX_PIECE_SIZE = max(PYRAMID_LEVELS)
+# image directory names a request can ask for
+DIRECTORY_NAME = re.compile(r"^[A-Za-z0-9_][A-Za-z0-9_.-]*$")
+
+
+class LibraryCache(object):
+    """LibraryCache keeps loaded libraries resident between requests: the
+       source library, its thumbnails decoded into memory at the piece size
+       and its color index or LUT, as a MosaicLibrary. Libraries are keyed by
+       (directory, piece_width, piece_height, match_mode) and evicted in
+       least-recently-used order once their memory exceeds max_bytes. The
+       cache can be used from several request threads at once: a library is
+       loaded outside the lock, so a slow load only holds up the requests
+       for that same library, which wait for the one load instead of
+       loading it again.
+
+       Attributes:
+           max_bytes: (int) memory budget for the resident libraries.
+                            Default: 512 MiB
+           loader: (function) loads the library for a key. Default: MosaicLibrary
+           hits: (int) number of requests served by a resident library
+           misses: (int) number of requests that loaded a library
+           evictions: (int) number of libraries dropped from memory
+    """
+
+    def __init__(self, max_bytes=DEFAULT_LIBRARY_CACHE_BYTES, loader=None, default_img_dir="img_sets"):
+        """Initializes LibraryCache with max_bytes, loader and default_img_dir."""
+        if max_bytes < 0:
+            raise ValueError("Error. Cache size cannot be negative.")
+        self.max_bytes = max_bytes
+        self.loader = loader or (lambda directory, piece_width, piece_height, match_mode: MosaicLibrary(
+            directory, piece_width, piece_height, match_mode, default_img_dir=default_img_dir, resident=True))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.current_bytes = 0
+        self._libraries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._libraries)
+
+    def __contains__(self, key):
+        return key in self._libraries
+
+    def get(self, key):
+        """Retrieves a library, loading it on a miss.
+
+           Args:
+               key: (tuple) directory, piece_width, piece_height and match_mode
+
+           Returns:
+               (MosaicLibrary, boolean) the library and whether it was resident
+        """
+
+        with self._lock:
+            if key in self._libraries:
+                self.hits += 1
+                self._libraries.move_to_end(key)
+                return self._libraries[key][0], True
+            # a request for a key already being loaded waits for that load
+            loading = self._loading.get(key)
+            waiting = loading is not None
+            if waiting:
+                self.hits += 1
+            else:
+                self.misses += 1
+                loading = self._loading[key] = Future()
+
+        if waiting:
+            return loading.result(), True
+        try:
+            mosaic_library = self.loader(*key)
+        except BaseException as error:
+            with self._lock:
+                del self._loading[key]
+            loading.set_exception(error)
+            raise
+
+        with self._lock:
+            del self._loading[key]
+            nbytes = mosaic_library.nbytes
+            if nbytes <= self.max_bytes:
+                self._libraries[key] = (mosaic_library, nbytes)
+                self.current_bytes += nbytes
+                while self.current_bytes > self.max_bytes:
+                    _, (_, evicted_bytes) = self._libraries.popitem(last=False)
+                    self.current_bytes -= evicted_bytes
+                    self.evictions += 1
+        loading.set_result(mosaic_library)
+        return mosaic_library, False
+
+    def stats(self):
+        """Returns the cache counters as a dictionary."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "libraries": [list(key) for key in self._libraries],
+                    "bytes": self.current_bytes,
+                    "max_bytes": self.max_bytes}
+
+
+class LatencyStats(object):
+    """LatencyStats adds up the latency of the render requests, split into
+       loading the library, rendering the mosaic and encoding it. The
+       percentiles are taken over the most recent requests.
+
+       Attributes:
+           requests: (int) number of rendered requests
+           errors: (int) number of failed requests
+           recent: (collections.deque) total seconds of the recent requests
+    """
+
+    def __init__(self, recent=RECENT_REQUESTS):
+        """Initializes LatencyStats with the number of recent requests kept."""
+        self.requests = 0
+        self.errors = 0
+        self.recent = deque(maxlen=recent)
+        self._seconds = {"load": 0.0, "render": 0.0, "encode": 0.0, "total": 0.0}
+        self._lock = threading.Lock()
+
+    def add(self, timings):
+        """Adds the timings of a rendered request."""
+        with self._lock:
+            self.requests += 1
+            self.recent.append(timings["total"])
+            for phase in self._seconds:
+                self._seconds[phase] += timings[phase]
+
+    def add_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def stats(self):
+        """Returns the request counts and latencies as a dictionary."""
+        with self._lock:
+            recent = sorted(self.recent)
+            requests = self.requests or 1
+
+            def percentile(p):
+                return recent[min(len(recent) - 1, int(p * len(recent)))] if recent else 0.0
+
+            stats = {"requests": self.requests, "errors": self.errors,
+                     "p50_seconds": percentile(0.5), "p95_seconds": percentile(0.95),
+                     "max_seconds": recent[-1] if recent else 0.0}
+            stats.update({f"mean_{phase}_seconds": seconds / requests
+                          for phase, seconds in self._seconds.items()})
+            return stats
+
+
+class RenderService(object):
+    """RenderService renders mosaics from encoded input images, keeping the
+       libraries resident in a LibraryCache so a request only pays for its
+       own image rather than process startup and library loading.
+
+       Attributes:
+           library_cache: (LibraryCache) the resident libraries
+           latency: (LatencyStats) latency of the requests
+    """
+
+    def __init__(self, max_bytes=DEFAULT_LIBRARY_CACHE_BYTES, default_img_dir="img_sets", loader=None):
+        """Initializes RenderService with the library cache size."""
+        self.default_img_dir = default_img_dir
+        self.library_cache = LibraryCache(max_bytes, loader, default_img_dir)
+        self.latency = LatencyStats()
+
+    def library_directory(self, directory):
+        """Checks that a requested image directory is one of the image
+           directories in default_img_dir, given by its name or as
+           [DEFAULT_IMG_DIR]/[NAME], and nothing else, since the directory
+           comes from the request.
+
+           Returns:
+               (string) the image directory as [DEFAULT_IMG_DIR]/[NAME]
+
+           Raises:
+               ValueError: if the directory is not a plain name of an existing
+                           image directory in default_img_dir
+        """
+
+        root = self.default_img_dir.rstrip("/")
+        name = directory[len(root) + 1:] if directory.startswith(root + "/") else directory
+        path = os.path.join(root, name)
+        if not DIRECTORY_NAME.match(name) or name == "img_jsons" or not os.path.isdir(path) \
+                or os.path.dirname(os.path.realpath(path)) != os.path.realpath(root):
+            raise ValueError(f"Error. {directory!r} is not an image directory of {root}.")
+        return f"{root}/{name}"
+
+    @staticmethod
+    def check_piece_size(piece_width, piece_height):
+        """Checks that a requested piece size is between 1 and MAX_PIECE_SIZE
+           on each side before any library is loaded for it."""
+        if not (0 < piece_width <= MAX_PIECE_SIZE and 0 < piece_height <= MAX_PIECE_SIZE):
+            raise ValueError(f"Error. Piece sizes must be between 1 and {MAX_PIECE_SIZE}.")
+
+    def render(self, data, directory, piece_width=25, piece_height=25, match_mode="index"):
+        """Renders the mosaic of an encoded input image.
+
+           Args:
+               data: (bytes) the encoded input image, e.g. JPEG or PNG
+               directory: (string) image directory of the library
+               piece_width: (int) the width of the box region. Default: 25
+               piece_height: (int) the height of the box region. Default: 25
+               match_mode: (string) "index", "batched" or "lut". Default: "index"
+
+           Returns:
+               (bytes, dict) the PNG encoded mosaic and the timings of the
+               request, with whether the library was resident
+
+           Raises:
+               ValueError: if the directory is not an image directory of
+                           default_img_dir, see library_directory, or the
+                           piece size is out of range, see check_piece_size
+        """
+
+        started = time.perf_counter()
+        try:
+            self.check_piece_size(piece_width, piece_height)
+            directory = self.library_directory(directory)
+            mosaic_library, resident = self.library_cache.get((directory, piece_width, piece_height,
+                                                                match_mode))
+            loaded = time.perf_counter()
+            mosaic = mosaic_library.render(data)
+            rendered = time.perf_counter()
+            body = encode_image(mosaic, "png")
+        except Exception:
+            self.latency.add_error()
+            raise
+        finished = time.perf_counter()
+
+        timings = {"load": loaded - started, "render": rendered - loaded,
+                   "encode": finished - rendered, "total": finished - started,
+                   "regions": mosaic_library.regions(mosaic), "library_resident": resident}
+        self.latency.add(timings)
+        return body, timings
+
+    def stats(self):
+        return {"latency": self.latency.stats(), "library_cache": self.library_cache.stats()}
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """Handles the requests of the render service:
+
+       POST /render?directory=[IMG_DIR]&piece_width=25&piece_height=25&match_mode=index
+           with the encoded input image as the body, answers with the PNG
+           encoded mosaic and its timings in X-Render-* headers.
+       GET /stats
+           answers with the latency and library cache stats as JSON.
+    """
+
+    def send_body(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_text(self, status, message):
+        self.send_body(status, message.encode("utf-8"), "text/plain; charset=utf-8")
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/stats":
+            return self.send_error_text(404, "Error. Unknown path.")
+        body = json.dumps(self.server.service.stats()).encode("utf-8")
+        self.send_body(200, body, "application/json")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/render":
+            return self.send_error_text(404, "Error. Unknown path.")
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            directory = query["directory"]
+            piece_width = int(query.get("piece_width", 25))
+            piece_height = int(query.get("piece_height", 25))
+            match_mode = query.get("match_mode", "index")
+            RenderService.check_piece_size(piece_width, piece_height)
+        except (KeyError, ValueError):
+            return self.send_error_text(400, "Error. Need a directory, integer piece sizes "
+                                             f"between 1 and {MAX_PIECE_SIZE} and a Content-Length.")
+        if not 0 < length <= MAX_REQUEST_BYTES:
+            return self.send_error_text(413, f"Error. Send an image of at most {MAX_REQUEST_BYTES} bytes.")
+
+        data = self.rfile.read(length)
+        try:
+            body, timings = self.server.service.render(data, directory, piece_width, piece_height,
+                                                       match_mode)
+        except (OSError, ValueError) as error:
+            return self.send_error_text(400, f"Error. Could not render the mosaic: {error}")
+        except Exception as error:
+            self.log_error("Could not render the mosaic: %r", error)
+            return self.send_error_text(500, "Error. The mosaic could not be rendered.")
+        headers = {f"X-Render-{phase.title()}-Seconds": f"{timings[phase]:.6f}"
+                   for phase in ("load", "render", "encode", "total")}
+        headers["X-Render-Regions"] = str(timings["regions"])
+        headers["X-Library-Cache"] = "hit" if timings["library_resident"] else "miss"
+        self.send_body(200, body, "image/png", headers)
+
+
+def create_server(host="127.0.0.1", port=8765, max_bytes=DEFAULT_LIBRARY_CACHE_BYTES,
+                  default_img_dir="img_sets"):
+    """Creates the HTTP server of the render service. Each request is
+       handled in its own thread.
+
+       Returns:
+           (http.server.ThreadingHTTPServer) the server, not yet serving
+    """
+
+    server = ThreadingHTTPServer((host, port), RenderRequestHandler)
+    server.daemon_threads = True
+    server.service = RenderService(max_bytes, default_img_dir)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves mosaics over a local HTTP API")
+    parser.add_argument("--host", help="enter the address to listen on", type=str, default="127.0.0.1")
+    parser.add_argument("--port", help="enter the port to listen on", type=int, default=8765)
+    parser.add_argument("--cache-mb", help="enter the memory for resident libraries in MiB",
+                        type=int, default=DEFAULT_LIBRARY_CACHE_BYTES // 2 ** 20)
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, args.cache_mb * 2 ** 20)
+    print(f"Serving mosaics on http://{args.host}:{server.server_address[1]}/render")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
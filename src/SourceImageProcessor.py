@@ -1,13 +1,179 @@
 #!/usr/bin/env python
 """In this script, we perform the necessary preprocessing for the source images."""
 
+import io
 import os
-import subprocess 
+import time
 import json 
 import re
+import argparse
+import itertools
+import statistics
+import multiprocessing
+
+from collections import deque
 
 from BaseImage import BaseImage
-from utils.helpers import trim_width, trim_height
+from ColorLUT import ColorLUT, lut_path_for
+from SourceLibrary import SourceLibrary, SourceLibraryWriter, convert_json_library, \
+    descriptor_library_path_for
+from ThumbnailAtlas import ThumbnailAtlas, atlas_path_for
+from ThumbnailCache import open_thumbnail
+from ThumbnailPyramid import ThumbnailPyramid, ThumbnailPyramidWriter, pyramid_arrays, pyramid_path_for, \
+    PYRAMID_LEVELS
+from utils.helpers import trim_width, trim_height, print_progress, file_digest
+from utils.metrics import Metrics
+from utils.region_stats import cell_descriptors, image_to_array
+
+# sampled images needed before the time saved by draft decoding is trusted
+MIN_DECODE_SAMPLES = 3
+
+def process_source_image(task):
+    """Decodes, trims, thumbnails and averages one source image. Every pixel
+       of the thumbnail is weighted equally, like the input image regions in
+       mean_colors_for_grid, so both sides of a match use the same average.
+       This is a module level function so it can be run by worker processes,
+       which only send the results back to the parent. The thumbnail pyramid
+       levels are resized from the same decoded image. With draft decoding,
+       the image is decoded at the smallest reduced scale that still covers
+       the thumbnail and pyramid sizes. With measure_full, the image is then
+       decoded again at reduced scale and at full resolution, back to back,
+       so both timed decodes read a file that is already cached and the time
+       saved can be estimated.
+
+       Args:
+           task: (tuple) file name of the source image, thumbnail size,
+                         draft decoding and measure_full booleans, and the
+                         pyramid levels
+
+       Returns:
+           (string, tuple, bytes, list, tuple) the file name, the average
+           color of the thumbnail, the thumbnail encoded as PNG, the pyramid
+           level arrays and the decode stats (drafted, full pixels, decoded
+           pixels, seconds, sample), where sample is None or the (draft
+           seconds, full seconds) of the back to back decodes
+    """
+
+    filename, size, draft, measure_full, levels = task
+    largest = max(max(size), *levels) if levels else max(size)
+    started = time.perf_counter()
+    base_img = BaseImage(filename, draft_size=(largest, largest) if draft else None)
+    seconds = time.perf_counter() - started
+    sample = None
+    if measure_full and base_img.is_drafted:
+        started = time.perf_counter()
+        BaseImage(filename, draft_size=(largest, largest))
+        draft_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        BaseImage(filename)
+        sample = (draft_seconds, time.perf_counter() - started)
+
+    img = base_img.img
+    decode_stats = (base_img.is_drafted, base_img.full_size[0] * base_img.full_size[1],
+                    img.size[0] * img.size[1], seconds, sample)
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA")
+    width, height = img.size
+    trimmed_img = trim_width(img, width, height)
+    width, height = trimmed_img.size
+    trimmed_img = trim_height(trimmed_img, width, height)
+    pyramid = pyramid_arrays(trimmed_img, levels)
+    trimmed_img.thumbnail(size)
+
+    buffer = io.BytesIO()
+    trimmed_img.save(buffer, "png")
+    avg_color = tuple(image_to_array(trimmed_img).reshape(-1, 3).mean(axis=0).tolist())
+    return filename, avg_color, buffer.getvalue(), pyramid, decode_stats
+
+
+class DecodeReport(object):
+    """DecodeReport adds up the decode stats of the source images to show how
+       much decode time and memory the reduced-scale (draft) decoding saved.
+       The decoded and full resolution pixels are known for every image. The
+       time a full resolution decode would have taken is estimated from the
+       median ratio of full to reduced-scale decode time of the sampled
+       images, never taken below 1, and is only marked reliable once
+       MIN_DECODE_SAMPLES images were sampled.
+
+       Attributes:
+           images: (int) number of decoded source images
+           drafted: (int) number of images decoded at a reduced scale
+           full_pixels: (int) pixels at full resolution
+           decoded_pixels: (int) pixels actually decoded
+           seconds: (float) time spent decoding
+           speedups: (list) full over reduced-scale decode time of each
+                            sampled image
+    """
+
+    def __init__(self):
+        """Initializes DecodeReport with zero counts."""
+        self.images = 0
+        self.drafted = 0
+        self.full_pixels = 0
+        self.decoded_pixels = 0
+        self.peak_full_bytes = 0
+        self.peak_decoded_bytes = 0
+        self.seconds = 0.0
+        self.drafted_seconds = 0.0
+        self.speedups = []
+
+    def add(self, decode_stats):
+        """Adds the decode stats returned by process_source_image."""
+        drafted, full_pixels, decoded_pixels, seconds, sample = decode_stats
+        self.images += 1
+        self.drafted += int(drafted)
+        self.full_pixels += full_pixels
+        self.decoded_pixels += decoded_pixels
+        self.peak_full_bytes = max(self.peak_full_bytes, 3 * full_pixels)
+        self.peak_decoded_bytes = max(self.peak_decoded_bytes, 3 * decoded_pixels)
+        self.seconds += seconds
+        if drafted:
+            self.drafted_seconds += seconds
+        if sample is not None and sample[0] > 0:
+            self.speedups.append(sample[1] / sample[0])
+
+    def summary(self):
+        """Returns the report as a dictionary. The estimated full resolution
+           decode time is None until a drafted image has been sampled."""
+
+        estimated_full_seconds = None
+        if self.speedups:
+            speedup = max(1.0, statistics.median(self.speedups))
+            estimated_full_seconds = self.seconds + self.drafted_seconds * (speedup - 1)
+        return {"images": self.images,
+                "drafted": self.drafted,
+                "full_decodes": self.images - self.drafted,
+                "full_megapixels": self.full_pixels / 1e6,
+                "decoded_megapixels": self.decoded_pixels / 1e6,
+                "bytes_saved": 3 * (self.full_pixels - self.decoded_pixels),
+                "peak_full_bytes": self.peak_full_bytes,
+                "peak_decoded_bytes": self.peak_decoded_bytes,
+                "decode_seconds": self.seconds,
+                "estimated_full_decode_seconds": estimated_full_seconds,
+                "decode_samples": len(self.speedups),
+                "estimate_reliable": len(self.speedups) >= MIN_DECODE_SAMPLES,
+                "seconds_saved": None if estimated_full_seconds is None
+                else estimated_full_seconds - self.seconds}
+
+    def __str__(self):
+        summary = self.summary()
+        report = (f"Decoded {summary['images']} images, {summary['drafted']} at reduced scale: "
+                  f"{summary['decoded_megapixels']:.1f} of {summary['full_megapixels']:.1f} megapixels, "
+                  f"{summary['bytes_saved'] / 2 ** 20:.1f} MiB saved, "
+                  f"peak image {summary['peak_decoded_bytes'] / 2 ** 20:.1f} MiB instead of "
+                  f"{summary['peak_full_bytes'] / 2 ** 20:.1f} MiB, "
+                  f"{summary['decode_seconds']:.2f}s decoding")
+        if summary["seconds_saved"] is not None:
+            report += f" (about {summary['seconds_saved']:.2f}s saved"
+            if not summary["estimate_reliable"]:
+                report += f", estimated from only {summary['decode_samples']} sampled images"
+            report += ")"
+        return report + "."
+
+
+def process_source_image_chunk(tasks):
+    """Runs process_source_image over a chunk of tasks in a worker process."""
+    return [process_source_image(task) for task in tasks]
 
 
 class SourceImageProcessor(object):
@@ -22,7 +188,28 @@ class SourceImageProcessor(object):
         corresponding JSON file of thumbnails in "img_sets/img_jsons/[IMG_DIR]".
         Using a JSON file format, makes it easier to directly read in all the
         thumbnails and their average colors instead of calculating them all
-        over again.
+        over again. The JSON file is converted once into a binary
+        SourceLibrary ("img_sets/img_jsons/[IMG_DIR].lib"), which is
+        memory-mapped instead of parsed on every run. A manifest of the source
+        images ("img_sets/img_jsons/[IMG_DIR].manifest.json") is kept next to
+        the library so a refresh only processes added or modified images.
+        Optionally, all the thumbnails of the library can be stored in one
+        thumbnail atlas ("img_sets/img_jsons/[IMG_DIR]_[W]x[H].atlas") so
+        they are read from one file instead of one file per thumbnail. While
+        the library is built, every source image is also resized into a
+        thumbnail pyramid of square atlases
+        ("img_sets/img_jsons/[IMG_DIR]_level[L].atlas", see ThumbnailPyramid),
+        from which the atlas for any piece size is made without decoding the
+        source images again. A
+        color LUT ("img_sets/img_jsons/[IMG_DIR]_lut[BINS].lut") of the closest
+        source image for each quantized color can be cached the same way, as
+        can a library of multi-cell descriptors
+        ("img_sets/img_jsons/[IMG_DIR]_cells[CELLS]_[W]x[H].lib") of the
+        thumbnails at a piece size.
+        Source images are decoded at a reduced scale where the format allows
+        it, which is reported in decode_report. The scan, processing and
+        cache builds are timed in metrics, along with the source images
+        processed, thumbnail opens and bytes read and written.
 
         Attributes:
             img_dir: (string) Image directory
@@ -31,14 +218,39 @@ class SourceImageProcessor(object):
             default_img_dir: (string) Optional. Describes the default image directory.
                                       Can input one directly. Default: img_sets/
             size: (tuple) Size of the thumbnail.
+            workers: (int) Number of processes used to preprocess the source
+                           images. Default: 1
+            chunksize: (int) Number of source images handed to a worker at a
+                             time. Default: 16
+            draft_decode: (boolean) Decodes source images at a reduced scale
+                                    where the format allows it. Default: True
+            sample_full_decode_every: (int) Every so many source images, starting
+                                            with the one at this position rather
+                                            than the first, are also decoded at
+                                            full resolution to estimate the time
+                                            saved. 0 disables. Default: 50
+            pyramid_levels: (tuple) square thumbnail sizes of the pyramid written
+                                    with the library. Default: PYRAMID_LEVELS
+            decode_report: (DecodeReport) decode stats of the processed images
+            metrics: (Metrics) timers and counters of the stages. Default: a new one
     """
 
-    def __init__(self, img_dir, size=(50, 50), default_img_dir="img_sets"):
-        """Initializes SourceImageProcessor with img_dir, size, and default_img_direct."""
+    def __init__(self, img_dir, size=(50, 50), default_img_dir="img_sets", workers=1, chunksize=16,
+                 draft_decode=True, sample_full_decode_every=50, pyramid_levels=PYRAMID_LEVELS,
+                 metrics=None):
+        """Initializes SourceImageProcessor with img_dir, size, default_img_direct,
+           workers, chunksize, draft decoding options and pyramid_levels."""
         self.is_from_img_sets = False
         self.default_img_dir = default_img_dir+'/'
         self.img_dir = self.img_dir_name_cleaned(img_dir)
         self.size = size
+        self.workers = max(1, int(workers))
+        self.chunksize = max(1, int(chunksize))
+        self.draft_decode = draft_decode
+        self.sample_full_decode_every = sample_full_decode_every
+        self.pyramid_levels = tuple(pyramid_levels)
+        self.decode_report = DecodeReport()
+        self.metrics = metrics if metrics is not None else Metrics()
 
     def img_dir_name_cleaned(self, img_dir):
         """If the user uses one of the image directories in "img_sets,"
@@ -80,6 +292,136 @@ class SourceImageProcessor(object):
             return self.read_json_contents()
         return contents
 
+    def read_source_library(self):
+        """Opens the binary source library. If it does not exist yet, or is
+           older than the JSON file, it is converted from the JSON file. If
+           neither exists, the library is built from the source images.
+
+           Returns:
+               (SourceLibrary) the source library
+        """
+
+        json_path = f"{self.default_img_dir}img_jsons/" + self.img_dir + ".txt"
+        library_path = self.library_path()
+        if os.path.isfile(library_path) and self.check_if_json_corresponding_thumbnails() and \
+                (not os.path.isfile(json_path) or os.path.getmtime(library_path) >= os.path.getmtime(json_path)):
+            return SourceLibrary(library_path)
+        if not os.path.isfile(json_path):
+            print(f"Building source library {library_path} from the source images.")
+            self.create_img_subdirs()
+            return self.build_source_library()
+        if not self.read_source_avg_colors():
+            raise ValueError(f"Error. Could not read the source image colors for {self.img_dir}.")
+        return convert_json_library(json_path, library_path)
+
+    def read_thumbnail_atlas(self, library, size=None):
+        """Opens the thumbnail atlas of the library for a thumbnail size.
+           A square size that is a level of the thumbnail pyramid is read from
+           that level. Otherwise, if the atlas does not exist yet, or is out of
+           date with the library, it is resized from the closest pyramid level,
+           or built from the thumbnail files if the library has no pyramid.
+
+           Args:
+               library: (SourceLibrary) the source library
+               size: (tuple) Optional. (width, height) of the thumbnails.
+                             Default: the thumbnail size
+
+           Returns:
+               (ThumbnailAtlas) the thumbnail atlas
+        """
+
+        size = tuple(size or self.size)
+        pyramid = ThumbnailPyramid(library.path, self.pyramid_levels)
+        if size[0] == size[1] and size[0] in pyramid.atlases and \
+                len(pyramid.atlases[size[0]]) == len(library):
+            return pyramid.atlases[size[0]]
+        atlas_path = atlas_path_for(library.path, size)
+        if os.path.isfile(atlas_path) and os.path.getmtime(atlas_path) >= os.path.getmtime(library.path):
+            atlas = ThumbnailAtlas(atlas_path)
+            if len(atlas) == len(library) and atlas.size == size:
+                return atlas
+        level = pyramid.level_for(size)
+        if level is not None and len(pyramid.atlases[level]) == len(library):
+            print(f"Building thumbnail atlas {atlas_path} from pyramid level {level}")
+            with self.metrics.timer("atlas_build"):
+                atlas = ThumbnailAtlas.build(atlas_path, range(len(library)), size,
+                                             loader=pyramid.atlases[level].image)
+        else:
+            print(f"Building thumbnail atlas {atlas_path}")
+            with self.metrics.timer("atlas_build"):
+                atlas = ThumbnailAtlas.build(atlas_path, library.names, size)
+            self.metrics.count("thumbnail_opens", len(library))
+        self.metrics.count("bytes_written", os.path.getsize(atlas_path))
+        return atlas
+
+    def read_color_lut(self, library, bins=32):
+        """Opens the color LUT of the library. If it does not exist yet, or is
+           out of date with the library, it is built and its build time, size
+           and error are reported.
+
+           Args:
+               library: (SourceLibrary) the source library
+               bins: (int) Optional. Number of bins per RGB channel. Default: 32
+
+           Returns:
+               (ColorLUT) the color LUT
+        """
+
+        lut_path = lut_path_for(library.path, bins)
+        if os.path.isfile(lut_path) and os.path.getmtime(lut_path) >= os.path.getmtime(library.path):
+            lut = ColorLUT(lut_path)
+            if lut.count == len(library) and lut.bins == bins:
+                return lut
+        print(f"Building color LUT {lut_path}")
+        with self.metrics.timer("lut_build"):
+            lut = ColorLUT.build(lut_path, library.colors, bins)
+        self.metrics.count("bytes_written", os.path.getsize(lut_path))
+        print(lut.report())
+        return lut
+
+    def read_descriptor_library(self, library, cells=2, size=None, chunk=1024):
+        """Opens the library of cells x cells sub-cell color descriptors of the
+           thumbnails, see cell_descriptors. If it does not exist yet, or is
+           out of date with the library, it is built from the thumbnail atlas
+           of the piece size, the thumbnails the mosaic is assembled from,
+           chunk thumbnails at a time.
+
+           Args:
+               library: (SourceLibrary) the source library
+               cells: (int) Optional. Sub-cells along each side. Default: 2
+               size: (tuple) Optional. (width, height) of the pieces.
+                             Default: the thumbnail size
+               chunk: (int) Optional. Thumbnails described at once. Default: 1024
+
+           Returns:
+               (SourceLibrary) the descriptors, cells * cells * 3 values for
+               each entry of the library, in library order
+        """
+
+        size = tuple(size or self.size)
+        descriptor_path = descriptor_library_path_for(library.path, cells, size)
+        if os.path.isfile(descriptor_path) and \
+                os.path.getmtime(descriptor_path) >= os.path.getmtime(library.path):
+            descriptors = SourceLibrary(descriptor_path)
+            if len(descriptors) == len(library) and descriptors.dims == cells * cells * 3:
+                return descriptors
+        print(f"Building descriptor library {descriptor_path}")
+        atlas = self.read_thumbnail_atlas(library, size)
+        width, height = atlas.size
+        with self.metrics.timer("descriptor_build"), \
+                SourceLibraryWriter(descriptor_path, dims=cells * cells * 3) as writer:
+            for start in range(0, len(library), chunk):
+                thumbnails = atlas.thumbnails[start:start + chunk]
+                described = cell_descriptors(thumbnails, width, height, cells).reshape(len(thumbnails), -1)
+                for row, descriptor in enumerate(described, start):
+                    writer.append(library.names[row], descriptor)
+        self.metrics.count("bytes_written", os.path.getsize(descriptor_path))
+        return SourceLibrary(descriptor_path)
+
+    def library_path(self):
+        """Returns the location of the binary source library."""
+        return f"{self.default_img_dir}img_jsons/" + self.img_dir + ".lib"
+
     def read_from_existing_json_file(self):
         """Checks to see if the json file exists, and its corresponding
            thumbnails exist as well.
@@ -114,16 +456,8 @@ class SourceImageProcessor(object):
     
     def create_img_subdirs(self):
         path = f"{self.default_img_dir}{self.img_dir}"
-        if not os.path.exists(path):
-            p = subprocess.Popen(f"mkdir "+path, shell=True)
-            p.wait()
-        if not os.path.exists(f"{self.default_img_dir}img_jsons"):
-            p = subprocess.Popen(f"mkdir {self.default_img_dir}img_jsons",
-                                 shell=True)
-            p.wait()
-        if not os.path.exists(path+f"/thumbnails"):
-            p = subprocess.Popen(f"mkdir "+path+f"/thumbnails", shell=True)
-            p.wait()
+        os.makedirs(f"{self.default_img_dir}img_jsons", exist_ok=True)
+        os.makedirs(path + "/thumbnails", exist_ok=True)
 
     def save_avg_colors_to_json(self):
         source_img_dict = [self.collect_avg_colors_for_source_imgs()]
@@ -134,35 +468,226 @@ class SourceImageProcessor(object):
         """For each thumbnail of the source image, calculate its average color
            and store it into a dictionary, saved as a JSON file."""
 
-        trimmed_thumbnails = self.standardize_source_images()
-        source_img_dict = {}
-        for img_class, img in trimmed_thumbnails.items():
-            if img_class.name not in source_img_dict:
-                try:
-                    source_img_dict[img_class.name] = img_class.get_avg_color(img)
-                except TypeError:
-                    pass
-        return source_img_dict
-
-    def standardize_source_images(self): 
+        return dict(self.standardize_source_images())
+
+    def build_source_library(self, progress=print_progress):
+        """Builds the binary source library from scratch as a streaming
+           pipeline: the source images are scanned, decoded, trimmed,
+           thumbnailed and averaged a bounded window at a time, and each
+           result is appended to the library file as soon as it arrives.
+
+           Args:
+               progress: (function) called with the number of processed and
+                                    total source images. Default: print_progress
+
+           Returns:
+               (SourceLibrary) the source library
+        """
+
+        return self.refresh_source_library(progress, rebuild=True)
+
+    def refresh_source_library(self, progress=print_progress, rebuild=False):
+        """Brings the binary source library up to date with the source image
+           directory. Each source image is compared with the manifest by size
+           and modification time, and by content hash if those changed. Only
+           added or modified images are processed; unchanged images keep their
+           library entry and pyramid thumbnails, and deleted images are
+           dropped along with their thumbnails. The counts are kept in
+           refresh_summary.
+
+           Args:
+               progress: (function) called with the number of processed and
+                                    total changed source images.
+                                    Default: print_progress
+               rebuild: (boolean) ignores the existing library and manifest.
+                                  Default: False
+
+           Returns:
+               (SourceLibrary) the source library
+        """
+
+        library_path = self.library_path()
+        old_manifest = {}
+        if not rebuild and os.path.isfile(library_path):
+            old_manifest = self.read_manifest()
+        rows, has_pyramid = {}, False
+        if old_manifest:
+            old_library = SourceLibrary(library_path)
+            rows = {name: i for i, name in enumerate(old_library.names)}
+            old_pyramid = ThumbnailPyramid(library_path, self.pyramid_levels)
+            has_pyramid = old_pyramid.is_complete(len(old_library), self.pyramid_levels)
+
+        scan_started = time.perf_counter()
+        manifest, changed = {}, []
+        summary = {"added": 0, "modified": 0, "deleted": 0, "unchanged": 0}
+        for filename in self.list_source_images():
+            stat = os.stat(filename)
+            entry = old_manifest.get(filename)
+            if entry and entry["thumbnail"] in rows and os.path.isfile(entry["thumbnail"]):
+                unchanged = (entry["size"], entry["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns)
+                if unchanged or entry["sha1"] == file_digest(filename):
+                    manifest[filename] = dict(entry, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                    summary["unchanged"] += 1
+                    continue
+            manifest[filename] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                                  "sha1": file_digest(filename),
+                                  "thumbnail": self.thumbnail_name(filename)}
+            summary["modified" if entry else "added"] += 1
+            changed.append(filename)
+            self.metrics.count("bytes_read", stat.st_size)
+
+        for filename in set(old_manifest) - set(manifest):
+            thumbnail_name = old_manifest[filename]["thumbnail"]
+            if os.path.isfile(thumbnail_name):
+                os.remove(thumbnail_name)
+            summary["deleted"] += 1
+        self.metrics.add_time("scan", time.perf_counter() - scan_started)
+
+        process_started = time.perf_counter()
+        changed_filenames, changed = changed, set(changed)
+        with ThumbnailPyramidWriter(library_path, self.pyramid_levels) as pyramid, \
+                SourceLibraryWriter(library_path) as writer:
+            processed = self.standardize_source_images(progress, changed_filenames, pyramid)
+            for filename, entry in manifest.items():
+                if filename in changed:
+                    writer.append(*next(processed))
+                    continue
+                row = rows[entry["thumbnail"]]
+                if has_pyramid:
+                    pyramid.append(old_pyramid.arrays(row, self.pyramid_levels))
+                else:
+                    pyramid.append(pyramid_arrays(open_thumbnail(entry["thumbnail"]), self.pyramid_levels))
+                    self.metrics.count("thumbnail_opens")
+                writer.append(entry["thumbnail"], old_library.colors[row])
+        with open(self.manifest_path(), "w") as out:
+            json.dump(manifest, out)
+        self.metrics.add_time("process_source_images", time.perf_counter() - process_started)
+        for path in [library_path] + [pyramid_path_for(library_path, level)
+                                      for level in self.pyramid_levels]:
+            if os.path.isfile(path):
+                self.metrics.count("bytes_written", os.path.getsize(path))
+        for change, images in summary.items():
+            self.metrics.count(f"source_images_{change}", images)
+
+        self.refresh_summary = summary
+        print(f"Refreshed {library_path}: {summary['added']} added, {summary['modified']} modified, "
+              f"{summary['deleted']} deleted, {summary['unchanged']} unchanged.")
+        if self.decode_report.images:
+            print(self.decode_report)
+        return SourceLibrary(library_path)
+
+    def read_manifest(self):
+        """Reads the manifest of the source images in the library.
+
+           Returns:
+               (dict) size, mtime_ns, sha1 and thumbnail name of each source
+               image, keyed by file name. Empty if there is no manifest.
+        """
+
+        try:
+            with open(self.manifest_path(), "r") as manifest_file:
+                return json.load(manifest_file)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def manifest_path(self):
+        """Returns the location of the source image manifest."""
+        return f"{self.default_img_dir}img_jsons/" + self.img_dir + ".manifest.json"
+
+    def standardize_source_images(self, progress=None, filenames=None, pyramid=None):
         """Standardize the source images into "square" thumbnails. This is
-           easier to work with in PIL."""
+           easier to work with in PIL. Each source image is processed by
+           process_source_image, in a pool of worker processes if workers is
+           greater than 1. The results are consumed in sorted file name
+           order, so the thumbnails and colors do not depend on the number of
+           workers. Only the thumbnail being saved is held in memory here.
+
+           Args:
+               progress: (function) Optional. Called with the number of
+                                    processed and total source images.
+               filenames: (list) Optional. The source images to process.
+                                 Default: every image in the directory
+               pyramid: (ThumbnailPyramidWriter) Optional. Receives the
+                                                 pyramid thumbnails of each
+                                                 image before it is yielded.
+
+           Yields:
+               (string, tuple) the thumbnail name and its average color
+        """
+
+        if filenames is None:
+            filenames = self.list_source_images()
+        results = self.process_source_images(filenames, pyramid.levels if pyramid is not None else ())
+        for done, (filename, color, thumbnail_bytes, arrays, decode_stats) in enumerate(results, 1):
+            self.decode_report.add(decode_stats)
+            if pyramid is not None:
+                pyramid.append(arrays)
+            thumbnail_name = self.thumbnail_name(filename)
+            with open(thumbnail_name, "wb") as out:
+                out.write(thumbnail_bytes)
+            self.metrics.count("source_images_processed")
+            self.metrics.count("bytes_written", len(thumbnail_bytes))
+            if progress:
+                progress(done, len(filenames))
+            yield thumbnail_name, color
+
+    def process_source_images(self, filenames, levels=()):
+        """Runs process_source_image over the source images. With more than
+           one worker, the images are handed out chunksize at a time and at
+           most two chunks per worker are in flight, which bounds the number
+           of images held in memory.
 
-        output = {}
-        for img_class in self.get_images_from_img_dir():
-            thumbnail_name = f"{self.default_img_dir}{self.img_dir}/thumbnails/" + self.trim_name(img_class) + "_thumbnail.jpg"
-            width, height = img_class.img.size
-            trimmed_img = img_class.img
-            trimmed_img = trim_width(img_class.img, width, height)
-            trimmed_img = trim_height(img_class.img, width, height)
-            thumbnail = trimmed_img.thumbnail(self.size)
-            if not os.path.exists(f"{thumbnail_name}.png"):
+           Args:
+               filenames: (list) file names of the source images
+               levels: (tuple) Optional. Pyramid levels to resize each image
+                                to. Default: none
 
-                # the trimmed thumbnail will be used for our img
-                trimmed_img.save(thumbnail_name, "png")
+           Yields:
+               (string, tuple, bytes, list, tuple) the file name, average
+               color, PNG encoded thumbnail, pyramid arrays and decode stats
+               of each source image, in order
+        """
 
-            output[BaseImage(thumbnail_name)] = trimmed_img
-        return output
+        every = self.sample_full_decode_every
+        tasks = ((filename, self.size, self.draft_decode, bool(every) and i > 0 and i % every == 0, levels)
+                 for i, filename in enumerate(filenames))
+        if self.workers == 1:
+            yield from map(process_source_image, tasks)
+            return
+
+        chunks = iter(lambda: list(itertools.islice(tasks, self.chunksize)), [])
+        with multiprocessing.Pool(self.workers) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(process_source_image_chunk, (chunk,)))
+                if len(pending) >= 2 * self.workers:
+                    yield from pending.popleft().get()
+            while pending:
+                yield from pending.popleft().get()
+
+    def list_source_images(self):
+        """Lists the source images of the image directory in sorted order.
+           Ignore any non-images when searching the source image dir.
+
+           Returns:
+               (list) file names of the source images
+
+            Raises:
+                ValueError: if there are no pictures in the folder
+        """
+
+        search_dir = self.img_dir
+        if self.is_from_img_sets:
+            search_dir = f"{self.default_img_dir}{self.img_dir}"
+        filenames = [search_dir + "/" + fn for fn in sorted(os.listdir(search_dir))
+                     if fn.endswith(".jpg") or fn.endswith(".png") or fn.endswith(".jpeg")]
+        if not filenames:
+            raise ValueError("There are no pictures in the folder, {}.".format(search_dir))
+        return filenames
+
+    def thumbnail_name(self, filename):
+        """Returns the thumbnail file name for a source image."""
+        return f"{self.default_img_dir}{self.img_dir}/thumbnails/" + self.trim_name(filename) + "_thumbnail.jpg"
 
     def get_images_from_img_dir(self):
         """Retrieves each image from the image directory. Ignore any non-images
@@ -175,26 +700,44 @@ class SourceImageProcessor(object):
                 ValueError: if there are no pictures in the folder
            """
 
-        search_dir = self.img_dir
-        if self.is_from_img_sets:
-            search_dir = f"{self.default_img_dir}{self.img_dir}"
-        for fn in os.listdir(search_dir):
-            if fn.endswith(".jpg") or fn.endswith(".png") or fn.endswith(".jpeg"):
-                yield BaseImage(search_dir + "/" + fn)
-        raise ValueError("There are no pictures in the folder, {}.".format(search_dir))
+        for filename in self.list_source_images():
+            yield BaseImage(filename)
 
-    def trim_name(self, img_class):
+    def trim_name(self, filename):
         """Shortens file name.
 
            Args:
-               img_class: (string) name of the image class
+               filename: (string) name of the source image file
 
             Returns:
                 (string) shortened name
          """
 
         replacements = [(self.img_dir, ""), ("/", ""), ("img_sets", "")]
-        new_name = img_class.name
+        new_name = filename
         for old, new in replacements:
             new_name = re.sub(old, new, new_name)
         return new_name
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds or refreshes the source "
+                                                 "library of an image directory")
+    parser.add_argument("--directory", help="enter the source input directory", type=str, required=True)
+    parser.add_argument("--size", help="enter the thumbnail size", type=int, default=25)
+    parser.add_argument("--workers", help="enter the number of worker processes", type=int, default=1)
+    parser.add_argument("--levels", help="enter the thumbnail pyramid sizes", type=int, nargs="*",
+                        default=PYRAMID_LEVELS)
+    parser.add_argument("--rebuild", help="reprocess every source image", action="store_true")
+    parser.add_argument("--full-decode", help="always decode source images at full resolution",
+                        action="store_true")
+    args = parser.parse_args()
+
+    s_img_p = SourceImageProcessor(args.directory, (args.size, args.size), workers=args.workers,
+                                   draft_decode=not args.full_decode, pyramid_levels=args.levels)
+    s_img_p.create_img_subdirs()
+    s_img_p.refresh_source_library(rebuild=args.rebuild)
+
+
+if __name__ == "__main__":
+    main()
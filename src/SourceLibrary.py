@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+"""In this script, the source image colors are stored in a binary library file."""
+
+import os
+import json
+import shutil
+import struct
+import argparse
+import tempfile
+
+import numpy as np
+
+from utils.validation_util import validate_json_data
+
+MAGIC = b"PMLIB\x00\x00\x00"
+VERSION = 1
+
+# magic, version, dims, count, colors offset, name offsets offset, names offset
+HEADER = struct.Struct("<8sIIQQQQ")
+OFFSET = struct.Struct("<Q")
+COLOR_DTYPE = np.dtype("<f4")
+
+
+def _aligned(position, alignment=8):
+    return -(-position // alignment) * alignment
+
+
+class NameTable(object):
+    """NameTable is a read-only sequence over the offset-indexed names of a
+       SourceLibrary. A name is only decoded when it is looked up.
+
+       Attributes:
+           offsets: (numpy.ndarray) (count + 1) byte offsets into the blob
+           blob: (numpy.memmap) UTF-8 encoded names, back to back
+    """
+
+    def __init__(self, offsets, blob):
+        """Initializes NameTable with offsets and blob."""
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Error. Library index out of range.")
+        return self.blob[int(self.offsets[i]):int(self.offsets[i + 1])].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class SourceLibrary(object):
+    """SourceLibrary opens a binary source library file. The file holds a
+       small header, a packed float32 (count, dims) array of the average
+       colors, and a name table of (count + 1) uint64 offsets followed by the
+       UTF-8 thumbnail names. The whole file is memory-mapped, so opening a
+       library only reads the header and the colors and names are paged in
+       as they are used.
+
+       Attributes:
+           path: (string) the library file
+           dims: (int) number of values describing each source image
+           colors: (numpy.ndarray) memory-mapped (count, dims) float32 colors
+           names: (NameTable) the thumbnail names, in library order
+    """
+
+    def __init__(self, path):
+        """Initializes SourceLibrary by memory-mapping the library file."""
+        self.path = path
+        self._data = np.memmap(path, dtype=np.uint8, mode="r")
+        if len(self._data) < HEADER.size:
+            raise ValueError(f"Error. {path} is not a source library.")
+        magic, version, self.dims, count, colors_at, offsets_at, names_at = \
+            HEADER.unpack(self._data[:HEADER.size].tobytes())
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Error. {path} is not a version {VERSION} source library.")
+
+        colors_end = colors_at + count * self.dims * COLOR_DTYPE.itemsize
+        self.colors = self._data[colors_at:colors_end].view(COLOR_DTYPE).reshape(count, self.dims)
+        offsets = self._data[offsets_at:offsets_at + (count + 1) * OFFSET.size].view("<u8")
+        self.names = NameTable(offsets, self._data[names_at:])
+
+    def __len__(self):
+        return len(self.colors)
+
+    def __getitem__(self, i):
+        return self.names[i], tuple(self.colors[i].tolist())
+
+    def to_json_data(self):
+        """Returns the library as a {thumbnail name: color} dictionary."""
+        return {name: list(map(float, color)) for name, color in zip(self.names, self.colors)}
+
+    @staticmethod
+    def write(path, names, colors):
+        """Writes the names and colors to a new library file.
+
+           Args:
+               path: (string) the library file
+               names: (iterable) the thumbnail names
+               colors: (iterable) the color for each name
+        """
+
+        colors = np.asarray(colors, dtype=np.float64)
+        with SourceLibraryWriter(path, dims=colors.shape[1] if colors.ndim == 2 else 3) as writer:
+            for name, color in zip(names, colors):
+                writer.append(name, color)
+
+
+class SourceLibraryWriter(object):
+    """SourceLibraryWriter appends (name, color) entries to a new library file
+       one at a time. The colors, offsets and names are spilled to temporary
+       files while appending, so memory stays constant however many entries
+       are written. The library file is assembled on close and moved into
+       place atomically.
+
+       Attributes:
+           path: (string) the library file
+           dims: (int) number of values describing each source image. Default: 3
+           count: (int) number of entries appended so far
+    """
+
+    def __init__(self, path, dims=3):
+        """Initializes SourceLibraryWriter with path and dims."""
+        self.path = path
+        self.dims = dims
+        self.count = 0
+        self._name_bytes = 0
+        self._colors = tempfile.TemporaryFile()
+        self._offsets = tempfile.TemporaryFile()
+        self._names = tempfile.TemporaryFile()
+        self._offsets.write(OFFSET.pack(0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def append(self, name, color):
+        """Appends one source image to the library.
+
+           Args:
+               name: (string) the thumbnail name
+               color: (tuple) the average color of the thumbnail
+
+           Raises:
+               ValueError: if the color does not have dims values
+        """
+
+        color = np.asarray(color, dtype=COLOR_DTYPE)
+        if color.shape != (self.dims,):
+            raise ValueError(f"Error. Color {color} does not have {self.dims} values.")
+        encoded = name.encode("utf-8")
+        self._colors.write(color.tobytes())
+        self._names.write(encoded)
+        self._name_bytes += len(encoded)
+        self._offsets.write(OFFSET.pack(self._name_bytes))
+        self.count += 1
+
+    def close(self):
+        """Assembles the library file from the spilled entries."""
+
+        colors_at = _aligned(HEADER.size)
+        offsets_at = _aligned(colors_at + self.count * self.dims * COLOR_DTYPE.itemsize)
+        names_at = offsets_at + (self.count + 1) * OFFSET.size
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as out:
+            out.write(HEADER.pack(MAGIC, VERSION, self.dims, self.count,
+                                  colors_at, offsets_at, names_at))
+            for position, spill in ((colors_at, self._colors), (offsets_at, self._offsets),
+                                    (names_at, self._names)):
+                out.write(b"\x00" * (position - out.tell()))
+                spill.seek(0)
+                shutil.copyfileobj(spill, out)
+        os.replace(tmp_path, self.path)
+        self.abort()
+
+    def abort(self):
+        """Discards the spilled entries without writing the library."""
+        for spill in (self._colors, self._offsets, self._names):
+            spill.close()
+
+
+def library_path_for(json_path):
+    """Returns the library file that sits next to a JSON (.txt) file."""
+    return os.path.splitext(json_path)[0] + ".lib"
+
+
+def descriptor_library_path_for(library_path, cells, size):
+    """Returns the library file of the cells x cells descriptors of a library
+       file, taken from thumbnails of a (width, height) size."""
+    width, height = size
+    return f"{os.path.splitext(library_path)[0]}_cells{cells}_{width}x{height}.lib"
+
+
+def convert_json_library(json_path, library_path=None):
+    """Converts an existing img_jsons/*.txt JSON file to a library file.
+
+       Args:
+           json_path: (string) the JSON file
+           library_path: (string) Optional. The library file to write.
+                                  Default: the JSON file name with .lib
+
+       Returns:
+           (SourceLibrary) the converted library
+    """
+
+    library_path = library_path or library_path_for(json_path)
+    with open(json_path, "r") as json_file:
+        json_data = json.load(json_file)[0]
+    validate_json_data(json_data)
+    SourceLibrary.write(library_path, json_data.keys(), list(json_data.values()))
+    return SourceLibrary(library_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Converts img_jsons/*.txt JSON "
+                                                 "files to binary source libraries")
+    parser.add_argument("json_files", nargs="+", help="enter the JSON files to convert")
+    args = parser.parse_args()
+    for json_path in args.json_files:
+        library = convert_json_library(json_path)
+        print(f"Converted {len(library)} entries from {json_path} to {library.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""In this script, the source thumbnails are stored in a single atlas file."""
+
+import os
+import struct
+
+import numpy as np
+from PIL import Image
+
+from ThumbnailCache import open_thumbnail
+
+MAGIC = b"PMATLAS\x00"
+VERSION = 1
+
+# magic, version, count, height, width, channels, data offset
+HEADER = struct.Struct("<8sIQIIIQ")
+DATA_OFFSET = 64
+
+
+def atlas_path_for(library_path, size):
+    """Returns the atlas file for a library file and thumbnail size."""
+    width, height = size
+    return f"{os.path.splitext(library_path)[0]}_{width}x{height}.atlas"
+
+
+def thumbnail_to_array(thumbnail, size):
+    """Converts a thumbnail into a (height, width, 3) uint8 array of the
+       given (width, height) size. Thumbnails of a different size are resized."""
+
+    if thumbnail.mode != "RGB":
+        thumbnail = thumbnail.convert("RGB")
+    if thumbnail.size != tuple(size):
+        thumbnail = thumbnail.resize(tuple(size), Image.LANCZOS)
+    return np.asarray(thumbnail, dtype=np.uint8)
+
+
+class ThumbnailAtlas(object):
+    """ThumbnailAtlas opens an atlas file holding every thumbnail of a source
+       library, of a single size, as one contiguous uncompressed
+       (count, height, width, 3) uint8 array. The thumbnails are in library
+       order, so the thumbnail of a library entry is a slice of the
+       memory-mapped array instead of a file to open and decode.
+
+       Attributes:
+           path: (string) the atlas file
+           size: (tuple) (width, height) of the thumbnails
+           thumbnails: (numpy.ndarray) memory-mapped (count, height, width, 3) array
+    """
+
+    def __init__(self, path):
+        """Initializes ThumbnailAtlas by memory-mapping the atlas file."""
+        self.path = path
+        data = np.memmap(path, dtype=np.uint8, mode="r")
+        if len(data) < DATA_OFFSET:
+            raise ValueError(f"Error. {path} is not a thumbnail atlas.")
+        magic, version, count, height, width, channels, data_at = \
+            HEADER.unpack(data[:HEADER.size].tobytes())
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Error. {path} is not a version {VERSION} thumbnail atlas.")
+        self.size = (width, height)
+        self.thumbnails = data[data_at:data_at + count * height * width * channels].reshape(
+            count, height, width, channels)
+
+    def __len__(self):
+        return len(self.thumbnails)
+
+    def __getitem__(self, i):
+        return self.thumbnails[i]
+
+    def image(self, i):
+        """Returns the thumbnail of library entry i as a PIL image."""
+        return Image.fromarray(np.ascontiguousarray(self.thumbnails[i]))
+
+    @staticmethod
+    def build(path, names, size, loader=open_thumbnail):
+        """Builds an atlas from the thumbnail files of a library.
+
+           Args:
+               path: (string) the atlas file
+               names: (iterable) the thumbnail names, in library order
+               size: (tuple) (width, height) of the thumbnails
+               loader: (function) decodes the thumbnail for a name.
+                                  Default: open_thumbnail
+
+           Returns:
+               (ThumbnailAtlas) the atlas
+        """
+
+        with ThumbnailAtlasWriter(path, size) as writer:
+            for name in names:
+                writer.append(loader(name))
+        return ThumbnailAtlas(path)
+
+
+class ThumbnailAtlasWriter(object):
+    """ThumbnailAtlasWriter appends thumbnails to a new atlas file one at a
+       time. The count in the header is filled in on close and the file is
+       moved into place atomically.
+
+       Attributes:
+           path: (string) the atlas file
+           size: (tuple) (width, height) of the thumbnails
+           count: (int) number of thumbnails appended so far
+    """
+
+    def __init__(self, path, size):
+        """Initializes ThumbnailAtlasWriter with path and size."""
+        self.path = path
+        self.size = tuple(size)
+        self.count = 0
+        self._tmp_path = path + ".tmp"
+        self._out = open(self._tmp_path, "wb")
+        self._out.write(b"\x00" * DATA_OFFSET)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def append(self, thumbnail):
+        """Appends a thumbnail, given as a PIL image or uint8 array."""
+        if isinstance(thumbnail, Image.Image):
+            thumbnail = thumbnail_to_array(thumbnail, self.size)
+        width, height = self.size
+        if thumbnail.shape != (height, width, 3):
+            raise ValueError(f"Error. Thumbnail shape {thumbnail.shape} does not match the atlas.")
+        self._out.write(np.ascontiguousarray(thumbnail, dtype=np.uint8).tobytes())
+        self.count += 1
+
+    def close(self):
+        """Writes the header and moves the atlas file into place."""
+        width, height = self.size
+        self._out.seek(0)
+        self._out.write(HEADER.pack(MAGIC, VERSION, self.count, height, width, 3, DATA_OFFSET))
+        self._out.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        """Discards the atlas file."""
+        self._out.close()
+        os.remove(self._tmp_path)
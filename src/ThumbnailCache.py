@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""In this script, decoded source thumbnails are cached in memory."""
+
+from collections import OrderedDict
+
+from PIL import Image
+
+# 256 MiB of decoded thumbnails
+DEFAULT_CACHE_BYTES = 256 * 2 ** 20
+
+
+def open_thumbnail(name):
+    """Opens and decodes the thumbnail saved under the file name."""
+    with Image.open(name) as image:
+        image.load()
+        return image
+
+
+def thumbnail_nbytes(thumbnail):
+    """Approximates the memory used by a decoded thumbnail."""
+    width, height = thumbnail.size
+    return width * height * len(thumbnail.getbands())
+
+
+class ThumbnailCache(object):
+    """ThumbnailCache keeps decoded source thumbnails in memory so a popular
+       thumbnail is only opened and decoded from disk once instead of once
+       for every region it is matched to. Thumbnails are keyed by their
+       library entry and evicted in least-recently-used order once the
+       decoded thumbnails exceed max_bytes. The hits, misses and evictions
+       are counted so the cache can be sized.
+
+       Attributes:
+           max_bytes: (int) memory budget for the decoded thumbnails.
+                            Default: 256 MiB
+           loader: (function) decodes the thumbnail for a key.
+                              Default: open_thumbnail
+           hits: (int) number of lookups served from memory
+           misses: (int) number of lookups that decoded a thumbnail
+           evictions: (int) number of thumbnails dropped from memory
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES, loader=open_thumbnail):
+        """Initializes ThumbnailCache with max_bytes and loader."""
+        if max_bytes < 0:
+            raise ValueError("Error. Cache size cannot be negative.")
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.current_bytes = 0
+        self._thumbnails = OrderedDict()
+
+    def __len__(self):
+        return len(self._thumbnails)
+
+    def __contains__(self, key):
+        return key in self._thumbnails
+
+    def get(self, key):
+        """Retrieves the decoded thumbnail for the library entry, decoding
+           and caching it on a miss.
+
+           Args:
+               key: the library entry, e.g. the thumbnail file name
+
+           Returns:
+               (PIL.image) the decoded thumbnail
+        """
+
+        if key in self._thumbnails:
+            self.hits += 1
+            self._thumbnails.move_to_end(key)
+            return self._thumbnails[key][0]
+
+        self.misses += 1
+        thumbnail = self.loader(key)
+        nbytes = thumbnail_nbytes(thumbnail)
+        if nbytes <= self.max_bytes:
+            self._thumbnails[key] = (thumbnail, nbytes)
+            self.current_bytes += nbytes
+            self._evict()
+        return thumbnail
+
+    def _evict(self):
+        """Drops least recently used thumbnails until within max_bytes."""
+        while self.current_bytes > self.max_bytes:
+            _, (_, nbytes) = self._thumbnails.popitem(last=False)
+            self.current_bytes -= nbytes
+            self.evictions += 1
+
+    def clear(self):
+        """Drops every cached thumbnail. The counters are kept."""
+        self._thumbnails.clear()
+        self.current_bytes = 0
+
+    def stats(self):
+        """Returns the cache counters as a dictionary."""
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._thumbnails),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes}
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""In this script, the source thumbnails are stored at several resolutions."""
+
+import os
+
+from ThumbnailAtlas import ThumbnailAtlas, ThumbnailAtlasWriter, thumbnail_to_array
+
+# square thumbnail sizes of the pyramid levels
+PYRAMID_LEVELS = (8, 16, 25, 32, 50, 64)
+
+
+def pyramid_path_for(library_path, level):
+    """Returns the atlas file of a pyramid level of a library file. Levels
+       are named apart from the atlases of atlas_path_for, which may have
+       been resized from another size, so those are never read as a level."""
+    return f"{os.path.splitext(library_path)[0]}_level{level}.atlas"
+
+
+def pyramid_arrays(img, levels=PYRAMID_LEVELS):
+    """Resizes a trimmed source image to every pyramid level.
+
+       Args:
+           img: (PIL.image) the trimmed source image
+           levels: (tuple) square thumbnail sizes. Default: PYRAMID_LEVELS
+
+       Returns:
+           (list) (level, level, 3) uint8 arrays, one per level
+    """
+
+    return [thumbnail_to_array(img, (level, level)) for level in levels]
+
+
+class ThumbnailPyramid(object):
+    """ThumbnailPyramid opens the pyramid of a source library: one square
+       ThumbnailAtlas ("[LIBRARY]_level[L].atlas") for each level, all in
+       library order. The levels are written while the library is built, so
+       the source images are only decoded once, and each is resized straight
+       from the source image. A mosaic of any piece size
+       reads its thumbnails from the smallest level that is at least as large
+       as the piece, instead of reprocessing the source images.
+
+       Attributes:
+           library_path: (string) the library file
+           atlases: (dict) ThumbnailAtlas of each level that is up to date
+                           with the library
+    """
+
+    def __init__(self, library_path, levels=PYRAMID_LEVELS):
+        """Initializes ThumbnailPyramid by opening the level atlases that are
+           not older than the library file."""
+        self.library_path = library_path
+        self.atlases = {}
+        for level in levels:
+            path = pyramid_path_for(library_path, level)
+            if os.path.isfile(path) and os.path.getmtime(path) >= os.path.getmtime(library_path):
+                self.atlases[level] = ThumbnailAtlas(path)
+
+    @property
+    def levels(self):
+        return sorted(self.atlases)
+
+    def is_complete(self, count, levels=PYRAMID_LEVELS):
+        """Checks that every level exists and holds count thumbnails."""
+        return all(level in self.atlases and len(self.atlases[level]) == count for level in levels)
+
+    def level_for(self, size):
+        """Chooses the level to resize thumbnails of a (width, height) size
+           from: the smallest level covering both sides, or else the largest.
+
+           Returns:
+               (int) the level, or None if the pyramid has no levels
+        """
+
+        if not self.atlases:
+            return None
+        covering = [level for level in self.levels if level >= max(size)]
+        return covering[0] if covering else self.levels[-1]
+
+    def arrays(self, i, levels=PYRAMID_LEVELS):
+        """Returns the thumbnails of library entry i at each level."""
+        return [self.atlases[level][i] for level in levels]
+
+
+class ThumbnailPyramidWriter(object):
+    """ThumbnailPyramidWriter appends the thumbnails of each source image to
+       every level atlas of a new pyramid.
+
+       Attributes:
+           library_path: (string) the library file
+           levels: (tuple) square thumbnail sizes
+    """
+
+    def __init__(self, library_path, levels=PYRAMID_LEVELS):
+        """Initializes ThumbnailPyramidWriter with library_path and levels."""
+        self.library_path = library_path
+        self.levels = tuple(levels)
+        self._writers = [ThumbnailAtlasWriter(pyramid_path_for(library_path, level), (level, level))
+                         for level in self.levels]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def append(self, arrays):
+        """Appends the thumbnails of one source image, one array per level."""
+        for writer, array in zip(self._writers, arrays):
+            writer.append(array)
+
+    def close(self):
+        for writer in self._writers:
+            writer.close()
+
+    def abort(self):
+        for writer in self._writers:
+            writer.abort()
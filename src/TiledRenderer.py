@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""In this script, a mosaic is rendered band by band with bounded memory."""
+
+import numpy as np
+from PIL import Image
+
+from ColorIndex import ColorIndex
+from DescriptorIndex import DescriptorIndex
+from SourceImageProcessor import SourceImageProcessor
+from utils.assembly import assemble_grid
+from utils.matching import batched_nearest, DEFAULT_MEMORY_BUDGET
+from utils.region_stats import mean_colors_for_grid, cell_descriptors
+from utils.streaming_io import iter_image_bands, StreamingPNGWriter
+
+
+class TiledRenderer(object):
+    """TiledRenderer creates a mosaic without ever holding the whole input
+       image or the whole mosaic in memory, which PhotoMosaic does. The input
+       image is read a band of band_rows rows of pieces at a time. The average
+       colors and matches are calculated for that band only, the band of the
+       mosaic is assembled from the thumbnail atlas and it is appended to the
+       output PNG before the next band is read. Peak memory is therefore set
+       by the band height rather than the size of the image, except that a
+       compressed input such as JPEG or PNG is decoded whole by PIL once,
+       though never copied whole into an array (see iter_image_bands). The
+       source library, the thumbnail atlas and the color index are loaded
+       once and can be reused for many renders.
+
+       Attributes:
+           directory: (string) image directory
+           piece_width: (int) the width of the box region. Default: 25
+           piece_height: (int) the height of the box region. Default: 25
+           band_rows: (int) number of rows of pieces in each band. Default: 8
+           match_mode: (string) "index", "batched" or "lut". Default: "index"
+           lut_bins: (int) bins per RGB channel of the color LUT. Default: 32
+           memory_budget: (int) bytes for one chunk of batched distances.
+                                Default: 64 MiB
+           default_img_dir: (string) Optional. Describes the default image
+                                     directory. Default: img_sets
+           cells: (int) sub-cells along each side of the region and thumbnail
+                        descriptors. Default: 1, the average color
+    """
+
+    def __init__(self, directory, piece_width=25, piece_height=25, band_rows=8,
+                 match_mode="index", lut_bins=32, memory_budget=DEFAULT_MEMORY_BUDGET,
+                 default_img_dir="img_sets", cells=1):
+        """Initializes TiledRenderer and loads the source library, thumbnail
+           atlas and color index or color LUT."""
+        if band_rows < 1:
+            raise ValueError("Error. A band needs at least one row of pieces.")
+        if cells > 1 and match_mode == "lut":
+            raise ValueError("Error. Multi-cell descriptors need the index or batched match mode.")
+        self.directory = directory
+        self.piece_width = piece_width
+        self.piece_height = piece_height
+        self.band_rows = band_rows
+        self.match_mode = match_mode
+        self.memory_budget = memory_budget
+        self.cells = cells
+
+        self.s_img_p = SourceImageProcessor(directory, default_img_dir=default_img_dir)
+        self.library = self.s_img_p.read_source_library()
+        self.atlas = self.s_img_p.read_thumbnail_atlas(self.library, (piece_width, piece_height))
+        if cells > 1:
+            self.source_colors = self.s_img_p.read_descriptor_library(self.library, cells,
+                                                                      (piece_width, piece_height)).colors
+        else:
+            self.source_colors = self.library.colors
+        self.color_index = None
+        if match_mode == "index":
+            self.color_index = ColorIndex(self.source_colors) if cells == 1 else \
+                DescriptorIndex(self.source_colors)
+        self.color_lut = self.s_img_p.read_color_lut(self.library, lut_bins) if match_mode == "lut" else None
+
+    def render(self, filename, output_filename=None):
+        """Renders the mosaic of an input image to a PNG file.
+
+           Args:
+               filename: (string) the input image
+               output_filename: (string) Optional. The PNG file to write.
+                                         Default: mosaic_[INPUT]_[IMG_DIR].png
+
+           Returns:
+               (string) the PNG file written
+        """
+
+        with Image.open(filename) as image:
+            width, height = image.size
+        cols, rows = width // self.piece_width, height // self.piece_height
+        output_filename = output_filename or f"mosaic_{filename[:-4]}_{self.s_img_p.img_dir}.png"
+
+        band_height = self.band_rows * self.piece_height
+        buffer = np.empty((band_height, cols * self.piece_width, 3), dtype=np.uint8)
+        with StreamingPNGWriter(output_filename, cols * self.piece_width,
+                                rows * self.piece_height) as writer:
+            for top, band in iter_image_bands(filename, band_height):
+                if top >= rows * self.piece_height:
+                    break
+                matches = self.match_band(band)
+                writer.write_rows(self.assemble_band(matches, buffer))
+        return output_filename
+
+    def match_band(self, band):
+        """Matches every piece of a band to a source image.
+
+           Args:
+               band: (numpy.ndarray) (rows, width, 3) pixels of the band
+
+           Returns:
+               (numpy.ndarray) (band rows, cols) source image indices
+        """
+
+        return self.match_colors(self.band_colors(band))
+
+    def band_colors(self, band):
+        """Returns the (band rows, cols, dims) average colors, or sub-cell
+           descriptors with cells above 1, of the pieces of a band."""
+        if self.cells > 1:
+            return cell_descriptors(band, self.piece_width, self.piece_height, self.cells)
+        return mean_colors_for_grid(band, self.piece_width, self.piece_height)
+
+    def match_colors(self, colors):
+        """Matches a grid of average colors, or descriptors, to source images.
+
+           Args:
+               colors: (numpy.ndarray) (band rows, cols, dims) average colors
+
+           Returns:
+               (numpy.ndarray) (band rows, cols) source image indices
+        """
+
+        flat_colors = colors.reshape(-1, colors.shape[-1])
+        if self.color_index is not None:
+            matches = self.color_index.query_many(flat_colors)
+        elif self.color_lut is not None:
+            matches = self.color_lut.lookup(flat_colors)
+        else:
+            matches = batched_nearest(flat_colors, self.source_colors, self.memory_budget)
+        return matches.reshape(colors.shape[:2])
+
+    def assemble_band(self, matches, buffer=None):
+        """Assembles a band of the mosaic from the thumbnail atlas.
+
+           Args:
+               matches: (numpy.ndarray) (band rows, cols) source image indices
+               buffer: (numpy.ndarray) Optional. A (band_rows * piece_height,
+                                       cols * piece_width, 3) uint8 buffer reused
+                                       for every band. Default: a new array
+
+           Returns:
+               (numpy.ndarray) (band rows * piece_height, cols * piece_width, 3)
+               uint8 pixels of the band
+        """
+
+        out = None if buffer is None else buffer[:len(matches) * self.piece_height]
+        return assemble_grid(matches, self.atlas.thumbnails, out)
@@ -1,14 +1,20 @@
 #!/usr/bin/env python
 """Main driver file for the Photomosaic project."""
 
+import sys
 import argparse
+import contextlib
 
-from Photomosaic import PhotoMosaic
+from BatchRenderer import BatchRenderer, expand_inputs
+from Photomosaic import PhotoMosaic, MATCH_MODES
 from utils import validation_util
+from utils.metrics import Metrics, JSONLinesSink
+from utils.profiling import Profiler, PROFILE_MODES
 
 
 @validation_util.validate_input_is_image
 @validation_util.validate_img_dir
+@validation_util.validate_sys_input
 def parse_args():
     """Takes in the arguments passed in the shell to be used in the main script.
 
@@ -18,7 +24,28 @@ def parse_args():
     parser = argparse.ArgumentParser(description='Turns input image '
                                                  'into a photomosaic')
     parser.add_argument('--input', help="enter the input image", type=str)
+    parser.add_argument('--inputs', help="enter input images or glob patterns to render as a batch",
+                        type=str, nargs="+")
+    parser.add_argument('--input-list', help="enter a file listing input images to render as a batch",
+                        type=str)
     parser.add_argument('--directory', help="enter the source input directory", type=str)
+    parser.add_argument('--piece-size', help="enter the size of the mosaic pieces", type=int, default=25)
+    parser.add_argument('--match-mode', help="enter how regions are matched", choices=MATCH_MODES,
+                        default="index")
+    parser.add_argument('--cells', help="enter the sub-cells along each side of the color descriptors",
+                        type=int, default=1)
+    parser.add_argument('--workers', help="enter the number of processes rendering a batch, or "
+                                          "matching the regions of one input", type=int, default=1)
+    parser.add_argument('--metrics-file', help="enter a file the JSON metrics of the run are appended to",
+                        type=str)
+    parser.add_argument('--profile', help="profile the run and write the profile files to this prefix",
+                        type=str, nargs="?", const="profile")
+    parser.add_argument('--profile-mode', help="enter how the profile is captured", choices=PROFILE_MODES,
+                        default="sampling")
+    parser.add_argument('--profile-memory', help="also trace the allocation sites at peak memory",
+                        action="store_true")
+    parser.add_argument('--output-dir', help="enter the directory batch mosaics are saved to",
+                        type=str, default=".")
     args = parser.parse_args()
     return args
 
@@ -26,8 +53,58 @@ def parse_args():
 def main():
     args = parse_args()
 
-    photo_image = PhotoMosaic(filename=args.input, directory=args.directory)
-    photo_image.create_mosaic()
+    profiler = None
+    if args.profile:
+        profiler = Profiler(args.profile, args.profile_mode, trace_memory=args.profile_memory,
+                            tags={"piece_size": f"{args.piece_size}x{args.piece_size}",
+                                  "match_mode": args.match_mode, "directory": args.directory})
+    try:
+        with profiler or contextlib.nullcontext():
+            render(args, profiler)
+    finally:
+        if profiler:
+            print(f"Wrote the profile to {', '.join(profiler.files.values())}")
+
+
+def render(args, profiler=None):
+    """Renders the mosaic of the input image, or the batch of input images."""
+
+    if args.inputs or args.input_list:
+        filenames = expand_inputs(args.inputs or (), args.input_list)
+        metrics = Metrics(labels={"inputs": len(filenames), "match_mode": args.match_mode,
+                                  "piece_size": args.piece_size, "workers": args.workers})
+        if args.metrics_file:
+            metrics.add_sink(JSONLinesSink(args.metrics_file))
+        try:
+            renderer = BatchRenderer(args.directory, args.piece_size, args.piece_size,
+                                     match_mode=args.match_mode, workers=args.workers,
+                                     output_dir=args.output_dir, cells=args.cells, metrics=metrics)
+            report = renderer.render(filenames)
+        finally:
+            metrics.emit()
+        print(report)
+        if profiler:
+            profiler.tag(inputs=len(filenames), library_size=len(renderer.mosaic_library.library),
+                         regions=report.summary()["regions"])
+        return
+
+    metrics = Metrics(labels={"input": args.input, "match_mode": args.match_mode,
+                              "piece_size": args.piece_size})
+    if args.metrics_file:
+        metrics.add_sink(JSONLinesSink(args.metrics_file))
+    photo_image = PhotoMosaic(filename=args.input, directory=args.directory,
+                              piece_width=args.piece_size, piece_height=args.piece_size,
+                              match_mode=args.match_mode, cells=args.cells, workers=args.workers,
+                              metrics=metrics)
+    try:
+        photo_image.create_mosaic()
+    except ValueError as v:
+        print(f"Unexpected error came up after trying to use stored img dir to save mosaic: {v}")
+        sys.exit(1)
+    finally:
+        metrics.emit()
+        if profiler:
+            profiler.tag(**photo_image.profile_tags())
 
 
 if __name__ == "__main__":
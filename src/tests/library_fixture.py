@@ -0,0 +1,54 @@
+import unittest
+import tempfile
+import os
+
+import numpy as np
+from PIL import Image
+
+from src.SourceLibrary import SourceLibrary
+
+COLORS = [(250, 10, 10), (10, 10, 250), (10, 250, 10)]
+
+
+def write_library(default_img_dir, name="lib", colors=COLORS):
+    """Writes a library of one flat 25 x 25 thumbnail for each color."""
+    os.makedirs(os.path.join(default_img_dir, name, "thumbnails"))
+    os.makedirs(os.path.join(default_img_dir, "img_jsons"), exist_ok=True)
+    names = []
+    for i, color in enumerate(colors):
+        names.append(os.path.join(default_img_dir, name, "thumbnails", f"{i}_thumbnail.jpg"))
+        Image.new("RGB", (25, 25), color).save(names[-1], "png")
+    SourceLibrary.write(os.path.join(default_img_dir, "img_jsons", f"{name}.lib"), names, colors)
+
+
+def input_image(right=(30, 30, 200)):
+    """Left half red and right half blue by default, with a remainder to be trimmed."""
+    image = Image.new("RGB", (110, 60), (200, 30, 30))
+    image.paste(right, (50, 0, 110, 60))
+    return image
+
+
+def expected_mosaic(right=COLORS[1]):
+    """The 100 x 50 mosaic of input_image: red pieces on the left, right pieces on the right."""
+    expected = np.zeros((50, 100, 3), dtype=np.uint8)
+    expected[:, :50] = COLORS[0]
+    expected[:, 50:] = right
+    return expected
+
+
+class LibraryTestCase(unittest.TestCase):
+    """Renders input_image against the library "lib" written to a temporary
+       default image directory."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp = self.tmp_dir.name
+        self.colors = COLORS
+        write_library(self.tmp)
+        self.input_img = input_image()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def expected_mosaic(self, right=COLORS[1]):
+        return expected_mosaic(right)
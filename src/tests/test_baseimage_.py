@@ -1,5 +1,8 @@
 import unittest
 
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
 from src.BaseImage import BaseImage
 
 
@@ -33,5 +36,51 @@ class GetImgTestCase(BaseImageTestCase):
             self.base_im('blah')
 
 
+
+class DraftDecodeTestCase(BaseImageTestCase):
+    """Test that JPEGs are decoded at a reduced scale that covers the draft size."""
+
+    def test_no_draft_size(self):
+        base_img = self.base_im(self.sample_image_path)
+        self.assertFalse(base_img.is_drafted)
+        self.assertEqual(base_img.img.size, base_img.full_size)
+
+    def test_reduced_scale(self):
+        base_img = self.base_im(self.sample_image_path, draft_size=(25, 25))
+        self.assertTrue(base_img.is_drafted)
+        self.assertLess(base_img.img.size[0], base_img.full_size[0])
+        self.assertGreaterEqual(min(base_img.img.size), 25)
+
+    def test_unsupported_format_falls_back(self):
+        base_img = self.base_im('test_png_thumbnail.jpg', draft_size=(5, 5))
+        self.assertFalse(base_img.is_drafted)
+
+
+class InMemoryImageTestCase(BaseImageTestCase):
+    """Test that decoded images, arrays and image bytes are accepted."""
+
+    def setUp(self):
+        super().setUp()
+        self.expected = np.asarray(Image.open(self.sample_image_path))
+
+    def test_pil_image(self):
+        base_img = self.base_im(Image.open(self.sample_image_path))
+        np.testing.assert_array_equal(np.asarray(base_img.img), self.expected)
+
+    def test_array(self):
+        base_img = self.base_im(self.expected)
+        self.assertEqual(base_img.full_size, (self.expected.shape[1], self.expected.shape[0]))
+        np.testing.assert_array_equal(np.asarray(base_img.img), self.expected)
+
+    def test_bytes(self):
+        with open(self.sample_image_path, "rb") as image_file:
+            base_img = self.base_im(image_file.read())
+        np.testing.assert_array_equal(np.asarray(base_img.img), self.expected)
+
+    def test_bytes_not_an_image(self):
+        with self.assertRaises(UnidentifiedImageError):
+            self.base_im(b"not an image")
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+import os
+
+import numpy as np
+from PIL import Image
+
+from src.BatchRenderer import BatchRenderer, BatchReport, expand_inputs
+from src.utils.metrics import Metrics, JSONLinesSink
+from src.tests.library_fixture import LibraryTestCase, input_image
+
+
+class BatchRendererTestCase(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.br = BatchRenderer
+        os.makedirs(os.path.join(self.tmp, "inputs"))
+        # the right half of each input is a different color of the library
+        self.inputs = []
+        for i, color in enumerate(self.colors):
+            self.inputs.append(os.path.join(self.tmp, "inputs", f"{i}.png"))
+            input_image(color).save(self.inputs[-1])
+
+    def renderer(self, **kwargs):
+        return self.br(f"{self.tmp}/lib", default_img_dir=self.tmp,
+                       output_dir=os.path.join(self.tmp, "out"), **kwargs)
+
+
+class ExpandInputsTestCase(BatchRendererTestCase):
+    def test_glob_and_list_file(self):
+        list_file = os.path.join(self.tmp, "inputs.txt")
+        with open(list_file, "w") as out:
+            out.write(f"# customer photos\n{self.inputs[0]}\n\n{self.tmp}/missing.jpg\n")
+        filenames = expand_inputs([os.path.join(self.tmp, "inputs", "*.png")], list_file)
+        self.assertEqual(filenames, self.inputs + [f"{self.tmp}/missing.jpg"])
+
+    def test_only_images(self):
+        with open(os.path.join(self.tmp, "inputs", "notes.txt"), "w") as out:
+            out.write("not an image")
+        self.assertEqual(expand_inputs([os.path.join(self.tmp, "inputs", "*")]), self.inputs)
+
+    def test_no_inputs(self):
+        with self.assertRaises(ValueError):
+            expand_inputs([os.path.join(self.tmp, "inputs", "*.jpg")])
+
+
+class RenderTestCase(BatchRendererTestCase):
+    """Test that every input is rendered with the library loaded once."""
+
+    def check_outputs(self, report):
+        self.assertEqual(len(report.results), 3)
+        for i, (filename, output_filename, seconds, regions, error) in enumerate(report.results):
+            self.assertEqual(filename, self.inputs[i])
+            self.assertIsNone(error)
+            self.assertEqual(regions, 8)
+            np.testing.assert_array_equal(np.asarray(Image.open(output_filename)),
+                                          self.expected_mosaic(self.colors[i]))
+
+    def test_render(self):
+        report = self.renderer().render(self.inputs, progress=None)
+        self.check_outputs(report)
+        self.assertEqual(report.summary()["images"], 3)
+
+    def test_render_with_workers(self):
+        self.check_outputs(self.renderer(workers=2).render(self.inputs, progress=None))
+
+    def test_render_with_lut(self):
+        self.check_outputs(self.renderer(match_mode="lut", lut_bins=8).render(self.inputs, progress=None))
+
+    def test_failed_input_does_not_stop_the_batch(self):
+        results = []
+        report = self.renderer().render([f"{self.tmp}/missing.png"] + self.inputs,
+                                        progress=results.append)
+        self.assertEqual(len(results), 4)
+        self.assertIsNotNone(results[0][4])
+        self.assertEqual((report.summary()["images"], report.summary()["failed"]), (3, 1))
+
+    def test_unknown_match_mode(self):
+        with self.assertRaises(ValueError):
+            self.renderer(match_mode="blah")
+
+    def test_metrics(self):
+        metrics_file = os.path.join(self.tmp, "metrics.jsonl")
+        for workers in [1, 2]:
+            metrics = Metrics(sinks=[JSONLinesSink(metrics_file)])
+            self.renderer(workers=workers, metrics=metrics).render([f"{self.tmp}/missing.png"] + self.inputs,
+                                                                   progress=None)
+            counters = metrics.report()["counters"]
+            self.assertEqual((counters["images"], counters["failed_images"], counters["regions"]), (3, 1, 24))
+            self.assertEqual(counters["bytes_written"],
+                             sum(os.path.getsize(os.path.join(self.tmp, "out", name))
+                                 for name in os.listdir(os.path.join(self.tmp, "out"))))
+            self.assertGreater(metrics.seconds("batch"), 0)
+            self.assertEqual(metrics.labels["library_size"], 3)
+            metrics.emit()
+        with open(metrics_file) as lines:
+            self.assertEqual(len(lines.readlines()), 2)
+
+
+class BatchReportTestCase(unittest.TestCase):
+    def test_summary(self):
+        report = BatchReport(load_seconds=0.5)
+        report.add(("a.jpg", "mosaic_a.png", 1.0, 100, None))
+        report.add(("b.jpg", "mosaic_b.png", 3.0, 300, None))
+        report.add(("c.jpg", None, 0.1, 0, "broken"))
+        report.wall_seconds = 2.0
+        summary = report.summary()
+        self.assertEqual((summary["images"], summary["failed"], summary["regions"]), (2, 1, 400))
+        self.assertEqual(summary["images_per_second"], 1.0)
+        self.assertEqual(summary["regions_per_second"], 200.0)
+        self.assertEqual((summary["mean_seconds"], summary["max_seconds"]), (2.0, 3.0))
+        self.assertIn("1.00 images/s", str(report))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import os
+
+import numpy as np
+
+from src.BenchmarkSuite import BenchmarkSuite, compare_results, synthetic_image, synthetic_colors
+
+
+class BenchmarkSuiteTestCase(unittest.TestCase):
+    def setUp(self):
+        self.bs = BenchmarkSuite
+
+    def results(self, **seconds):
+        return {"benchmarks": {name: {"seconds": value} for name, value in seconds.items()}}
+
+
+class InitTestCase(BenchmarkSuiteTestCase):
+    def test_no_sizes(self):
+        for kwargs in [{"sources": ()}, {"megapixels": (0,)}, {"source_images": 0}]:
+            with self.assertRaises(ValueError):
+                self.bs(**kwargs)
+
+
+class SyntheticDataTestCase(BenchmarkSuiteTestCase):
+    """Test that the synthetic data has the requested size and is reproducible."""
+
+    def test_image_size(self):
+        image = synthetic_image(0.12)
+        self.assertEqual(image.size, (400, 300))
+        np.testing.assert_array_equal(np.asarray(image), np.asarray(synthetic_image(0.12)))
+
+    def test_colors(self):
+        colors = synthetic_colors(100, seed=3)
+        self.assertEqual(colors.shape, (100, 3))
+        np.testing.assert_array_equal(colors, synthetic_colors(100, seed=3))
+
+
+class RunTestCase(BenchmarkSuiteTestCase):
+    """Test that every stage is timed in a temporary directory."""
+
+    def test_run(self):
+        cwd = os.getcwd()
+        results = self.bs(sources=[20], megapixels=[0.01], source_images=3, repeat=2).run()
+        self.assertEqual(os.getcwd(), cwd)
+        self.assertEqual(results["config"]["sources"], [20])
+        self.assertEqual(sorted(results["benchmarks"]), sorted([
+            "region_stats/numpy/mp=0.01", "region_stats/sat/mp=0.01",
+            "index_build/sources=20", "lut_build/sources=20",
+            "match/index/sources=20/mp=0.01", "match/batched/sources=20/mp=0.01",
+            "match/lut/sources=20/mp=0.01", "preprocess/images=3", "library_load/images=3",
+            "render/mp=0.01", "create_mosaic/mp=0.01"]))
+        for record in results["benchmarks"].values():
+            self.assertEqual(len(record["runs"]), 2)
+            self.assertGreaterEqual(record["seconds"], record["min_seconds"])
+        self.assertEqual(results["benchmarks"]["render/mp=0.01"]["items"], 12)
+
+
+class CompareResultsTestCase(BenchmarkSuiteTestCase):
+    """Test that slowdowns beyond the threshold are reported as regressions."""
+
+    def test_statuses(self):
+        baseline = self.results(a=1.0, b=1.0, c=1.0, d=1.0)
+        current = self.results(a=1.2, b=1.3, c=0.5, e=1.0)
+        statuses = {name: status for name, *_, status in compare_results(current, baseline, 0.25)}
+        self.assertEqual(statuses, {"a": "ok", "b": "regression", "c": "improvement",
+                                    "d": "missing", "e": "new"})
+
+    def test_ratio(self):
+        comparison = compare_results(self.results(a=3.0), self.results(a=2.0))
+        self.assertEqual(comparison, [("a", 2.0, 3.0, 1.5, "regression")])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import sys
+import unittest
+import threading
+
+import numpy as np
+
+from src.ColorIndex import ColorIndex
+
+
+class ColorIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ci = ColorIndex
+        self.rng = np.random.RandomState(7)
+        self.source_colors = self.rng.uniform(0, 255, size=(500, 3))
+        self.region_colors = self.rng.uniform(0, 255, size=(200, 3))
+
+    def brute_force_match(self, color):
+        return int(np.argmin(((self.source_colors - color) ** 2).sum(axis=1)))
+
+
+class InitTestCase(ColorIndexTestCase):
+    """Test that the index is only built from valid colors."""
+
+    def test_empty_colors(self):
+        with self.assertRaises(ValueError):
+            self.ci([])
+
+    def test_length(self):
+        self.assertEqual(len(self.ci(self.source_colors)), 500)
+
+    def test_from_json_data(self):
+        names, index = self.ci.from_json_data({"a.jpg": [0, 0, 0], "b.jpg": [250, 250, 250]})
+        self.assertEqual(names[index.query((240, 255, 250))[0]], "b.jpg")
+
+
+class QueryTestCase(ColorIndexTestCase):
+    """Test that the index returns the exact nearest neighbour."""
+
+    def test_query_matches_brute_force(self):
+        index = self.ci(self.source_colors)
+        for color in self.region_colors:
+            self.assertEqual(index.query(color)[0], self.brute_force_match(color))
+
+    def test_query_distance(self):
+        index = self.ci(self.source_colors)
+        position, dist = index.query(self.region_colors[0])
+        self.assertAlmostEqual(dist, np.linalg.norm(self.source_colors[position] - self.region_colors[0]))
+
+    def test_query_many(self):
+        index = self.ci(self.source_colors, leaf_size=4)
+        expected = [self.brute_force_match(color) for color in self.region_colors]
+        self.assertEqual(index.query_many(self.region_colors).tolist(), expected)
+
+    def test_duplicate_colors(self):
+        index = self.ci([[10, 10, 10]] * 40 + [[200, 0, 0]])
+        self.assertEqual(index.query((190, 5, 5))[0], 40)
+
+
+class QueryCountTestCase(ColorIndexTestCase):
+    """Test that every query is counted as a leaf hit or a backtrack."""
+
+    def test_counts(self):
+        index = self.ci(self.source_colors, leaf_size=8)
+        index.query_many(self.region_colors)
+        self.assertEqual(index.queries, 200)
+        self.assertEqual(index.leaf_hits + index.backtracks, 200)
+        self.assertGreaterEqual(index.leaves_scanned, index.leaf_hits + 2 * index.backtracks)
+
+    def test_single_leaf(self):
+        index = self.ci(self.source_colors[:10], leaf_size=16)
+        index.query_many(self.region_colors)
+        self.assertEqual((index.leaf_hits, index.backtracks, index.leaves_scanned), (200, 0, 200))
+
+    def test_stats_of_one_call(self):
+        index = self.ci(self.source_colors, leaf_size=8)
+        index.query_many(self.region_colors[:50])
+        stats = {}
+        index.query_many(self.region_colors, stats)
+        self.assertEqual(stats["queries"], 200)
+        self.assertEqual(index.queries, 250)
+        self.assertEqual(stats["leaf_hits"] + stats["backtracks"], 200)
+
+    def test_threads(self):
+        """Counters and per-call stats stay exact when threads share the index."""
+        expected = {}
+        self.ci(self.source_colors, leaf_size=8).query_many(self.region_colors, expected)
+        index = self.ci(self.source_colors, leaf_size=8)
+        results = []
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            def query():
+                stats = {}
+                index.query_many(self.region_colors, stats)
+                results.append(stats)
+
+            threads = [threading.Thread(target=query) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(results, [expected] * 8)
+        self.assertEqual((index.queries, index.leaf_hits, index.backtracks, index.leaves_scanned),
+                         tuple(8 * expected[name] for name in
+                               ("queries", "leaf_hits", "backtracks", "leaves_scanned")))
+
+
+if __name__ == '__main__':
+    unittest.main()
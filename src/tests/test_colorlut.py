@@ -0,0 +1,92 @@
+import unittest
+import tempfile
+import os
+
+import numpy as np
+
+from src.ColorLUT import ColorLUT, lut_path_for, bin_centres, build_table, lookup, error_bound
+from src.utils.matching import batched_nearest
+
+
+class ColorLUTTestCase(unittest.TestCase):
+    def setUp(self):
+        self.lut = ColorLUT
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.lut_path = os.path.join(self.tmp_dir.name, "test_lut16.lut")
+        self.source_colors = np.random.RandomState(0).uniform(0, 255, (200, 3))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+class LUTPathTestCase(ColorLUTTestCase):
+    def test_lut_path_for(self):
+        self.assertEqual(lut_path_for("img_sets/img_jsons/flower_imgs.lib", 32),
+                         "img_sets/img_jsons/flower_imgs_lut32.lut")
+
+
+class BuildTableTestCase(ColorLUTTestCase):
+    """Test that every bin holds the exact match of its centre."""
+
+    def test_bin_centres(self):
+        centres = bin_centres(4)
+        self.assertEqual(centres.shape, (64, 3))
+        np.testing.assert_array_equal(centres[0], [32, 32, 32])
+        np.testing.assert_array_equal(centres[-1], [224, 224, 224])
+
+    def test_centres_match_exactly(self):
+        table = build_table(self.source_colors, bins=8)
+        centres = bin_centres(8)
+        np.testing.assert_array_equal(lookup(table, centres),
+                                      batched_nearest(centres, self.source_colors))
+
+    def test_error_within_bound(self):
+        table = build_table(self.source_colors, bins=8)
+        colors = np.random.RandomState(1).uniform(0, 256, (2000, 3))
+        lut_dists = np.linalg.norm(colors - self.source_colors[lookup(table, colors)], axis=1)
+        exact = batched_nearest(colors, self.source_colors)
+        exact_dists = np.linalg.norm(colors - self.source_colors[exact], axis=1)
+        self.assertTrue(((lut_dists - exact_dists) <= error_bound(8) + 1e-9).all())
+
+    def test_colors_at_the_edges(self):
+        table = build_table(self.source_colors, bins=8)
+        self.assertEqual(len(lookup(table, np.array([[0, 0, 0], [255, 255, 255], [256, -1, 300]]))), 3)
+
+    def test_not_rgb_colors(self):
+        with self.assertRaises(ValueError):
+            build_table(np.zeros((5, 12)), bins=8)
+
+    def test_wrong_number_of_bins(self):
+        with self.assertRaises(ValueError):
+            build_table(self.source_colors, bins=0)
+
+
+class ColorLUTFileTestCase(ColorLUTTestCase):
+    """Test that a built LUT file holds the table and its build stats."""
+
+    def test_build(self):
+        lut = self.lut.build(self.lut_path, self.source_colors, bins=16)
+        self.assertEqual(lut.bins, 16)
+        self.assertEqual(lut.count, 200)
+        self.assertEqual(lut.nbytes, 16 ** 3 * 4)
+        np.testing.assert_array_equal(lut.table, build_table(self.source_colors, bins=16))
+        self.assertGreaterEqual(lut.max_error, lut.mean_error)
+        self.assertLessEqual(lut.max_error, error_bound(16))
+        self.assertIn("16^3 bins", lut.report())
+
+    def test_reopen(self):
+        lut = self.lut.build(self.lut_path, self.source_colors, bins=16)
+        reopened = self.lut(self.lut_path)
+        self.assertEqual(reopened.max_error, lut.max_error)
+        colors = np.array([[10.5, 200, 30], [0, 0, 0]])
+        np.testing.assert_array_equal(reopened.lookup(colors), lut.lookup(colors))
+
+    def test_not_a_lut(self):
+        with open(self.lut_path, "wb") as out:
+            out.write(b"x" * 100)
+        with self.assertRaises(ValueError):
+            self.lut(self.lut_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
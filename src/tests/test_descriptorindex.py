@@ -0,0 +1,60 @@
+import unittest
+
+import numpy as np
+
+from src.DescriptorIndex import DescriptorIndex
+
+
+class DescriptorIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.di = DescriptorIndex
+        self.rng = np.random.RandomState(7)
+        # 12 values that only vary along 4 directions, like correlated sub-cells
+        self.basis = self.rng.normal(size=(4, 12))
+        self.source_descriptors = self.rng.uniform(0, 60, size=(300, 4)) @ self.basis + 120
+        self.region_descriptors = self.rng.uniform(0, 60, size=(100, 4)) @ self.basis + 120
+
+    def brute_force_matches(self, descriptors):
+        dists = ((descriptors[:, None] - self.source_descriptors[None]) ** 2).sum(axis=2)
+        return np.argmin(dists, axis=1)
+
+
+class InitTestCase(DescriptorIndexTestCase):
+    """Test that the projection is only fitted to valid descriptors."""
+
+    def test_empty_descriptors(self):
+        with self.assertRaises(ValueError):
+            self.di([])
+
+    def test_no_components(self):
+        with self.assertRaises(ValueError):
+            self.di(self.source_descriptors, components=0)
+
+    def test_components_capped_at_dims(self):
+        index = self.di(self.source_descriptors[:, :3], components=6)
+        self.assertEqual(index.components, 3)
+        self.assertEqual(index.basis.shape, (3, 3))
+
+    def test_explained_variance(self):
+        self.assertAlmostEqual(self.di(self.source_descriptors, components=4).explained_variance, 1.0)
+        self.assertLess(self.di(self.source_descriptors, components=2).explained_variance, 1.0)
+        self.assertIn("4 components", self.di(self.source_descriptors, components=4).report())
+
+
+class QueryTestCase(DescriptorIndexTestCase):
+    """Test that queries match the full descriptors when the projection keeps the variance."""
+
+    def test_exact_when_variance_kept(self):
+        index = self.di(self.source_descriptors, components=4)
+        self.assertEqual(index.query_many(self.region_descriptors).tolist(),
+                         self.brute_force_matches(self.region_descriptors).tolist())
+
+    def test_source_matches_itself(self):
+        index = self.di(self.source_descriptors, components=2)
+        self.assertEqual(len(index), 300)
+        matches = index.query_many(self.source_descriptors[:20])
+        np.testing.assert_allclose(self.source_descriptors[matches], self.source_descriptors[:20])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+import threading
+import io
+import os
+import json
+import pstats
+
+import numpy as np
+from PIL import Image
+
+from src.MosaicLibrary import MosaicLibrary, encode_image
+from src.utils.profiling import Profiler, sampled_stats
+from src.tests.library_fixture import LibraryTestCase
+
+
+class MosaicLibraryTestCase(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ml = MosaicLibrary
+        self.mosaic_library = self.ml(f"{self.tmp}/lib", default_img_dir=self.tmp)
+        self.expected = self.expected_mosaic()
+
+
+class RenderTestCase(MosaicLibraryTestCase):
+    """Test that every kind of input image is rendered in memory."""
+
+    def test_inputs(self):
+        filename = os.path.join(self.tmp, "input.png")
+        self.input_img.save(filename)
+        for image in [self.input_img, np.asarray(self.input_img), encode_image(self.input_img), filename]:
+            mosaic = self.mosaic_library.render(image)
+            np.testing.assert_array_equal(np.asarray(mosaic), self.expected)
+        self.assertEqual(self.mosaic_library.regions(mosaic), 8)
+
+    def test_encoded_output(self):
+        body = self.mosaic_library.render(self.input_img, format="png")
+        np.testing.assert_array_equal(np.asarray(Image.open(io.BytesIO(body))), self.expected)
+        jpeg = self.mosaic_library.render(self.input_img, format="jpeg", quality=80)
+        self.assertEqual(Image.open(io.BytesIO(jpeg)).format, "JPEG")
+
+    def test_no_files_written(self):
+        before = sorted(os.listdir(os.getcwd()))
+        self.mosaic_library.render(self.input_img, format="png")
+        self.assertEqual(sorted(os.listdir(os.getcwd())), before)
+
+    def test_errors_are_raised(self):
+        with self.assertRaises(OSError):
+            self.mosaic_library.render(b"not an image")
+
+    def test_threads(self):
+        index = self.mosaic_library.color_index
+        queries = index.queries
+        mosaics = []
+        threads = [threading.Thread(target=lambda: mosaics.append(self.mosaic_library.render(self.input_img)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(mosaics), 4)
+        for mosaic in mosaics:
+            np.testing.assert_array_equal(np.asarray(mosaic), self.expected)
+        self.assertEqual(index.queries - queries, 4 * 8)
+        self.assertEqual(index.leaf_hits + index.backtracks, index.queries)
+
+    def test_cells(self):
+        for match_mode in ["index", "batched"]:
+            mosaic_library = self.ml(f"{self.tmp}/lib", default_img_dir=self.tmp, match_mode=match_mode,
+                                     cells=2)
+            self.assertEqual(mosaic_library.source_colors.shape, (3, 12))
+            np.testing.assert_array_equal(np.asarray(mosaic_library.render(self.input_img)), self.expected)
+        self.assertTrue(os.path.isfile(os.path.join(self.tmp, "img_jsons", "lib_cells2_25x25.lib")))
+        with self.assertRaises(ValueError):
+            self.ml(f"{self.tmp}/lib", default_img_dir=self.tmp, match_mode="lut", cells=2)
+
+    def test_unknown_match_mode(self):
+        with self.assertRaises(ValueError):
+            self.ml(f"{self.tmp}/lib", default_img_dir=self.tmp, match_mode="blah")
+
+
+class ProfileTestCase(MosaicLibraryTestCase):
+    """Test that profiled renders write tagged pstats, collapsed stacks and memory traces."""
+
+    def check_files(self, prefix):
+        with open(f"{prefix}.json") as tags_file:
+            tags = json.load(tags_file)
+        self.assertEqual(tags["tags"]["input_size"], "110x60")
+        self.assertEqual(tags["tags"]["library_size"], 3)
+        self.assertEqual(tags["tags"]["piece_size"], "25x25")
+        if tags["samples"] or tags["mode"] == "deterministic":
+            pstats.Stats(tags["files"]["pstats"])
+        else:
+            self.assertNotIn("pstats", tags["files"])
+        with open(f"{prefix}.collapsed") as collapsed:
+            for line in collapsed:
+                stack, samples = line.rsplit(" ", 1)
+                self.assertGreater(int(samples), 0)
+        return tags
+
+    def test_render_profile(self):
+        for mode in ["sampling", "deterministic"]:
+            prefix = os.path.join(self.tmp, mode)
+            profiler = Profiler(prefix, mode, interval=0.001, trace_memory=True)
+            mosaic = self.mosaic_library.render(self.input_img, profile=profiler)
+            np.testing.assert_array_equal(np.asarray(mosaic), self.expected)
+            tags = self.check_files(prefix)
+            self.assertEqual(tags["mode"], mode)
+            self.assertGreater(tags["peak_memory_bytes"], 0)
+            self.assertTrue(os.path.isfile(f"{prefix}.memory.txt"))
+
+    def test_profile_prefix(self):
+        prefix = os.path.join(self.tmp, "render")
+        self.mosaic_library.render(self.input_img, format="png", profile=prefix)
+        self.assertFalse(os.path.isfile(f"{prefix}.memory.txt"))
+        self.check_files(prefix)
+
+    def test_sampled_pstats(self):
+        prefix = os.path.join(self.tmp, "busy")
+        with Profiler(prefix, interval=0.001, tags={"run": "busy"}) as profiler:
+            while sum(profiler.stacks.values()) < 5:
+                sum(range(1000))
+        self.assertIn("busy.collapsed", profiler.files["collapsed"])
+        stats = pstats.Stats(profiler.files["pstats"])
+        self.assertTrue(any(name == "test_sampled_pstats" for _, _, name in stats.stats))
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            Profiler(os.path.join(self.tmp, "render"), "blah")
+
+    def test_sampled_stats(self):
+        outer, middle, inner = ("a.py", 1, "outer"), ("a.py", 5, "middle"), ("b.py", 1, "inner")
+        stats = sampled_stats({(outer, middle, inner): 3, (outer, middle): 1}, 0.01)
+        self.assertEqual(stats[outer][:4], (4, 4, 0.0, 0.04))
+        self.assertEqual(stats[middle][:2], (4, 4))
+        self.assertAlmostEqual(stats[middle][2], 0.01)
+        self.assertAlmostEqual(stats[inner][2], 0.03)
+        self.assertEqual(stats[inner][4][middle][:2], (3, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import unittest
+import threading
+
+import numpy as np
+
+from src.ParallelMatcher import ParallelMatcher, SharedArray
+from src.utils.matching import batched_nearest
+
+
+class ParallelMatcherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.matcher = ParallelMatcher
+        self.rng = np.random.RandomState(11)
+        self.source_colors = self.rng.uniform(0, 255, size=(500, 3))
+        # 12 x 9 grid of regions
+        self.region_grid = self.rng.uniform(0, 255, size=(9, 12, 3))
+        self.expected = batched_nearest(self.region_grid.reshape(-1, 3),
+                                        self.source_colors).reshape(9, 12)
+
+
+class InitTestCase(ParallelMatcherTestCase):
+    """Test that only exact match modes and valid bands are accepted."""
+
+    def test_unknown_match_mode(self):
+        with self.assertRaises(ValueError):
+            self.matcher(self.source_colors, "lut")
+
+    def test_empty_band(self):
+        with self.assertRaises(ValueError):
+            self.matcher(self.source_colors, band_rows=0)
+
+    def test_no_source_colors(self):
+        with self.assertRaises(ValueError):
+            self.matcher(np.zeros((0, 3)))
+
+    def test_band_ranges(self):
+        self.assertEqual(self.matcher(self.source_colors, band_rows=4).band_ranges(9),
+                         [(0, 4), (4, 8), (8, 9)])
+        self.assertEqual(len(self.matcher(self.source_colors, workers=2).band_ranges(9)), 5)
+
+
+class MatchTestCase(ParallelMatcherTestCase):
+    """Test that the workers write the same matches as one process into the shared grid."""
+
+    def test_one_worker(self):
+        for match_mode in ["index", "batched"]:
+            matcher = self.matcher(self.source_colors, match_mode, workers=1, band_rows=2)
+            self.assertEqual(matcher.match_grid(self.region_grid).tolist(), self.expected.tolist())
+            self.assertEqual(matcher.bands, {os.getpid(): 5})
+
+    def test_workers(self):
+        for match_mode in ["index", "batched"]:
+            matcher = self.matcher(self.source_colors, match_mode, workers=3, band_rows=1)
+            self.assertEqual(matcher.match_grid(self.region_grid).tolist(), self.expected.tolist())
+            self.assertEqual(sum(matcher.bands.values()), 9)
+            self.assertNotIn(os.getpid(), matcher.bands)
+        self.assertEqual(matcher.leaf_hits + matcher.backtracks, 0)
+
+    def test_index_counts(self):
+        matcher = self.matcher(self.source_colors, workers=2, band_rows=3)
+        matcher.match_grid(self.region_grid)
+        self.assertEqual(matcher.leaf_hits + matcher.backtracks, 9 * 12)
+        self.assertGreaterEqual(matcher.leaves_scanned, 9 * 12)
+        self.assertIn("3 bands", matcher.report())
+
+    def test_column_order(self):
+        """Regions given column by column come back in the same order."""
+        region_colors = self.region_grid.transpose(1, 0, 2).reshape(-1, 3)
+        matches = self.matcher(self.source_colors, workers=2).match(region_colors, 12, 9)
+        self.assertEqual(matches.tolist(), self.expected.T.reshape(-1).tolist())
+
+    def test_descriptors(self):
+        sources = self.rng.uniform(0, 255, size=(200, 12))
+        regions = self.rng.uniform(0, 255, size=(4, 5, 12))
+        matches = self.matcher(sources, "batched", workers=2).match_grid(regions)
+        self.assertEqual(matches.reshape(-1).tolist(),
+                         batched_nearest(regions.reshape(-1, 12), sources).tolist())
+
+    def test_threads(self):
+        """Matches started from several threads share the module state one at a time."""
+        results = []
+
+        def match():
+            matcher = self.matcher(self.source_colors, workers=2, band_rows=2)
+            results.append(matcher.match_grid(self.region_grid))
+
+        threads = [threading.Thread(target=match) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 3)
+        for matches in results:
+            self.assertEqual(matches.tolist(), self.expected.tolist())
+
+    def test_wrong_dims(self):
+        with self.assertRaises(ValueError):
+            self.matcher(self.source_colors).match_grid(self.region_grid[..., :2])
+
+
+class SharedArrayTestCase(ParallelMatcherTestCase):
+    """Test that an attached array sees the writes of the owner."""
+
+    def test_attach(self):
+        with SharedArray.from_array(self.region_grid) as owner:
+            name, shape, dtype = owner.spec
+            attached = SharedArray(shape, dtype, name)
+            owner.array[0, 0] = [1, 2, 3]
+            self.assertEqual(attached.array[0, 0].tolist(), [1, 2, 3])
+            self.assertFalse(attached.owner)
+            attached.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,17 @@
 import unittest
 import os
+import json
 import math
+import tracemalloc
 import PIL
+import numpy as np
 
 from PIL import Image
 
 from src.Photomosaic import PhotoMosaic
+from src.utils.metrics import Metrics, JSONLinesSink
+from src.utils.assembly import assemble_grid
+from src.utils.region_stats import cell_descriptors, mean_colors_for_grid
 
 
 class PhotoMosaicTestCase(unittest.TestCase):
@@ -168,116 +174,344 @@ class TrimmedMosaicBaseTestCase(PhotoMosaicTestCase):
             self.assertNotEqual(rem_2, 0)
 
 
-class GetIndexTestCase(PhotoMosaicTestCase):
+class EuclideanDistTestCase(PhotoMosaicTestCase):
     """
-    Test that the color indexes are saved correctly
-    and error-handled when instance types or integers
-    are incorrect.
+    Test that the euclidean distance formula is the same than the normal
+    math.sqrt function.
     """
 
-    def test_empty_thumbnail_file_path(self):
+    def test_euclidean_distance(self):
         self.create_test_image(50, 50)
-        self.sample_json_data = {"": 5, "monkey": [0, 7, 0]}
-        with self.assertRaises(ValueError):
-            self.pm(filename="example.png",
-                    directory=os.getcwd()).get_index(self.sample_json_data)
+        tuples_1 = [(10, 10, 10), (14, 12, 58), (0, 0, 0)]
+        tuples_2 = [(12, 12, 12), (523, 484, 980), (-1, -1, -1)]
+        for tuple1, tuple2 in zip(tuples_1, tuples_2):
+            val = math.sqrt(((tuple2[0]-tuple1[0]) ** 2 + (tuple1[1]-tuple2[1]) ** 2 + (tuple1[-1]-tuple2[-1]) ** 2))
+            self.assertEqual(self.pm(filename="example.png",
+                                     directory=os.getcwd()).calculate_euclidean_dist(tuple1, tuple2), val)
         self.delete_test_image()
 
-    def test_none_thumbnail_file_path(self):
+
+class RegionEngineTestCase(PhotoMosaicTestCase):
+    """
+    Test that the numpy region engine returns the same boxes as the pil
+    engine and weights every pixel equally.
+    """
+
+    def test_unknown_region_engine(self):
         self.create_test_image(50, 50)
-        self.sample_json_data = {None: 5, "monkey": [0, 7, 0]}
         with self.assertRaises(ValueError):
-            self.pm(filename="example.png",
-                    directory=os.getcwd()).get_index(self.sample_json_data)
+            self.pm(filename="example.png", directory=os.getcwd(), region_engine="blah")
         self.delete_test_image()
 
-    def test_incorrect_type_thumbnail_file_path(self):
-        self.create_test_image(50, 50)
-        self.sample_json_data = {5: 5, "monkey": [0, 7, 0]}
-        with self.assertRaises(TypeError):
-            self.pm(filename="example.png",
-                    directory=os.getcwd()).get_index(self.sample_json_data)
+    def test_same_boxes_as_pil_engine(self):
+        numpy_regions = self.pm(filename=self.sample_image_path,
+                                directory=self.test_img_dir).regions_with_colors
+        pil_regions = self.pm(filename=self.sample_image_path, directory=self.test_img_dir,
+                              region_engine="pil").regions_with_colors
+        self.assertEqual(list(numpy_regions.keys()), list(pil_regions.keys()))
+
+    def test_pixel_weighted_average(self):
+        """Six rows of blue over nineteen rows of red are weighted by pixel count."""
+        self.im = Image.new("RGB", (25, 25), (255, 0, 0))
+        self.im.paste((0, 0, 255), (0, 0, 25, 6))
+        self.im.save("example.png")
+        colors = self.pm(filename="example.png", directory=os.getcwd()).regions_with_colors
+        expected = (255 * 475 / 625, 0, 255 * 150 / 625)
+        for value, expected_value in zip(colors[(0, 0, 25, 25)], expected):
+            self.assertAlmostEqual(value, expected_value)
         self.delete_test_image()
 
-    def test_thumbnail_file_does_not_exist(self):
-        self.create_test_image(50, 50)
-        self.sample_json_data = {"test_png_thumbnail_2.jpg": [104, 112, 99]}
-        with self.assertRaises(FileNotFoundError):
-            self.pm(filename="example.png",
-                    directory=os.getcwd()).get_index(self.sample_json_data)
-        self.delete_test_image()
 
-    def test_empty_pixel_value(self):
-        self.create_test_image(50, 50)
-        self.sample_json_data = {"test_png_thumbnail.jpg": []}
-        with self.assertRaises(ValueError):
-            self.pm(filename="example.png",
-                    directory=os.getcwd()).get_index(self.sample_json_data)
-        self.delete_test_image()
+class MatchRegionsTestCase(PhotoMosaicTestCase):
+    """
+    Test that the exact match modes return the same source image indices
+    and the LUT match mode is within the error of its bins.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.source_colors = [[0, 0, 0], [255, 255, 255], [200, 30, 30], [30, 30, 200],
+                              [120, 120, 120], [30, 200, 30], [90, 60, 20]]
 
-    def test_none_pixel_value(self):
+    def test_unknown_match_mode(self):
         self.create_test_image(50, 50)
-        self.sample_json_data = {"test_png_thumbnail.jpg": None}
         with self.assertRaises(ValueError):
-            self.pm(filename="example.png",
-                    directory=os.getcwd()).get_index(self.sample_json_data)
+            self.pm(filename="example.png", directory=os.getcwd(), match_mode="blah")
         self.delete_test_image()
 
-    def test_incorrect_pixel_value_type(self):
-        self.create_test_image(50, 50)
-        self.sample_json_data = {"test_png_thumbnail.jpg": "bananas"}
-        with self.assertRaises(TypeError):
-            self.pm(filename="example.png",
-                    directory=os.getcwd()).get_index(self.sample_json_data)
-        self.delete_test_image()
+    def test_batched_matches_index(self):
+        index_matches = self.pm(filename=self.sample_image_path,
+                                directory=self.test_img_dir).match_regions(self.source_colors)
+        for budget in [64, 1000, 2 ** 20]:
+            batched_pm = self.pm(filename=self.sample_image_path, directory=self.test_img_dir,
+                                 match_mode="batched", memory_budget=budget)
+            self.assertEqual(batched_pm.match_regions(self.source_colors).tolist(),
+                             index_matches.tolist())
+
+    def test_one_match_per_region(self):
+        new_pm = self.pm(filename=self.sample_image_path, directory=self.test_img_dir,
+                         match_mode="batched")
+        self.assertEqual(len(new_pm.match_regions(self.source_colors)),
+                         len(new_pm.regions_with_colors))
+
+    def test_lut_matches_within_bin_error(self):
+        index_pm = self.pm(filename=self.sample_image_path, directory=self.test_img_dir)
+        lut_pm = self.pm(filename=self.sample_image_path, directory=self.test_img_dir,
+                         match_mode="lut", lut_bins=64)
+        sources = np.array(self.source_colors, dtype=np.float64)
+        regions = np.array(list(index_pm.regions_with_colors.values()))
+        exact = np.linalg.norm(regions - sources[index_pm.match_regions(sources)], axis=1)
+        approx = np.linalg.norm(regions - sources[lut_pm.match_regions(sources)], axis=1)
+        self.assertTrue((approx - exact <= math.sqrt(3) * 256 / 64).all())
+
+    def test_workers_match_one_process(self):
+        metrics = Metrics()
+        for match_mode in ["index", "batched"]:
+            serial = self.pm(filename=self.sample_image_path, directory=self.test_img_dir,
+                             match_mode=match_mode).match_regions(self.source_colors)
+            parallel_pm = self.pm(filename=self.sample_image_path, directory=self.test_img_dir,
+                                  match_mode=match_mode, workers=2, metrics=metrics)
+            self.assertEqual(parallel_pm.match_regions(self.source_colors).tolist(), serial.tolist())
+        self.assertEqual(metrics.counter("match_bands"), 16)
+        self.assertEqual(metrics.counter("index_leaf_hits") + metrics.counter("index_backtracks"),
+                         len(parallel_pm.regions_with_colors))
+
+
+class CellDescriptorTestCase(PhotoMosaicTestCase):
+    """
+    Test that the sub-cell descriptors average the right pixels and that
+    regions are matched on the structure inside them.
+    """
 
-    def test_pixels_out_of_range(self):
-        self.create_test_image(50, 50)
-        self.sample_json_data = {"test_png_thumbnail.jpg": [7, 13, 400]}
-        with self.assertRaises(ValueError):
-            self.pm(filename="example.png",
-                    directory=os.getcwd()).get_index(self.sample_json_data)
+    def test_one_cell_is_average_color(self):
+        pixels = np.random.RandomState(5).randint(0, 256, size=(53, 77, 3)).astype(np.uint8)
+        np.testing.assert_allclose(cell_descriptors(pixels, 25, 25, 1), mean_colors_for_grid(pixels, 25, 25))
+
+    def test_uneven_cells(self):
+        """A 25 pixel piece is split into sub-cells of 12 and 13 pixels."""
+        pixels = np.random.RandomState(5).randint(0, 256, size=(53, 77, 3)).astype(np.uint8)
+        descriptors = cell_descriptors(pixels, 25, 25, 2)
+        self.assertEqual(descriptors.shape, (2, 3, 12))
+        np.testing.assert_allclose(descriptors[1, 2, 6:9],
+                                   pixels[37:50, 50:62].reshape(-1, 3).mean(axis=0))
+
+    def test_stack_of_thumbnails(self):
+        pixels = np.random.RandomState(5).randint(0, 256, size=(50, 50, 3)).astype(np.uint8)
+        thumbnails = np.stack([pixels[:25, :25], pixels[25:, 25:]])
+        np.testing.assert_allclose(cell_descriptors(thumbnails, 25, 25, 3)[:, 0, 0],
+                                   cell_descriptors(pixels, 25, 25, 3)[[0, 1], [0, 1]])
+
+    def test_matches_structure(self):
+        """Both sources have the same average color, only the halves differ."""
+        self.im = Image.new("RGB", (50, 25), (200, 30, 30))
+        self.im.paste((30, 30, 200), (0, 0, 25, 12))
+        self.im.paste((30, 30, 200), (37, 0, 50, 25))
+        self.im.save("example.png")
+        top_blue = np.concatenate([[30, 30, 200] * 2, [200, 30, 30] * 2])
+        right_blue = np.array([200, 30, 30, 30, 30, 200] * 2)
+        for match_mode in ["index", "batched"]:
+            new_pm = self.pm(filename="example.png", directory=os.getcwd(), match_mode=match_mode,
+                             cells=2)
+            self.assertEqual(new_pm.match_regions([top_blue, right_blue]).tolist(), [0, 1])
         self.delete_test_image()
 
-    def test_negative_pixels_out_of_range(self):
+    def test_cells_need_exact_uniform_matching(self):
         self.create_test_image(50, 50)
-        self.sample_json_data = {"test_png_thumbnail.jpg": [-7, 13, 200]}
-        with self.assertRaises(ValueError):
-            self.pm(filename="example.png",
-                    directory=os.getcwd()).get_index(self.sample_json_data)
+        for kwargs in [{"match_mode": "lut"}, {"tiling": "adaptive"}]:
+            with self.assertRaises(ValueError):
+                self.pm(filename="example.png", directory=os.getcwd(), cells=2, **kwargs)
         self.delete_test_image()
 
-    def test_get_index_one(self):
-        self.create_test_image(50, 50)
-        self.sample_json_data = {"test_png_thumbnail.jpg": [104, 112, 99]}
-        result = {(100, 110, 100): [('test_png_thumbnail.jpg', [104, 112, 99])]}
-        self.assertEqual(result, self.pm(filename="example.png",
-                                         directory=os.getcwd()).get_index(self.sample_json_data))
-        self.delete_test_image()
 
-    def test_get_index_two(self):
-        self.create_test_image(50, 50)
-        self.sample_json_data = {"test_png_thumbnail.jpg": [104, 112, 99],
-                                 "test_png_thumbnail_2a.jpg": [132, 94, 19]}
-        result = {(100, 110, 100): [('test_png_thumbnail.jpg', [104, 112, 99])],
-                  (130, 90, 20): [('test_png_thumbnail_2a.jpg', [132, 94, 19])]}
-        self.assertEqual(result, self.pm(filename="example.png",
-                                         directory=os.getcwd()).get_index(self.sample_json_data))
-        self.delete_test_image()
+class MetricsTestCase(PhotoMosaicTestCase):
+    """
+    Test that the stages are timed and counted, and the report reaches the sinks.
+    """
 
+    def test_timers_and_counters(self):
+        metrics = Metrics(labels={"library": "test"})
+        metrics.count("regions", 3)
+        metrics.count("regions")
+        with metrics.timer("match"):
+            pass
+        metrics.add_time("match", 2.0)
+        report = metrics.report()
+        self.assertEqual(report["labels"], {"library": "test"})
+        self.assertEqual(report["counters"], {"regions": 4})
+        self.assertEqual(report["timers"]["match"]["count"], 2)
+        self.assertEqual(report["timers"]["match"]["max_seconds"], 2.0)
+        self.assertGreaterEqual(metrics.seconds("match"), 2.0)
+        self.assertEqual(metrics.counter("missing"), 0)
+        metrics.reset()
+        self.assertEqual(metrics.report()["counters"], {})
+
+    def test_sinks(self):
+        reports = []
+        metrics = Metrics(sinks=[reports.append])
+        metrics.add_sink(JSONLinesSink("metrics.jsonl"))
+        metrics.count("regions")
+        metrics.emit()
+        metrics.emit()
+        with open("metrics.jsonl") as lines:
+            self.assertEqual([json.loads(line) for line in lines], reports)
+        self.assertEqual(len(reports), 2)
+        os.remove("metrics.jsonl")
+
+    def test_photomosaic_metrics(self):
+        metrics = Metrics()
+        new_pm = self.pm(filename=self.sample_image_path, directory=self.test_img_dir, metrics=metrics)
+        regions = len(new_pm.regions_with_colors)
+        new_pm.match_regions(np.random.RandomState(0).uniform(0, 255, size=(100, 3)))
+        self.assertEqual(metrics.counter("regions"), regions)
+        self.assertEqual(metrics.counter("index_matches"), regions)
+        self.assertEqual(metrics.counter("index_leaf_hits") + metrics.counter("index_backtracks"), regions)
+        self.assertEqual(metrics.counter("bytes_read"), os.path.getsize(self.sample_image_path))
+        self.assertEqual(set(metrics.report()["timers"]), {"decode_input", "region_stats", "match"})
+
+
+class SummedAreaTableTestCase(PhotoMosaicTestCase):
+    """
+    Test that the summed-area table gives the same average colors as
+    averaging the pixels directly, for any box, piece size and offset.
+    """
 
-class EuclideanDistTestCase(PhotoMosaicTestCase):
+    def setUp(self):
+        super().setUp()
+        self.new_pm = self.pm(filename=self.sample_image_path, directory=self.test_img_dir)
+        self.pixels = np.asarray(self.new_pm.img.convert("RGB"), dtype=np.float64)
+
+    def test_sat_engine_matches_numpy_engine(self):
+        sat_regions = self.pm(filename=self.sample_image_path, directory=self.test_img_dir,
+                              region_engine="sat").regions_with_colors
+        self.assertEqual(list(sat_regions), list(self.new_pm.regions_with_colors))
+        np.testing.assert_allclose(list(sat_regions.values()),
+                                   list(self.new_pm.regions_with_colors.values()))
+
+    def test_arbitrary_boxes(self):
+        boxes = [(0, 0, 1, 1), (3, 7, 40, 9), (100, 20, 151, 133)]
+        for box in boxes:
+            expected = self.pixels[box[1]:box[3], box[0]:box[2]].mean(axis=(0, 1))
+            np.testing.assert_allclose(self.new_pm.summed_area_table.mean(box), expected)
+
+    def test_box_outside_image(self):
+        with self.assertRaises(ValueError):
+            self.new_pm.summed_area_table.means([(0, 0, 10 ** 6, 10)])
+
+    def test_shifted_grid_of_other_piece_size(self):
+        regions = self.new_pm.get_avg_color_for_grid(40, 30, offset=(7, 11))
+        width, height = self.new_pm.img.size
+        self.assertEqual(len(regions), ((width - 7) // 40) * ((height - 11) // 30))
+        for box, color in list(regions.items())[::25]:
+            expected = self.pixels[box[1]:box[3], box[0]:box[2]].mean(axis=(0, 1))
+            np.testing.assert_allclose(color, expected)
+
+
+class AdaptiveTilingTestCase(PhotoMosaicTestCase):
     """
-    Test that the euclidean distance formula is the same than the normal
-    math.sqrt function.
+    Test that adaptive tiling covers the image exactly once, keeps flat areas
+    as large tiles and splits detailed areas down to the piece size.
     """
 
-    def test_euclidean_distance(self):
-        self.create_test_image(50, 50)
-        tuples_1 = [(10, 10, 10), (14, 12, 58), (0, 0, 0)]
-        tuples_2 = [(12, 12, 12), (523, 484, 980), (-1, -1, -1)]
-        for tuple1, tuple2 in zip(tuples_1, tuples_2):
-            val = math.sqrt(((tuple2[0]-tuple1[0]) ** 2 + (tuple1[1]-tuple2[1]) ** 2 + (tuple1[-1]-tuple2[-1]) ** 2))
-            self.assertEqual(self.pm(filename="example.png",
-                                     directory=os.getcwd()).calculate_euclidean_dist(tuple1, tuple2), val)
+    def coverage(self, new_pm):
+        width, height = new_pm.img.size
+        covered = np.zeros((height, width), dtype=int)
+        for box in new_pm.regions_with_colors:
+            covered[box[1]:box[3], box[0]:box[2]] += 1
+        return covered
+
+    def test_unknown_tiling(self):
+        with self.assertRaises(ValueError):
+            self.pm(filename=self.sample_image_path, directory=self.test_img_dir,
+                    tiling="hexagonal")
+
+    def test_flat_image_is_not_split(self):
+        self.create_test_image(200, 200)
+        new_pm = self.pm(filename="example.png", directory=self.test_img_dir,
+                         piece_width=25, piece_height=25, tiling="adaptive", quadtree_levels=2)
+        self.assertEqual(sorted(new_pm.regions_with_colors),
+                         [(0, 0, 100, 100), (0, 100, 100, 200),
+                          (100, 0, 200, 100), (100, 100, 200, 200)])
         self.delete_test_image()
+
+    def test_detailed_image_is_split_to_piece_size(self):
+        noise = np.random.RandomState(0).randint(0, 256, (200, 200, 3), dtype=np.uint8)
+        Image.fromarray(noise).save("test_noise.png")
+        new_pm = self.pm(filename="test_noise.png", directory=self.test_img_dir,
+                         tiling="adaptive", quadtree_levels=2)
+        self.assertEqual(len(new_pm.regions_with_colors), 64)
+        os.remove("test_noise.png")
+
+    def test_image_covered_exactly_once(self):
+        new_pm = self.pm(filename=self.sample_image_path, directory=self.test_img_dir,
+                         tiling="adaptive", quadtree_levels=3, variance_threshold=200)
+        width, height = new_pm.img.size
+        covered = self.coverage(new_pm)
+        trimmed = covered[:height - height % 25, :width - width % 25]
+        self.assertTrue((trimmed == 1).all())
+        self.assertEqual(covered.sum(), trimmed.size)
+
+    def test_adaptive_colors_are_box_means(self):
+        new_pm = self.pm(filename=self.sample_image_path, directory=self.test_img_dir,
+                         tiling="adaptive")
+        pixels = np.asarray(new_pm.img.convert("RGB"), dtype=np.float64)
+        for box, color in list(new_pm.regions_with_colors.items())[::10]:
+            expected = pixels[box[1]:box[3], box[0]:box[2]].mean(axis=(0, 1))
+            np.testing.assert_allclose(color, expected)
+
+
+class AssemblyTestCase(PhotoMosaicTestCase):
+    """
+    Test that the vectorized assembly gives the same mosaic as pasting every
+    thumbnail onto its region.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.thumbnails = np.random.RandomState(0).randint(0, 256, (6, 4, 3, 3), dtype=np.uint8)
+        self.matches = np.array([[0, 5, 2], [3, 3, 1]])
+
+    def test_assemble_grid(self):
+        mosaic = assemble_grid(self.matches, self.thumbnails)
+        self.assertEqual(mosaic.shape, (8, 9, 3))
+        for (i, j), match in np.ndenumerate(self.matches):
+            np.testing.assert_array_equal(mosaic[i * 4:(i + 1) * 4, j * 3:(j + 1) * 3],
+                                          self.thumbnails[match])
+
+    def test_assemble_into_buffer(self):
+        out = np.zeros((8, 9, 3), dtype=np.uint8)
+        self.assertIs(assemble_grid(self.matches, self.thumbnails, out), out)
+        np.testing.assert_array_equal(out, assemble_grid(self.matches, self.thumbnails))
+
+    def test_no_grid_sized_copy(self):
+        """Only one row of thumbnails is gathered outside the output at a time."""
+        thumbnails = np.random.RandomState(1).randint(0, 256, (10, 25, 25, 3), dtype=np.uint8)
+        matches = np.random.RandomState(2).randint(0, 10, (40, 40))
+        out = np.empty((1000, 1000, 3), dtype=np.uint8)
+        tracemalloc.start()
+        try:
+            assemble_grid(matches, thumbnails, out)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, out.nbytes // 10)
+        np.testing.assert_array_equal(out[975:, 25:50], thumbnails[matches[39, 1]])
+
+    def test_wrong_buffer(self):
+        with self.assertRaises(ValueError):
+            assemble_grid(self.matches, self.thumbnails, np.zeros((9, 8, 3), dtype=np.uint8))
+        with self.assertRaises(ValueError):
+            assemble_grid(self.matches, self.thumbnails, np.zeros((8, 18, 3), dtype=np.uint8)[:, ::2])
+
+    def test_assemble_mosaic_matches_paste(self):
+        new_pm = self.pm(filename=self.sample_image_path, directory=self.test_img_dir)
+        thumbnails = [Image.new("RGB", (25, 25), color) for color in
+                      [(255, 0, 0), (0, 255, 0), (0, 0, 255), (9, 9, 9)]]
+        matches = np.arange(len(new_pm.regions_with_colors)) % len(thumbnails)
+
+        def fetch_thumbnail(match, size):
+            return thumbnails[match]
+
+        pasted = new_pm.create_trimmed_mosaic_base().convert("RGB")
+        new_pm.paste_matches(pasted, matches, fetch_thumbnail)
+        assembled = new_pm.assemble_mosaic(matches, fetch_thumbnail)
+        np.testing.assert_array_equal(np.asarray(assembled), np.asarray(pasted))
@@ -0,0 +1,212 @@
+import unittest
+import threading
+import json
+import io
+import os
+
+import numpy as np
+from PIL import Image
+from urllib.request import urlopen, Request
+from urllib.error import HTTPError
+
+from src.RenderService import RenderService, LibraryCache, LatencyStats, create_server, MAX_PIECE_SIZE
+from src.tests.library_fixture import LibraryTestCase, write_library
+
+
+class RenderServiceTestCase(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        write_library(self.tmp, "lib2")
+        buffer = io.BytesIO()
+        self.input_img.save(buffer, "jpeg", quality=95)
+        self.data = buffer.getvalue()
+
+
+class RenderTestCase(RenderServiceTestCase):
+    """Test that the service renders from image bytes and keeps the library resident."""
+
+    def test_render(self):
+        service = RenderService(default_img_dir=self.tmp)
+        body, timings = service.render(self.data, f"{self.tmp}/lib")
+        np.testing.assert_array_equal(np.asarray(Image.open(io.BytesIO(body))), self.expected_mosaic())
+        self.assertFalse(timings["library_resident"])
+        self.assertEqual(timings["regions"], 8)
+        _, timings = service.render(self.data, f"{self.tmp}/lib")
+        self.assertTrue(timings["library_resident"])
+        self.assertEqual(service.stats()["latency"]["requests"], 2)
+
+    def test_bad_image(self):
+        service = RenderService(default_img_dir=self.tmp)
+        with self.assertRaises(OSError):
+            service.render(b"not an image", f"{self.tmp}/lib")
+        self.assertEqual(service.stats()["latency"]["errors"], 1)
+
+    def test_library_cache_evicts_least_recently_used(self):
+        service = RenderService(default_img_dir=self.tmp)
+        renderer, _ = service.library_cache.get((f"{self.tmp}/lib", 25, 25, "index"))
+        cache = LibraryCache(max_bytes=renderer.nbytes * 3 // 2, default_img_dir=self.tmp)
+        cache.get((f"{self.tmp}/lib", 25, 25, "index"))
+        cache.get((f"{self.tmp}/lib2", 25, 25, "index"))
+        self.assertNotIn((f"{self.tmp}/lib", 25, 25, "index"), cache)
+        self.assertIn((f"{self.tmp}/lib2", 25, 25, "index"), cache)
+        self.assertEqual((cache.misses, cache.evictions), (2, 1))
+
+    def test_directory_inside_default_img_dir(self):
+        service = RenderService(default_img_dir=self.tmp)
+        self.assertEqual(service.library_directory("lib"), f"{self.tmp}/lib")
+        self.assertEqual(service.library_directory(f"{self.tmp}/lib2"), f"{self.tmp}/lib2")
+        pwned = os.path.join(self.tmp, "pwned")
+        for directory in [f"x; touch {pwned} #", f"$(touch {pwned})", "../lib", f"{self.tmp}/lib/../lib2",
+                          "lib/thumbnails", "img_jsons", "missing", "/etc", ""]:
+            with self.assertRaises(ValueError):
+                service.render(self.data, directory)
+        self.assertFalse(os.path.exists(pwned))
+        self.assertEqual(len(service.library_cache), 0)
+        self.assertEqual(service.stats()["latency"]["errors"], 9)
+
+
+class LibraryCacheTestCase(unittest.TestCase):
+    """Test that a library is loaded outside the cache lock, once per key."""
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.loads = []
+
+        def loader(directory, piece_width, piece_height, match_mode):
+            self.loads.append(directory)
+            if directory == "slow":
+                self.release.wait(10)
+            return type("Library", (object,), {"nbytes": 1, "directory": directory})()
+
+        self.cache = LibraryCache(max_bytes=10, loader=loader)
+
+    def test_slow_load_does_not_block_other_keys(self):
+        self.cache.get(("fast", 25, 25, "index"))
+        slow = threading.Thread(target=self.cache.get, args=(("slow", 25, 25, "index"),))
+        slow.start()
+        try:
+            while "slow" not in self.loads:
+                self.release.wait(0.001)
+            finished = threading.Event()
+            threading.Thread(target=lambda: (self.cache.get(("fast", 25, 25, "index")),
+                                             self.cache.stats(), finished.set())).start()
+            self.assertTrue(finished.wait(5))
+            self.assertNotIn(("slow", 25, 25, "index"), self.cache)
+        finally:
+            self.release.set()
+            slow.join()
+        self.assertIn(("slow", 25, 25, "index"), self.cache)
+
+    def test_concurrent_misses_load_once(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get(("slow", 25, 25, "index"))))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        while "slow" not in self.loads:
+            self.release.wait(0.001)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.loads, ["slow"])
+        self.assertEqual(len({id(library) for library, _ in results}), 1)
+        self.assertEqual((self.cache.misses, self.cache.hits), (1, 3))
+
+    def test_failed_load_is_retried(self):
+        def loader(*key):
+            raise ValueError("Error. No library.")
+
+        cache = LibraryCache(loader=loader)
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                cache.get(("lib", 25, 25, "index"))
+        self.assertEqual(cache.misses, 2)
+
+
+class LatencyStatsTestCase(unittest.TestCase):
+    def test_stats(self):
+        latency = LatencyStats(recent=2)
+        for total in [3.0, 1.0, 2.0]:
+            latency.add({"load": 0.0, "render": total, "encode": 0.0, "total": total})
+        stats = latency.stats()
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["max_seconds"], 2.0)
+        self.assertEqual(stats["mean_render_seconds"], 2.0)
+
+
+class HTTPTestCase(RenderServiceTestCase):
+    """Test the HTTP API with concurrent requests."""
+
+    def setUp(self):
+        super().setUp()
+        self.server = create_server(port=0, default_img_dir=self.tmp)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        super().tearDown()
+
+    def post(self, query, data):
+        return urlopen(Request(f"{self.url}/render?{query}", data=data, method="POST"))
+
+    def test_concurrent_renders(self):
+        responses = []
+
+        def render():
+            with self.post(f"directory={self.tmp}/lib", self.data) as response:
+                responses.append((response.headers, response.read()))
+
+        threads = [threading.Thread(target=render) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(responses), 4)
+        for headers, body in responses:
+            self.assertEqual(headers["Content-Type"], "image/png")
+            self.assertGreater(float(headers["X-Render-Total-Seconds"]), 0)
+            np.testing.assert_array_equal(np.asarray(Image.open(io.BytesIO(body))),
+                                          self.expected_mosaic())
+
+        with urlopen(f"{self.url}/stats") as response:
+            stats = json.loads(response.read())
+        self.assertEqual(stats["latency"]["requests"], 4)
+        self.assertEqual(stats["library_cache"]["misses"], 1)
+
+    def test_bad_requests(self):
+        for query, data, status in [("", self.data, 400), (f"directory={self.tmp}/lib", b"xx", 400),
+                                    (f"directory={self.tmp}/lib&match_mode=blah", self.data, 400),
+                                    ("directory=x%3B%20touch%20pwned%20%23", self.data, 400),
+                                    ("directory=..%2Flib", self.data, 400)]:
+            with self.assertRaises(HTTPError) as context:
+                self.post(query, data)
+            self.assertEqual(context.exception.code, status)
+        with self.assertRaises(HTTPError) as context:
+            urlopen(f"{self.url}/unknown")
+        self.assertEqual(context.exception.code, 404)
+
+    def test_piece_size_out_of_range(self):
+        """Piece sizes are rejected before any library is loaded or atlas written."""
+        for query in ["piece_width=0", "piece_height=-5", f"piece_width={MAX_PIECE_SIZE + 1}"]:
+            with self.assertRaises(HTTPError) as context:
+                self.post(f"directory=lib&{query}", self.data)
+            self.assertEqual(context.exception.code, 400)
+        self.assertEqual(self.server.service.library_cache.misses, 0)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmp, "img_jsons"))), ["lib.lib", "lib2.lib"])
+
+    def test_unexpected_error(self):
+        def fail(*key):
+            raise RuntimeError("boom")
+
+        self.server.service.library_cache.loader = fail
+        with self.assertRaises(HTTPError) as context:
+            self.post("directory=lib", self.data)
+        self.assertEqual(context.exception.code, 500)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,21 @@
 import unittest
+import io
 import subprocess
+import tempfile
 import os
 import json
 
+import numpy as np
 from PIL import Image
 from pathlib import Path
 
-from src.SourceImageProcessor import SourceImageProcessor
+from src.Photomosaic import PhotoMosaic
+from src.SourceImageProcessor import SourceImageProcessor, DecodeReport, process_source_image
+from src.SourceLibrary import descriptor_library_path_for
+from src.ThumbnailAtlas import atlas_path_for
+from src.ThumbnailPyramid import ThumbnailPyramid, pyramid_path_for
+from src.ColorIndex import ColorIndex
+from src.utils.region_stats import mean_colors_for_grid
 
 
 class SourceImageProcessorTestCase(unittest.TestCase):
@@ -167,5 +176,304 @@ class GetImagesFromImgDir(SourceImageProcessorTestCase):
         self.remove_test_with_everything()
 
 
+
+class ParallelPreprocessingTestCase(SourceImageProcessorTestCase):
+    """
+    Test that the source images are standardized the same way whatever the
+    number of workers.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.mkdir(os.path.join(self.tmp_dir.name, "src_imgs"))
+        sizes = [(60, 40), (40, 60), (80, 80), (30, 90), (100, 50)]
+        for i, size in enumerate(sizes):
+            Image.new("RGB", size, (i * 40, 255 - i * 40, 90)).save(
+                os.path.join(self.tmp_dir.name, "src_imgs", f"{i}.png"))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def processor(self, workers=1):
+        check = self.sip(f"{self.tmp_dir.name}/src_imgs", size=(20, 20),
+                         default_img_dir=self.tmp_dir.name, workers=workers, chunksize=2)
+        check.create_img_subdirs()
+        return check
+
+    def standardize(self, workers):
+        colors = self.processor(workers).collect_avg_colors_for_source_imgs()
+        thumbnails = {name: Path(name).read_bytes() for name in colors}
+        return colors, thumbnails
+
+    def test_square_thumbnails(self):
+        colors, _ = self.standardize(1)
+        self.assertEqual(len(colors), 5)
+        for name in colors:
+            self.assertEqual(Image.open(name).size, (20, 20))
+
+    def test_same_output_for_any_worker_count(self):
+        serial = self.standardize(1)
+        self.assertEqual(self.standardize(3), serial)
+
+    def test_sorted_order(self):
+        colors, _ = self.standardize(2)
+        self.assertEqual(list(colors), sorted(colors))
+
+
+class AverageColorTestCase(ParallelPreprocessingTestCase):
+    """
+    Test that source images are averaged like the input image regions.
+    """
+
+    def test_pixel_weighted_average(self):
+        """A mostly black image with a few bright pixels of distinct colors is
+           matched by a dark region of the same mean, not by a gray source."""
+        skewed = Image.new("RGB", (20, 20), (0, 0, 0))
+        for x, color in enumerate([(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 255)]):
+            skewed.putpixel((x * 5, 10), color)
+        skewed_name = os.path.join(self.tmp_dir.name, "skewed.png")
+        gray_name = os.path.join(self.tmp_dir.name, "gray.png")
+        skewed.save(skewed_name)
+        Image.new("RGB", (20, 20), (100, 100, 100)).save(gray_name)
+
+        sources = [process_source_image((name, (20, 20), False, False, ()))
+                   for name in (skewed_name, gray_name)]
+        region = mean_colors_for_grid(np.asarray(Image.open(io.BytesIO(sources[0][2])).convert("RGB")),
+                                      20, 20)[0, 0]
+        np.testing.assert_allclose(sources[0][1], region)
+        np.testing.assert_allclose(sources[0][1], [510 / 400] * 3)
+        self.assertEqual(ColorIndex([color for _, color, _, _, _ in sources]).query(region)[0], 0)
+
+
+class StreamingLibraryBuildTestCase(ParallelPreprocessingTestCase):
+    """
+    Test that the library is built as a stream with progress reports.
+    """
+
+    def test_get_images_from_img_dir_does_not_raise(self):
+        images = list(self.processor().get_images_from_img_dir())
+        self.assertEqual(len(images), 5)
+
+    def test_build_source_library(self):
+        reports = []
+        library = self.processor(workers=2).build_source_library(
+            progress=lambda done, total: reports.append((done, total)))
+        self.assertEqual(reports, [(i, 5) for i in range(1, 6)])
+        expected = {name: list(color) for name, color in self.standardize(1)[0].items()}
+        self.assertEqual(library.to_json_data(), expected)
+
+    def test_standardize_is_a_generator(self):
+        stream = self.processor().standardize_source_images()
+        name, color = next(stream)
+        self.assertTrue(name.endswith("0.png_thumbnail.jpg"))
+        self.assertEqual(len(color), 3)
+
+
+
+class IncrementalRefreshTestCase(ParallelPreprocessingTestCase):
+    """
+    Test that a refresh only processes added or modified source images.
+    """
+
+    def refresh(self, check):
+        reports = []
+        library = check.refresh_source_library(progress=lambda done, total: reports.append(done))
+        return library, reports
+
+    def test_first_refresh_processes_everything(self):
+        check = self.processor()
+        _, reports = self.refresh(check)
+        self.assertEqual(len(reports), 5)
+        self.assertEqual(check.refresh_summary["added"], 5)
+        self.assertEqual(len(check.read_manifest()), 5)
+
+    def test_nothing_changed(self):
+        check = self.processor()
+        self.refresh(check)
+        _, reports = self.refresh(check)
+        self.assertEqual(reports, [])
+        self.assertEqual(check.refresh_summary["unchanged"], 5)
+
+    def test_added_modified_and_deleted(self):
+        check = self.processor()
+        self.refresh(check)
+        src_dir = os.path.join(self.tmp_dir.name, "src_imgs")
+        Image.new("RGB", (50, 50), (1, 2, 3)).save(os.path.join(src_dir, "5.png"))
+        Image.new("RGB", (50, 70), (9, 9, 9)).save(os.path.join(src_dir, "1.png"))
+        os.remove(os.path.join(src_dir, "3.png"))
+        deleted_thumbnail = check.thumbnail_name(f"{src_dir}/3.png")
+
+        library, reports = self.refresh(check)
+        self.assertEqual(len(reports), 2)
+        self.assertEqual(check.refresh_summary,
+                         {"added": 1, "modified": 1, "deleted": 1, "unchanged": 3})
+        self.assertFalse(os.path.exists(deleted_thumbnail))
+
+        refreshed = library.to_json_data()
+        self.assertEqual(refreshed, check.build_source_library(progress=None).to_json_data())
+
+    def test_touched_but_same_contents(self):
+        check = self.processor()
+        self.refresh(check)
+        os.utime(os.path.join(self.tmp_dir.name, "src_imgs", "0.png"), (0, 0))
+        _, reports = self.refresh(check)
+        self.assertEqual(reports, [])
+
+
+
+class ThumbnailPyramidTestCase(ParallelPreprocessingTestCase):
+    """
+    Test that the library is built with a thumbnail pyramid from which an
+    atlas of any piece size is made.
+    """
+
+    def processor(self, workers=1):
+        check = self.sip(f"{self.tmp_dir.name}/src_imgs", size=(20, 20), default_img_dir=self.tmp_dir.name,
+                         workers=workers, chunksize=2, pyramid_levels=(8, 16, 32))
+        check.create_img_subdirs()
+        return check
+
+    def test_pyramid_built_with_library(self):
+        library = self.processor(workers=2).build_source_library(progress=None)
+        pyramid = ThumbnailPyramid(library.path, (8, 16, 32))
+        self.assertTrue(pyramid.is_complete(5, (8, 16, 32)))
+        np.testing.assert_array_equal(pyramid.atlases[32][4][16, 16], [160, 95, 90])
+
+    def test_refresh_keeps_pyramid_of_unchanged_images(self):
+        check = self.processor()
+        library = check.build_source_library(progress=None)
+        before = ThumbnailPyramid(library.path, (8, 16, 32)).atlases[16][0].copy()
+        Image.new("RGB", (50, 50), (1, 2, 3)).save(os.path.join(self.tmp_dir.name, "src_imgs", "5.png"))
+        library = check.refresh_source_library(progress=None)
+        pyramid = ThumbnailPyramid(library.path, (8, 16, 32))
+        self.assertTrue(pyramid.is_complete(6, (8, 16, 32)))
+        np.testing.assert_array_equal(pyramid.atlases[16][0], before)
+        np.testing.assert_array_equal(pyramid.atlases[16][5][0, 0], [1, 2, 3])
+
+    def test_atlas_for_any_piece_size(self):
+        check = self.processor()
+        library = check.build_source_library(progress=None)
+        atlas = check.read_thumbnail_atlas(library, (12, 10))
+        self.assertEqual(atlas.size, (12, 10))
+        self.assertEqual(len(atlas), 5)
+        np.testing.assert_array_equal(atlas[0][5, 6], [0, 255, 90])
+
+    def test_level_size_reads_the_level(self):
+        check = self.processor()
+        library = check.build_source_library(progress=None)
+        atlas = check.read_thumbnail_atlas(library, (16, 16))
+        self.assertEqual(atlas.path, pyramid_path_for(library.path, 16))
+        self.assertFalse(os.path.exists(atlas_path_for(library.path, (16, 16))))
+
+    def test_render_reads_the_pyramid(self):
+        """A mosaic reads its thumbnails from the closest level, not the 20 pixel files."""
+        check = self.processor()
+        library = check.build_source_library(progress=None)
+        pyramid = ThumbnailPyramid(library.path, check.pyramid_levels)
+        photo_mosaic = PhotoMosaic(filename="test_eagle.jpg", directory=check.img_dir, piece_width=32,
+                                   piece_height=32)
+        fetch_thumbnail = photo_mosaic.thumbnail_fetcher(check, library)
+        np.testing.assert_array_equal(np.asarray(fetch_thumbnail(4, (32, 32))), pyramid.atlases[32][4])
+        self.assertEqual(fetch_thumbnail(4, (24, 24)).size, (24, 24))
+        self.assertEqual(photo_mosaic.metrics.counter("pyramid_thumbnails"), 2)
+        self.assertEqual(photo_mosaic.metrics.counter("thumbnail_opens"), 0)
+
+    def test_resized_atlas_is_not_a_level(self):
+        """An atlas upscaled from the 20 pixel thumbnails is never resized again."""
+        check = self.processor()
+        check.pyramid_levels = ()
+        library = check.build_source_library(progress=None)
+        check.read_thumbnail_atlas(library, (32, 32))
+        check.pyramid_levels = (8, 16, 32)
+        self.assertEqual(ThumbnailPyramid(library.path, check.pyramid_levels).levels, [])
+        opens = check.metrics.counter("thumbnail_opens")
+        check.read_thumbnail_atlas(library, (16, 16))
+        self.assertEqual(check.metrics.counter("thumbnail_opens") - opens, 5)
+
+    def test_descriptors_at_piece_size(self):
+        check = self.processor()
+        library = check.build_source_library(progress=None)
+        before = set(os.listdir(os.path.dirname(library.path)))
+        descriptors = check.read_descriptor_library(library, 2, (16, 16))
+        self.assertEqual(set(os.listdir(os.path.dirname(library.path))) - before,
+                         {os.path.basename(descriptor_library_path_for(library.path, 2, (16, 16)))})
+        np.testing.assert_allclose(descriptors.colors[1], [40, 215, 90] * 4)
+
+
+class MetricsTestCase(ThumbnailPyramidTestCase):
+    """
+    Test that building and refreshing the library is timed and counted.
+    """
+
+    def test_build_metrics(self):
+        check = self.processor()
+        check.build_source_library(progress=None)
+        sizes = sum(os.path.getsize(os.path.join(self.tmp_dir.name, "src_imgs", fn))
+                    for fn in os.listdir(os.path.join(self.tmp_dir.name, "src_imgs")) if fn.endswith(".png"))
+        self.assertEqual(check.metrics.counter("source_images_processed"), 5)
+        self.assertEqual(check.metrics.counter("source_images_added"), 5)
+        self.assertEqual(check.metrics.counter("bytes_read"), sizes)
+        self.assertGreater(check.metrics.counter("bytes_written"), 0)
+        report = check.metrics.report()
+        self.assertEqual(report["timers"]["scan"]["count"], 1)
+        self.assertEqual(report["timers"]["process_source_images"]["count"], 1)
+
+        check.refresh_source_library(progress=None)
+        self.assertEqual(check.metrics.counter("source_images_processed"), 5)
+        self.assertEqual(check.metrics.counter("source_images_unchanged"), 5)
+
+
+class DecodeReportTestCase(SourceImageProcessorTestCase):
+    """
+    Test that the decode report adds up the saved decode time and memory.
+    """
+
+    def test_process_source_image_stats(self):
+        _, _, _, _, stats = process_source_image(("test_eagle.jpg", (25, 25), True, True, ()))
+        drafted, full_pixels, decoded_pixels, seconds, sample = stats
+        self.assertTrue(drafted)
+        self.assertLess(decoded_pixels, full_pixels)
+        self.assertEqual(len(sample), 2)
+
+    def test_full_decode_option(self):
+        _, _, _, _, stats = process_source_image(("test_eagle.jpg", (25, 25), False, True, ()))
+        self.assertFalse(stats[0])
+        self.assertEqual(stats[1], stats[2])
+        self.assertIsNone(stats[4])
+
+    def test_summary(self):
+        report = DecodeReport()
+        report.add((True, 1000, 100, 1.0, (0.5, 2.0)))
+        report.add((False, 500, 500, 2.0, None))
+        summary = report.summary()
+        self.assertEqual((summary["images"], summary["drafted"], summary["full_decodes"]), (2, 1, 1))
+        self.assertEqual(summary["bytes_saved"], 3 * 900)
+        self.assertEqual(summary["estimated_full_decode_seconds"], 6.0)
+        self.assertEqual(summary["seconds_saved"], 3.0)
+        self.assertFalse(summary["estimate_reliable"])
+        self.assertIn("reduced scale", str(report))
+        self.assertIn("from only 1 sampled images", str(report))
+
+    def test_median_speedup(self):
+        """One outlying sample does not swing the estimate, and it never goes below no saving."""
+        report = DecodeReport()
+        for sample in [(1.0, 3.0), (1.0, 2.0), (8.0, 1.0)]:
+            report.add((True, 1000, 100, 1.0, sample))
+        summary = report.summary()
+        self.assertTrue(summary["estimate_reliable"])
+        self.assertEqual(summary["seconds_saved"], 3.0)
+
+        slower = DecodeReport()
+        slower.add((True, 1000, 100, 1.0, (2.0, 1.0)))
+        self.assertEqual(slower.summary()["seconds_saved"], 0.0)
+
+    def test_first_image_not_sampled(self):
+        s_img_p = SourceImageProcessor(self.test_img_dir, sample_full_decode_every=2)
+        filenames = ["test_eagle.jpg"] * 5
+        samples = [stats[4] is not None for _, _, _, _, stats in s_img_p.process_source_images(filenames)]
+        self.assertEqual(samples, [False, False, True, False, True])
+
+
 if __name__ == '__main__':
     unittest.main()
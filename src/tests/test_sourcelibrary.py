@@ -0,0 +1,126 @@
+import unittest
+import tempfile
+import os
+import json
+
+import numpy as np
+
+from src.SourceLibrary import SourceLibrary, SourceLibraryWriter, convert_json_library
+from src.utils.validation_util import validate_json_data
+
+
+class SourceLibraryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.sl = SourceLibrary
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.library_path = os.path.join(self.tmp_dir.name, "test.lib")
+        self.names = ["test_png_thumbnail.jpg", "test_png_thumbnail_2a.jpg", "ünïcode.jpg"]
+        self.colors = [[104, 112, 99], [132, 94, 19], [0.5, 254.25, 7]]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+class WriteAndOpenTestCase(SourceLibraryTestCase):
+    """Test that a written library is read back unchanged."""
+
+    def test_round_trip(self):
+        self.sl.write(self.library_path, self.names, self.colors)
+        library = self.sl(self.library_path)
+        self.assertEqual(len(library), 3)
+        self.assertEqual(list(library.names), self.names)
+        np.testing.assert_array_equal(library.colors, np.array(self.colors, dtype=np.float32))
+
+    def test_getitem(self):
+        self.sl.write(self.library_path, self.names, self.colors)
+        self.assertEqual(self.sl(self.library_path)[1], ("test_png_thumbnail_2a.jpg", (132.0, 94.0, 19.0)))
+
+    def test_empty_library(self):
+        self.sl.write(self.library_path, [], [])
+        self.assertEqual(len(self.sl(self.library_path)), 0)
+
+    def test_name_out_of_range(self):
+        self.sl.write(self.library_path, self.names, self.colors)
+        with self.assertRaises(IndexError):
+            self.sl(self.library_path).names[3]
+
+    def test_wrong_number_of_color_values(self):
+        with self.assertRaises(ValueError):
+            with SourceLibraryWriter(self.library_path) as writer:
+                writer.append("a.jpg", [1, 2])
+        self.assertFalse(os.path.exists(self.library_path))
+
+    def test_not_a_library(self):
+        with open(self.library_path, "wb") as out:
+            out.write(b"x" * 100)
+        with self.assertRaises(ValueError):
+            self.sl(self.library_path)
+
+
+class ConvertJsonLibraryTestCase(SourceLibraryTestCase):
+    """Test the one-shot conversion of img_jsons/*.txt files."""
+
+    def test_convert(self):
+        json_path = os.path.join(self.tmp_dir.name, "test.txt")
+        json_data = dict(zip(self.names[:2], self.colors[:2]))
+        with open(json_path, "w") as out:
+            json.dump([json_data], out)
+        library = convert_json_library(json_path)
+        self.assertEqual(library.path, self.library_path)
+        self.assertEqual(library.to_json_data(), json_data)
+
+
+class ValidateJsonDataTestCase(SourceLibraryTestCase):
+    """
+    Test that the JSON data of a library is error-handled
+    when instance types or integers are incorrect.
+    """
+
+    def test_empty_thumbnail_file_path(self):
+        self.sample_json_data = {"": 5, "monkey": [0, 7, 0]}
+        with self.assertRaises(ValueError):
+            validate_json_data(self.sample_json_data)
+
+    def test_none_thumbnail_file_path(self):
+        self.sample_json_data = {None: 5, "monkey": [0, 7, 0]}
+        with self.assertRaises(ValueError):
+            validate_json_data(self.sample_json_data)
+
+    def test_incorrect_type_thumbnail_file_path(self):
+        self.sample_json_data = {5: 5, "monkey": [0, 7, 0]}
+        with self.assertRaises(TypeError):
+            validate_json_data(self.sample_json_data)
+
+    def test_thumbnail_file_does_not_exist(self):
+        self.sample_json_data = {"test_png_thumbnail_2.jpg": [104, 112, 99]}
+        with self.assertRaises(FileNotFoundError):
+            validate_json_data(self.sample_json_data)
+
+    def test_empty_pixel_value(self):
+        self.sample_json_data = {"test_png_thumbnail.jpg": []}
+        with self.assertRaises(ValueError):
+            validate_json_data(self.sample_json_data)
+
+    def test_none_pixel_value(self):
+        self.sample_json_data = {"test_png_thumbnail.jpg": None}
+        with self.assertRaises(ValueError):
+            validate_json_data(self.sample_json_data)
+
+    def test_incorrect_pixel_value_type(self):
+        self.sample_json_data = {"test_png_thumbnail.jpg": "bananas"}
+        with self.assertRaises(TypeError):
+            validate_json_data(self.sample_json_data)
+
+    def test_pixels_out_of_range(self):
+        self.sample_json_data = {"test_png_thumbnail.jpg": [7, 13, 400]}
+        with self.assertRaises(ValueError):
+            validate_json_data(self.sample_json_data)
+
+    def test_negative_pixels_out_of_range(self):
+        self.sample_json_data = {"test_png_thumbnail.jpg": [-7, 13, 200]}
+        with self.assertRaises(ValueError):
+            validate_json_data(self.sample_json_data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import tempfile
+import os
+
+import numpy as np
+from PIL import Image
+
+from src.ThumbnailAtlas import ThumbnailAtlas, ThumbnailAtlasWriter, atlas_path_for
+
+
+class ThumbnailAtlasTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ta = ThumbnailAtlas
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.atlas_path = os.path.join(self.tmp_dir.name, "test_25x25.atlas")
+        self.names = ["test_png_thumbnail.jpg", "test_png_thumbnail_2a.jpg"]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+class AtlasPathTestCase(ThumbnailAtlasTestCase):
+    def test_atlas_path_for(self):
+        self.assertEqual(atlas_path_for("img_sets/img_jsons/flower_imgs.lib", (25, 25)),
+                         "img_sets/img_jsons/flower_imgs_25x25.atlas")
+
+
+class BuildTestCase(ThumbnailAtlasTestCase):
+    """Test that the atlas holds every thumbnail in library order."""
+
+    def test_build(self):
+        atlas = self.ta.build(self.atlas_path, self.names, (25, 25))
+        self.assertEqual(len(atlas), 2)
+        self.assertEqual(atlas.size, (25, 25))
+        for i, name in enumerate(self.names):
+            expected = np.asarray(Image.open(name).convert("RGB").resize((25, 25)))
+            np.testing.assert_array_equal(atlas[i], expected)
+
+    def test_image(self):
+        atlas = self.ta.build(self.atlas_path, self.names[:1], (10, 20))
+        self.assertEqual(atlas.image(0).size, (10, 20))
+
+    def test_wrong_thumbnail_shape(self):
+        with self.assertRaises(ValueError):
+            with ThumbnailAtlasWriter(self.atlas_path, (25, 25)) as writer:
+                writer.append(np.zeros((10, 10, 3), dtype=np.uint8))
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+    def test_not_an_atlas(self):
+        with open(self.atlas_path, "wb") as out:
+            out.write(b"x" * 100)
+        with self.assertRaises(ValueError):
+            self.ta(self.atlas_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+from PIL import Image
+
+from src.ThumbnailCache import ThumbnailCache
+
+
+class ThumbnailCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tc = ThumbnailCache
+        self.decoded = []
+
+    def loader(self, key):
+        """Creates a 10 x 10 RGB thumbnail (300 bytes) and records the decode."""
+        self.decoded.append(key)
+        return Image.new("RGB", (10, 10), (key, key, key))
+
+
+class InitTestCase(ThumbnailCacheTestCase):
+    def test_negative_size(self):
+        with self.assertRaises(ValueError):
+            self.tc(-1)
+
+    def test_empty_stats(self):
+        self.assertEqual(self.tc().stats()["hit_rate"], 0.0)
+
+
+class GetTestCase(ThumbnailCacheTestCase):
+    """Test the hit/miss counters and the LRU eviction."""
+
+    def test_hits_and_misses(self):
+        cache = self.tc(loader=self.loader)
+        for key in [1, 2, 1, 1, 2]:
+            cache.get(key)
+        self.assertEqual((cache.hits, cache.misses), (3, 2))
+        self.assertEqual(self.decoded, [1, 2])
+
+    def test_returns_decoded_thumbnail(self):
+        self.assertEqual(self.tc(loader=self.loader).get(7).getpixel((0, 0)), (7, 7, 7))
+
+    def test_least_recently_used_evicted(self):
+        cache = self.tc(max_bytes=600, loader=self.loader)
+        cache.get(1)
+        cache.get(2)
+        cache.get(1)
+        cache.get(3)
+        self.assertIn(1, cache)
+        self.assertNotIn(2, cache)
+        self.assertEqual(cache.evictions, 1)
+        self.assertLessEqual(cache.current_bytes, 600)
+
+    def test_thumbnail_larger_than_budget_not_cached(self):
+        cache = self.tc(max_bytes=100, loader=self.loader)
+        cache.get(1)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.current_bytes, 0)
+
+    def test_opens_thumbnail_file(self):
+        self.assertEqual(self.tc().get("test_png_thumbnail.jpg").size, (25, 25))
+
+
+if __name__ == '__main__':
+    unittest.main()
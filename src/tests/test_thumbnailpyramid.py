@@ -0,0 +1,73 @@
+import unittest
+import tempfile
+import os
+
+import numpy as np
+from PIL import Image
+
+from src.SourceLibrary import SourceLibrary
+from src.ThumbnailPyramid import ThumbnailPyramid, ThumbnailPyramidWriter, pyramid_arrays
+
+
+class ThumbnailPyramidTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tp = ThumbnailPyramid
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.library_path = os.path.join(self.tmp_dir.name, "test.lib")
+        self.levels = (8, 16, 32)
+        self.images = [Image.new("RGB", (40, 40), color) for color in [(255, 0, 0), (0, 0, 255)]]
+        SourceLibrary.write(self.library_path, ["a", "b"], [(255, 0, 0), (0, 0, 255)])
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_pyramid(self, levels=None):
+        levels = levels or self.levels
+        with ThumbnailPyramidWriter(self.library_path, levels) as writer:
+            for image in self.images:
+                writer.append(pyramid_arrays(image, levels))
+        return self.tp(self.library_path, self.levels)
+
+
+class PyramidArraysTestCase(ThumbnailPyramidTestCase):
+    def test_one_array_per_level(self):
+        arrays = pyramid_arrays(Image.new("RGBA", (70, 50)), self.levels)
+        self.assertEqual([array.shape for array in arrays], [(8, 8, 3), (16, 16, 3), (32, 32, 3)])
+
+
+class PyramidTestCase(ThumbnailPyramidTestCase):
+    """Test that every level holds the thumbnails in library order."""
+
+    def test_write_and_open(self):
+        pyramid = self.write_pyramid()
+        self.assertEqual(pyramid.levels, [8, 16, 32])
+        self.assertTrue(pyramid.is_complete(2, self.levels))
+        for level in self.levels:
+            np.testing.assert_array_equal(pyramid.atlases[level][1][0, 0], [0, 0, 255])
+        self.assertEqual([array.shape[0] for array in pyramid.arrays(0, self.levels)], [8, 16, 32])
+
+    def test_missing_levels(self):
+        pyramid = self.write_pyramid(levels=(8,))
+        self.assertEqual(pyramid.levels, [8])
+        self.assertFalse(pyramid.is_complete(2, self.levels))
+
+    def test_level_for(self):
+        pyramid = self.write_pyramid()
+        self.assertEqual(pyramid.level_for((8, 8)), 8)
+        self.assertEqual(pyramid.level_for((10, 5)), 16)
+        self.assertEqual(pyramid.level_for((25, 25)), 32)
+        self.assertEqual(pyramid.level_for((100, 40)), 32)
+
+    def test_no_pyramid(self):
+        pyramid = self.tp(self.library_path, self.levels)
+        self.assertIsNone(pyramid.level_for((25, 25)))
+
+    def test_older_than_library(self):
+        self.write_pyramid()
+        later = os.path.getmtime(self.library_path) + 10
+        os.utime(self.library_path, (later, later))
+        self.assertEqual(self.tp(self.library_path, self.levels).levels, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import unittest
+import tracemalloc
+import os
+
+import numpy as np
+from PIL import Image
+
+from src.TiledRenderer import TiledRenderer
+from src.PipelinedRenderer import PipelinedRenderer
+from src.utils.pipeline import Pipeline
+from src.utils.streaming_io import iter_image_bands, StreamingPNGWriter
+from src.tests.library_fixture import LibraryTestCase
+
+
+class TiledRendererTestCase(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tr = TiledRenderer
+
+    def save_input(self, extension):
+        filename = os.path.join(self.tmp, f"input.{extension}")
+        self.input_img.save(filename)
+        return filename
+
+    def renderer(self, **kwargs):
+        return self.tr(f"{self.tmp}/lib", default_img_dir=self.tmp, **kwargs)
+
+
+class InitTestCase(TiledRendererTestCase):
+    def test_no_band_rows(self):
+        with self.assertRaises(ValueError):
+            self.renderer(band_rows=0)
+
+
+class RenderTestCase(TiledRendererTestCase):
+    """Test that the mosaic is rendered the same for every band height and format."""
+
+    def test_render(self):
+        for extension in ["png", "ppm", "bmp"]:
+            for band_rows in [1, 2, 5]:
+                output = self.renderer(band_rows=band_rows).render(
+                    self.save_input(extension), os.path.join(self.tmp, "out.png"))
+                np.testing.assert_array_equal(np.asarray(Image.open(output)), self.expected_mosaic())
+
+    def test_batched_match_mode(self):
+        output = self.renderer(match_mode="batched").render(
+            self.save_input("png"), os.path.join(self.tmp, "out.png"))
+        np.testing.assert_array_equal(np.asarray(Image.open(output)), self.expected_mosaic())
+
+    def test_cells(self):
+        for match_mode in ["index", "batched"]:
+            output = self.renderer(match_mode=match_mode, cells=3, band_rows=1).render(
+                self.save_input("png"), os.path.join(self.tmp, "out.png"))
+            np.testing.assert_array_equal(np.asarray(Image.open(output)), self.expected_mosaic())
+
+
+class StreamingIOTestCase(TiledRendererTestCase):
+    """Test the band reader and the streaming PNG writer."""
+
+    def test_bands_match_image(self):
+        self.input_img.paste((0, 255, 0), (0, 0, 7, 13))
+        expected = np.asarray(self.input_img)
+        for extension in ["png", "ppm", "bmp", "tif"]:
+            bands = list(iter_image_bands(self.save_input(extension), 25))
+            self.assertEqual([top for top, _ in bands], [0, 25, 50])
+            np.testing.assert_array_equal(np.vstack([band for _, band in bands]), expected)
+
+    def test_bands_of_decoded_image(self):
+        """A compressed input is handed out without an array of the whole image."""
+        pixels = np.random.RandomState(4).randint(0, 256, size=(1200, 900, 3)).astype(np.uint8)
+        filename = os.path.join(self.tmp, "large.png")
+        Image.fromarray(pixels).save(filename)
+        tracemalloc.start()
+        try:
+            tops = [top for top, band in iter_image_bands(filename, 25)]
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(tops, list(range(0, 1200, 25)))
+        self.assertLess(peak, pixels.nbytes // 4)
+
+    def test_png_round_trip(self):
+        pixels = np.random.RandomState(3).randint(0, 256, size=(30, 17, 3)).astype(np.uint8)
+        filename = os.path.join(self.tmp, "out.png")
+        with StreamingPNGWriter(filename, 17, 30) as writer:
+            writer.write_rows(pixels[:11])
+            writer.write_rows(pixels[11:11])
+            writer.write_rows(pixels[11:])
+        np.testing.assert_array_equal(np.asarray(Image.open(filename)), pixels)
+
+    def test_png_missing_rows(self):
+        with self.assertRaises(ValueError):
+            with StreamingPNGWriter(os.path.join(self.tmp, "out.png"), 5, 5) as writer:
+                writer.write_rows(np.zeros((4, 5, 3), dtype=np.uint8))
+
+
+class PipelinedRenderTestCase(RenderTestCase):
+    """Test that the pipelined stages render the same mosaic as TiledRenderer."""
+
+    def setUp(self):
+        super().setUp()
+        self.tr = PipelinedRenderer
+
+    def test_stage_stats(self):
+        renderer = self.renderer(band_rows=1, queue_size=1)
+        renderer.render(self.save_input("png"), os.path.join(self.tmp, "out.png"))
+        report = renderer.pipeline.report()
+        self.assertEqual(list(report["stages"]), ["decode", "stats", "match", "assemble", "encode"])
+        for stats in report["stages"].values():
+            self.assertEqual(stats["items"], 2)
+            self.assertLessEqual(stats["max_depth"], 1)
+            self.assertGreaterEqual(stats["busy_seconds"], 0.0)
+        self.assertIn("encode", str(renderer.pipeline))
+
+
+class PipelineTestCase(unittest.TestCase):
+    """Test the ordering, bounds and errors of the stage pipeline."""
+
+    def test_order(self):
+        pipeline = Pipeline([("double", lambda n: 2 * n), ("add", lambda n: n + 1)], queue_size=3)
+        self.assertEqual(pipeline.run(range(50)), [2 * n + 1 for n in range(50)])
+        self.assertEqual(pipeline.stats["add"].items, 50)
+        self.assertLessEqual(pipeline.stats["add"].max_depth, 3)
+
+    def test_stage_error(self):
+        def fail(n):
+            if n == 3:
+                raise ValueError("Error. Bad item.")
+            return n
+        pipeline = Pipeline([("fail", fail), ("pass", lambda n: n)], queue_size=1)
+        with self.assertRaises(ValueError):
+            pipeline.run(range(100))
+
+    def test_source_error(self):
+        def source():
+            yield 1
+            raise OSError("Error. Cannot read.")
+        with self.assertRaises(OSError):
+            Pipeline([("pass", lambda n: n)]).run(source())
+
+    def test_no_queue(self):
+        with self.assertRaises(ValueError):
+            Pipeline([("pass", lambda n: n)], queue_size=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+"""This script provides vectorized mosaic assembly for the Photomosaic.py and TiledRenderer.py files."""
+
+import numpy as np
+
+
+def assemble_grid(matches, thumbnails, out=None):
+    """Assembles a mosaic from a grid of matched source image indices and a
+       contiguous array of thumbnails. The thumbnails of each grid row are
+       gathered in one indexing operation and written into their band of the
+       output with a transpose, so no thumbnail is pasted one at a time and
+       only one row of thumbnails is copied outside the output at once.
+
+       Args:
+           matches: (numpy.ndarray) (rows, cols) thumbnail indices
+           thumbnails: (numpy.ndarray) (count, height, width, channels) thumbnails
+           out: (numpy.ndarray) Optional. A C-contiguous
+                                (rows * height, cols * width, channels) buffer
+                                the mosaic is written into. Default: a new array
+
+       Returns:
+           (numpy.ndarray) (rows * height, cols * width, channels) pixels of
+           the mosaic, which is out when given
+    """
+
+    matches = np.asarray(matches)
+    if matches.ndim != 2:
+        raise ValueError("Error. Matches must be a (rows, cols) grid.")
+    rows, cols = matches.shape
+    _, height, width, channels = thumbnails.shape
+    shape = (rows * height, cols * width, channels)
+    if out is None:
+        out = np.empty(shape, dtype=thumbnails.dtype)
+    elif out.shape != shape or not out.flags.c_contiguous:
+        raise ValueError(f"Error. The output buffer must be a contiguous {shape} array.")
+
+    bands = out.reshape(rows, height, cols, width, channels)
+    for row in range(rows):
+        bands[row] = thumbnails[matches[row]].transpose(1, 0, 2, 3)
+    return out
@@ -2,6 +2,7 @@
 """This script provides helper functions for the Photomosaic.py file."""
 
 import functools
+import hashlib
 import logging
 
 
@@ -102,6 +103,37 @@ def trim_height(img, width, height):
     return img.crop((left, top, width, bottom)) 
 
 
+def print_progress(done, total, every=100):
+    """Prints how many of the total items are done, every so many items.
+
+       Args:
+           done: (int) number of items done
+           total: (int) total number of items
+           every: (int) how often to print. Default: 100
+    """
+
+    if done % every == 0 or done == total:
+        print(f"Processed {done}/{total} ({100 * done / total:.1f}%)")
+
+
+def file_digest(filename, block_size=2 ** 20):
+    """Calculates the SHA-1 hash of a file's contents.
+
+       Args:
+           filename: (string) the file
+           block_size: (int) number of bytes read at a time. Default: 1 MiB
+
+       Returns:
+           (string) the hex digest
+    """
+
+    sha1 = hashlib.sha1()
+    with open(filename, "rb") as contents:
+        for block in iter(lambda: contents.read(block_size), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
 class Logger(object):
     """
     Logger creates a logger object to help debug aspects of each module. It
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""This script provides vectorized color matching for the Photomosaic.py file."""
+
+import numpy as np
+
+# 64 MiB of float64 distances per chunk
+DEFAULT_MEMORY_BUDGET = 64 * 2 ** 20
+
+
+def chunk_sizes(num_regions, num_sources, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """Calculates how many regions and source colors are compared at once so
+       that one chunk of the distance matrix fits in the memory budget.
+
+       Args:
+           num_regions: (int) number of region colors
+           num_sources: (int) number of source colors
+           memory_budget: (int) bytes available for one chunk of distances
+
+       Returns:
+           (int, int) region chunk size and source chunk size
+    """
+
+    if memory_budget <= 0:
+        raise ValueError("Error. Memory budget must be greater than zero.")
+    max_cells = max(1, memory_budget // np.dtype(np.float64).itemsize)
+    source_chunk = max(1, min(num_sources, max_cells))
+    region_chunk = max(1, min(num_regions, max_cells // source_chunk))
+    return region_chunk, source_chunk
+
+
+def batched_nearest(region_colors, source_colors, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """Finds the closest source color for every region color. The squared
+       distances are computed as |a|^2 - 2ab + |b|^2 in chunks, keeping a
+       running minimum, so the full regions x sources distance matrix is
+       never built.
+
+       Args:
+           region_colors: (numpy.ndarray) (m, dims) array of region colors
+           source_colors: (numpy.ndarray) (n, dims) array of source colors
+           memory_budget: (int) bytes available for one chunk of distances
+
+       Returns:
+           (numpy.ndarray) int64 array of the m closest source positions
+    """
+
+    regions = np.asarray(region_colors, dtype=np.float64)
+    sources = np.asarray(source_colors, dtype=np.float64)
+    if not len(sources):
+        raise ValueError("Error. There are no source colors to match against.")
+
+    region_chunk, source_chunk = chunk_sizes(len(regions), len(sources), memory_budget)
+    source_norms = (sources ** 2).sum(axis=1)
+    matches = np.empty(len(regions), dtype=np.int64)
+
+    for r_start in range(0, len(regions), region_chunk):
+        block = regions[r_start:r_start + region_chunk]
+        block_norms = (block ** 2).sum(axis=1)[:, None]
+        best_dist = np.full(len(block), np.inf)
+        best_pos = np.zeros(len(block), dtype=np.int64)
+
+        for s_start in range(0, len(sources), source_chunk):
+            s_end = s_start + source_chunk
+            dists = block_norms - 2 * block @ sources[s_start:s_end].T + source_norms[s_start:s_end]
+            nearest = dists.argmin(axis=1)
+            nearest_dist = dists[np.arange(len(block)), nearest]
+            closer = nearest_dist < best_dist
+            best_dist[closer] = nearest_dist[closer]
+            best_pos[closer] = nearest[closer] + s_start
+
+        matches[r_start:r_start + len(block)] = best_pos
+    return matches
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""This script provides timers, counters and report sinks for the Photomosaic.py and SourceImageProcessor.py files."""
+
+import json
+import time
+import threading
+import contextlib
+
+
+class Metrics(object):
+    """Metrics collects the instrumentation of a run: a timer for each stage
+       (number of times it ran, total and longest seconds) and counters such
+       as regions processed, thumbnail opens or bytes read and written.
+       Labels, e.g. the library name, are attached to the report so reports
+       from many runs can be grouped. The report is a JSON-serializable
+       dictionary that emit hands to every sink, so where it goes (a file, a
+       log, a dashboard client) is pluggable. Metrics can be shared between
+       threads.
+
+       Attributes:
+           labels: (dict) name and value of each label
+           sinks: (list) functions called with the report by emit
+    """
+
+    def __init__(self, labels=None, sinks=()):
+        """Initializes Metrics with labels and sinks."""
+        self.labels = dict(labels or {})
+        self.sinks = list(sinks)
+        self._timers = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def add_sink(self, sink):
+        """Adds a function called with the report by emit."""
+        self.sinks.append(sink)
+
+    def count(self, name, n=1):
+        """Adds n to a counter."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def add_time(self, name, seconds):
+        """Adds one run of a stage to its timer."""
+        with self._lock:
+            runs, total, longest = self._timers.get(name, (0, 0.0, 0.0))
+            self._timers[name] = (runs + 1, total + seconds, max(longest, seconds))
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """Times the code in a with block as one run of a stage."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def counter(self, name):
+        """Returns the value of a counter, 0 if it was never counted."""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def seconds(self, name):
+        """Returns the total seconds of a timer, 0.0 if it never ran."""
+        with self._lock:
+            return self._timers.get(name, (0, 0.0, 0.0))[1]
+
+    def report(self):
+        """Returns the labels, timers and counters as a dictionary."""
+        with self._lock:
+            return {"labels": dict(self.labels),
+                    "timers": {name: {"count": runs, "seconds": total, "max_seconds": longest}
+                               for name, (runs, total, longest) in self._timers.items()},
+                    "counters": dict(self._counters)}
+
+    def to_json(self):
+        return json.dumps(self.report(), sort_keys=True)
+
+    def emit(self):
+        """Hands the report to every sink.
+
+           Returns:
+               (dict) the report
+        """
+
+        report = self.report()
+        for sink in self.sinks:
+            sink(report)
+        return report
+
+    def reset(self):
+        """Clears the timers and counters, keeping the labels and sinks."""
+        with self._lock:
+            self._timers = {}
+            self._counters = {}
+
+
+class JSONLinesSink(object):
+    """JSONLinesSink appends each report to a file as one line of JSON, the
+       format log shippers and dashboards usually ingest.
+
+       Attributes:
+           path: (string) the file the reports are appended to
+    """
+
+    def __init__(self, path):
+        """Initializes JSONLinesSink with path."""
+        self.path = path
+
+    def __call__(self, report):
+        with open(self.path, "a") as out:
+            out.write(json.dumps(report, sort_keys=True) + "\n")
+
+
+class LoggerSink(object):
+    """LoggerSink writes each report as JSON to a logging.Logger, e.g. the
+       logger of helpers.Logger.
+
+       Attributes:
+           logger: (logging.Logger) the logger
+    """
+
+    def __init__(self, logger):
+        """Initializes LoggerSink with logger."""
+        self.logger = logger
+
+    def __call__(self, report):
+        self.logger.info(json.dumps(report, sort_keys=True))
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+"""This script provides a threaded stage pipeline for the PipelinedRenderer.py file."""
+
+import time
+import queue
+import threading
+
+# marks the end of the items on a queue
+_DONE = object()
+
+
+class StageStats(object):
+    """StageStats adds up the work of one stage of a Pipeline.
+
+       Attributes:
+           name: (string) the name of the stage
+           items: (int) number of items the stage has handled
+           busy_seconds: (float) time spent working on items
+           starved_seconds: (float) time spent waiting for an input item
+           blocked_seconds: (float) time spent waiting for room on the output queue
+           max_depth: (int) most items seen waiting on the input queue
+           mean_depth: (float) mean number of items waiting on the input queue
+    """
+
+    def __init__(self, name):
+        """Initializes StageStats with the name of the stage."""
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.starved_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.max_depth = 0
+        self._depth_total = 0
+        self._depth_samples = 0
+
+    def sample_depth(self, depth):
+        self.max_depth = max(self.max_depth, depth)
+        self._depth_total += depth
+        self._depth_samples += 1
+
+    @property
+    def mean_depth(self):
+        return self._depth_total / self._depth_samples if self._depth_samples else 0.0
+
+    def as_dict(self):
+        return {"items": self.items, "busy_seconds": self.busy_seconds,
+                "starved_seconds": self.starved_seconds, "blocked_seconds": self.blocked_seconds,
+                "max_depth": self.max_depth, "mean_depth": self.mean_depth}
+
+
+class Pipeline(object):
+    """Pipeline runs a chain of stages concurrently, one thread per stage,
+       linked by bounded queues. Each stage takes the items of the stage
+       before it in order and hands its results on, so a slow stage holds
+       back at most queue_size items upstream instead of the whole input.
+       Stages doing I/O, compression or numpy work release the GIL, so they
+       overlap with each other. The first stage reads the source iterable.
+       If a stage raises, the remaining items are drained and the error is
+       raised from run.
+
+       Attributes:
+           stages: (list) (name, function) of each stage after the source
+           queue_size: (int) number of items each queue can hold. Default: 2
+           stats: (dict) StageStats of each stage by name, from the last run
+           wall_seconds: (float) time taken by the last run
+    """
+
+    def __init__(self, stages, queue_size=2):
+        """Initializes Pipeline with stages and queue_size."""
+        if queue_size < 1:
+            raise ValueError("Error. Pipeline queues need room for at least one item.")
+        if not stages:
+            raise ValueError("Error. A pipeline needs at least one stage.")
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self.stats = {}
+        self.wall_seconds = 0.0
+
+    def run(self, source, source_name="source"):
+        """Runs the items of source through every stage.
+
+           Args:
+               source: (iterable) the input items. Time spent producing them
+                                  is counted as the busy time of the source.
+               source_name: (string) Optional. The name of the source stage.
+                                     Default: "source"
+
+           Returns:
+               (list) the results of the last stage, in input order
+        """
+
+        names = [source_name] + [name for name, _ in self.stages]
+        self.stats = {name: StageStats(name) for name in names}
+        queues = [queue.Queue(self.queue_size) for _ in self.stages]
+        results = []
+        errors = []
+        failed = threading.Event()
+
+        def put(out_queue, item, stats):
+            started = time.perf_counter()
+            out_queue.put(item)
+            stats.blocked_seconds += time.perf_counter() - started
+
+        def run_source():
+            stats = self.stats[source_name]
+            iterator = iter(source)
+            try:
+                while not failed.is_set():
+                    started = time.perf_counter()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        break
+                    stats.busy_seconds += time.perf_counter() - started
+                    stats.items += 1
+                    put(queues[0], item, stats)
+            except BaseException as error:
+                errors.append(error)
+                failed.set()
+            finally:
+                queues[0].put(_DONE)
+
+        def run_stage(position, func):
+            stats = self.stats[names[position + 1]]
+            in_queue = queues[position]
+            out_queue = queues[position + 1] if position + 1 < len(queues) else None
+            while True:
+                stats.sample_depth(in_queue.qsize())
+                started = time.perf_counter()
+                item = in_queue.get()
+                stats.starved_seconds += time.perf_counter() - started
+                if item is _DONE:
+                    break
+                if failed.is_set():
+                    continue
+                try:
+                    started = time.perf_counter()
+                    result = func(item)
+                    stats.busy_seconds += time.perf_counter() - started
+                    stats.items += 1
+                except BaseException as error:
+                    errors.append(error)
+                    failed.set()
+                    continue
+                if out_queue is None:
+                    results.append(result)
+                else:
+                    put(out_queue, result, stats)
+            if out_queue is not None:
+                out_queue.put(_DONE)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=run_source, name=source_name, daemon=True)]
+        threads += [threading.Thread(target=run_stage, args=(position, func), name=name, daemon=True)
+                    for position, (name, func) in enumerate(self.stages)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.wall_seconds = time.perf_counter() - started
+        if errors:
+            raise errors[0]
+        return results
+
+    def report(self):
+        """Returns the per-stage queue depth and busy time of the last run as a dictionary."""
+        return {"wall_seconds": self.wall_seconds,
+                "stages": {name: stats.as_dict() for name, stats in self.stats.items()}}
+
+    def __str__(self):
+        lines = [f"Pipeline finished in {self.wall_seconds:.3f}s"]
+        for name, stats in self.stats.items():
+            busy = stats.busy_seconds / self.wall_seconds if self.wall_seconds else 0.0
+            lines.append(f"  {name:<10} {stats.items:>5} items, busy {stats.busy_seconds:.3f}s "
+                         f"({busy:.0%}), starved {stats.starved_seconds:.3f}s, "
+                         f"blocked {stats.blocked_seconds:.3f}s, queue depth mean "
+                         f"{stats.mean_depth:.1f} max {stats.max_depth}")
+        return "\n".join(lines)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+"""This script provides a profiler writing pstats, collapsed stacks and memory traces for the main.py file."""
+
+import os
+import sys
+import json
+import time
+import marshal
+import cProfile
+import threading
+import tracemalloc
+
+from collections import Counter
+
+PROFILE_MODES = ("deterministic", "sampling")
+# seconds between two stack samples
+DEFAULT_INTERVAL = 0.005
+# allocation sites written to the memory trace
+MEMORY_TOP_SITES = 25
+# growth of the traced memory over the last peak that takes a new snapshot
+PEAK_SNAPSHOT_GROWTH = 1.1
+
+
+def frame_key(code):
+    """Returns the (file name, first line, function name) key pstats uses for a code object."""
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+def frame_label(key):
+    filename, line, name = key
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def sampled_stats(stacks, interval):
+    """Converts stack samples into the stats dictionary pstats reads, so
+       sampling profiles can be browsed like deterministic ones. Each sample
+       counts as one call taking interval seconds: the innermost function of
+       a sample gets its own time, and every function on the stack gets the
+       cumulative time once.
+
+       Args:
+           stacks: (collections.Counter) number of samples of each stack,
+                                         stacks being tuples of frame keys
+                                         from the outermost frame in
+           interval: (float) seconds between two samples
+
+       Returns:
+           (dict) {key: (calls, primitive calls, own seconds, cumulative
+           seconds, {caller key: (calls, primitive calls, own, cumulative)})}
+    """
+
+    stats = {}
+
+    def entry(key):
+        if key not in stats:
+            stats[key] = [0, 0, 0.0, 0.0, {}]
+        return stats[key]
+
+    for stack, samples in stacks.items():
+        seconds = samples * interval
+        leaf = entry(stack[-1])
+        leaf[2] += seconds
+        for key in dict.fromkeys(stack):
+            current = entry(key)
+            current[0] += samples
+            current[1] += samples
+            current[3] += seconds
+        for caller, callee in zip(stack, stack[1:]):
+            calls, primitive, own, cumulative = entry(callee)[4].get(caller, (0, 0, 0.0, 0.0))
+            own_seconds = seconds if callee == stack[-1] else 0.0
+            entry(callee)[4][caller] = (calls + samples, primitive + samples, own + own_seconds,
+                                        cumulative + seconds)
+    return {key: tuple(value) for key, value in stats.items()}
+
+
+class Profiler(object):
+    """Profiler captures a profile of everything run inside a with block and
+       writes it to files next to output_prefix, all tagged with the same
+       tags (e.g. input size, library size and piece size) so profiles of
+       different runs can be compared:
+
+       - [PREFIX].pstats: the profile, for python -m pstats or snakeviz. In
+         "deterministic" mode it is recorded by cProfile, which times every
+         call; in "sampling" mode it is built from the stack samples, which
+         costs far less for long renders, and is skipped if no sample was
+         taken.
+       - [PREFIX].collapsed: the stack samples in collapsed-stack format,
+         one "outer;inner count" line per distinct stack, ready for
+         flamegraph.pl or speedscope. A background thread samples the stack
+         every interval seconds in both modes.
+       - [PREFIX].memory.txt: with trace_memory, the allocation sites holding
+         the most memory when the traced memory peaked, from tracemalloc.
+       - [PREFIX].json: the tags, the mode, the number of samples, the wall
+         and peak memory, and the names of the files.
+
+       Attributes:
+           output_prefix: (string) path the file names start with
+           mode: (string) "deterministic" or "sampling". Default: "sampling"
+           interval: (float) seconds between two stack samples. Default: 0.005
+           trace_memory: (boolean) traces allocations with tracemalloc. Default: False
+           all_threads: (boolean) samples every thread rather than the one that
+                                  entered the with block. Default: False
+           tags: (dict) describe the profiled run; add more with tag
+           stacks: (collections.Counter) number of samples of each stack
+           files: (dict) the files written, by kind
+    """
+
+    def __init__(self, output_prefix, mode="sampling", interval=DEFAULT_INTERVAL, trace_memory=False,
+                 all_threads=False, tags=None):
+        """Initializes Profiler with output_prefix, mode, interval and tags."""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Error. Profile mode must be one of {PROFILE_MODES}.")
+        if interval <= 0:
+            raise ValueError("Error. The sampling interval must be greater than zero.")
+        self.output_prefix = output_prefix
+        self.mode = mode
+        self.interval = interval
+        self.trace_memory = trace_memory
+        self.all_threads = all_threads
+        self.tags = dict(tags or {})
+        self.stacks = Counter()
+        self.files = {}
+        self.wall_seconds = 0.0
+        self.peak_memory = None
+        self._profile = None
+        self._peak_snapshot = None
+        self._stop = threading.Event()
+        self._sampler = None
+        self._thread_id = None
+        self._started = None
+        self._started_tracing = False
+
+    def tag(self, **tags):
+        """Adds tags describing the profiled run, e.g. once the input is decoded."""
+        self.tags.update(tags)
+
+    def __enter__(self):
+        self._thread_id = threading.get_ident()
+        self._stop.clear()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._sampler = threading.Thread(target=self._sample, name="profiler-sampler", daemon=True)
+        self._sampler.start()
+        self._started = time.perf_counter()
+        if self.mode == "deterministic":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._profile is not None:
+            self._profile.disable()
+        self.wall_seconds = time.perf_counter() - self._started
+        self._stop.set()
+        self._sampler.join()
+        if self.trace_memory:
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            if self._peak_snapshot is None:
+                self._peak_snapshot = tracemalloc.take_snapshot()
+            if self._started_tracing:
+                tracemalloc.stop()
+        self.write()
+
+    def _sample(self):
+        """Samples the stacks every interval seconds until the block exits.
+           With trace_memory, a snapshot is also taken whenever the traced
+           memory grows past its last peak."""
+
+        sampler_id = threading.get_ident()
+        names = {}
+        last_peak = 0
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if self.all_threads:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                targets = [ident for ident in frames if ident != sampler_id]
+            else:
+                targets = [self._thread_id] if self._thread_id in frames else []
+            for ident in targets:
+                stack = []
+                frame = frames[ident]
+                while frame is not None:
+                    stack.append(frame_key(frame.f_code))
+                    frame = frame.f_back
+                if self.all_threads:
+                    stack.append(("<thread>", 0, names.get(ident, str(ident))))
+                self.stacks[tuple(reversed(stack))] += 1
+            if self.trace_memory:
+                current = tracemalloc.get_traced_memory()[0]
+                if current > last_peak * PEAK_SNAPSHOT_GROWTH:
+                    last_peak = current
+                    self._peak_snapshot = tracemalloc.take_snapshot()
+
+    def write(self):
+        """Writes the profile files and returns their names by kind."""
+
+        self.files = {"collapsed": f"{self.output_prefix}.collapsed",
+                      "tags": f"{self.output_prefix}.json"}
+        if self._profile is not None:
+            self.files["pstats"] = f"{self.output_prefix}.pstats"
+            self._profile.dump_stats(self.files["pstats"])
+        elif self.stacks:
+            # pstats cannot load an empty profile, e.g. of a block shorter than one interval
+            self.files["pstats"] = f"{self.output_prefix}.pstats"
+            with open(self.files["pstats"], "wb") as out:
+                marshal.dump(sampled_stats(self.stacks, self.interval), out)
+
+        with open(self.files["collapsed"], "w") as out:
+            for stack, samples in sorted(self.stacks.items()):
+                out.write(";".join(frame_label(key) for key in stack) + f" {samples}\n")
+
+        if self._peak_snapshot is not None:
+            self.files["memory"] = f"{self.output_prefix}.memory.txt"
+            with open(self.files["memory"], "w") as out:
+                out.write(f"Peak traced memory: {self.peak_memory / 2 ** 20:.1f} MiB\n")
+                out.write("Largest allocation sites at the peak:\n")
+                for statistic in self._peak_snapshot.statistics("lineno")[:MEMORY_TOP_SITES]:
+                    out.write(f"{statistic}\n")
+
+        with open(self.files["tags"], "w") as out:
+            json.dump({"tags": self.tags, "mode": self.mode, "interval": self.interval,
+                       "samples": sum(self.stacks.values()), "wall_seconds": self.wall_seconds,
+                       "peak_memory_bytes": self.peak_memory, "files": self.files}, out, indent=2)
+        return self.files
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+"""This script provides vectorized region statistics for the Photomosaic.py file."""
+
+import numpy as np
+
+
+def image_to_array(img):
+    """Converts a PIL image into an (height, width, 3) RGB numpy array.
+
+       Args:
+           img: (PIL.image) the image
+
+       Returns:
+           (numpy.ndarray) uint8 array of the RGB pixel values
+    """
+
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return np.asarray(img, dtype=np.uint8)
+
+
+def mean_colors_for_grid(pixels, piece_width, piece_height):
+    """Calculates the average color of every piece_width x piece_height box
+       of the pixel array in a single reshape/reduce pass. Any remainder on
+       the right or bottom edge is trimmed, matching the trimmed mosaic base.
+       Every pixel is weighted equally.
+
+       Args:
+           pixels: (numpy.ndarray) (height, width, channels) pixel array
+           piece_width: (int) the width of the box region
+           piece_height: (int) the height of the box region
+
+       Returns:
+           (numpy.ndarray) (rows, cols, 3) float64 array of average colors
+    """
+
+    height, width = pixels.shape[:2]
+    rows, cols = height // piece_height, width // piece_width
+    trimmed = pixels[:rows * piece_height, :cols * piece_width, :3]
+    blocks = trimmed.reshape(rows, piece_height, cols, piece_width, 3)
+    return blocks.mean(axis=(1, 3), dtype=np.float64)
+
+
+def _cell_starts(pieces, piece_size, cells):
+    """Returns the first pixel of every cell when each of pieces pieces of
+       piece_size pixels is split into cells cells as evenly as possible."""
+    piece_starts = np.arange(pieces)[:, None] * piece_size
+    return (piece_starts + np.arange(cells) * piece_size // cells).ravel()
+
+
+def cell_descriptors(pixels, piece_width, piece_height, cells=2):
+    """Describes every piece_width x piece_height box of the pixel array by
+       the average colors of a cells x cells grid of sub-cells, rather than
+       by one average color. When the piece size is not divisible by cells,
+       the sub-cells differ in size by one pixel. Any remainder on the right
+       or bottom edge is trimmed, as in mean_colors_for_grid, and with cells
+       of 1 the descriptors are the average colors.
+
+       Args:
+           pixels: (numpy.ndarray) (..., height, width, 3) pixel array, e.g.
+                                   an image or a stack of thumbnails
+           piece_width: (int) the width of the box region
+           piece_height: (int) the height of the box region
+           cells: (int) sub-cells along each side of a box. Default: 2
+
+       Returns:
+           (numpy.ndarray) (..., rows, cols, cells * cells * 3) float64
+           descriptors, ordered by sub-cell row, sub-cell column and channel
+    """
+
+    if cells < 1 or cells > min(piece_width, piece_height):
+        raise ValueError("Error. Cells must be between 1 and the piece size.")
+    height, width = pixels.shape[-3:-1]
+    rows, cols = height // piece_height, width // piece_width
+    trimmed = pixels[..., :rows * piece_height, :cols * piece_width, :3]
+
+    y_starts = _cell_starts(rows, piece_height, cells)
+    x_starts = _cell_starts(cols, piece_width, cells)
+    sums = np.add.reduceat(np.add.reduceat(trimmed, y_starts, axis=-3, dtype=np.float64),
+                           x_starts, axis=-2)
+    counts = np.outer(np.diff(np.append(y_starts, rows * piece_height)),
+                      np.diff(np.append(x_starts, cols * piece_width)))
+    means = sums / counts[..., None]
+
+    lead = means.shape[:-3]
+    means = means.reshape(lead + (rows, cells, cols, cells, 3))
+    means = np.moveaxis(means, -4, -3)
+    return means.reshape(lead + (rows, cols, cells * cells * 3))
+
+
+def grid_boxes(width, height, piece_width, piece_height, offset=(0, 0)):
+    """Lists the boxes of a grid of piece_width x piece_height pieces that
+       starts at offset, column by column like PhotoMosaic.divvy_into_box_regions.
+       Pieces that would go past the image are left out.
+
+       Args:
+           width: (int) the width of the image
+           height: (int) the height of the image
+           piece_width: (int) the width of the box region
+           piece_height: (int) the height of the box region
+           offset: (tuple) (left, top) of the first box. Default: (0, 0)
+
+       Returns:
+           (list) (left, top, right, bottom) boxes
+    """
+
+    left, top = offset
+    cols = max(0, (width - left) // piece_width)
+    rows = max(0, (height - top) // piece_height)
+    return [(left + i * piece_width, top + j * piece_height,
+             left + (i + 1) * piece_width, top + (j + 1) * piece_height)
+            for i in range(cols) for j in range(rows)]
+
+
+class SummedAreaTable(object):
+    """SummedAreaTable (an integral image) holds, for every pixel position,
+       the sum of the colors above and to the left of it. After one pass over
+       the pixels, the sum and average color of any rectangle is found from
+       four table lookups, whatever its size or position. This lets several
+       piece sizes, shifted grids or non-uniform layouts be averaged without
+       going over the pixels again. The sums are exact int64 values, so the
+       table takes 24 bytes per pixel. With squares, a second table of the
+       squared colors gives the color variance of any rectangle as well.
+
+       Attributes:
+           table: (numpy.ndarray) (height + 1, width + 1, 3) int64 sums
+           squares_table: (numpy.ndarray) int64 sums of the squared colors,
+                                          or None
+           width: (int) the width of the image
+           height: (int) the height of the image
+    """
+
+    def __init__(self, pixels, squares=False):
+        """Initializes SummedAreaTable from a (height, width, channels) pixel array."""
+        self.height, self.width = pixels.shape[:2]
+        self.table = self._integrate(pixels[..., :3].astype(np.int64))
+        self.squares_table = self._integrate(pixels[..., :3].astype(np.int64) ** 2) if squares else None
+
+    def _integrate(self, values):
+        table = np.zeros((self.height + 1, self.width + 1, 3), dtype=np.int64)
+        np.cumsum(values, axis=0, out=table[1:, 1:])
+        np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+        return table
+
+    def sums(self, boxes):
+        """Sums the colors of each box.
+
+           Args:
+               boxes: (numpy.ndarray) (n, 4) array of (left, top, right, bottom) boxes
+
+           Returns:
+               (numpy.ndarray) (n, 3) int64 array of color sums
+        """
+
+        return self._box_sums(self.table, boxes)
+
+    def _box_sums(self, table, boxes):
+        boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+        left, top, right, bottom = boxes.T
+        if len(boxes) and (left.min() < 0 or top.min() < 0 or right.max() > self.width
+                           or bottom.max() > self.height or (right <= left).any() or (bottom <= top).any()):
+            raise ValueError("Error. Boxes must be non-empty and inside the image.")
+        return table[bottom, right] - table[top, right] - table[bottom, left] + table[top, left]
+
+    def means(self, boxes):
+        """Calculates the average color of each box.
+
+           Args:
+               boxes: (numpy.ndarray) (n, 4) array of (left, top, right, bottom) boxes
+
+           Returns:
+               (numpy.ndarray) (n, 3) float64 array of average colors
+        """
+
+        boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+        areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        return self.sums(boxes) / areas[:, None]
+
+    def variances(self, boxes):
+        """Calculates the color variance of each box, summed over R, G and B.
+
+           Args:
+               boxes: (numpy.ndarray) (n, 4) array of (left, top, right, bottom) boxes
+
+           Returns:
+               (numpy.ndarray) n float64 variances
+
+           Raises:
+               ValueError: if the table was built without squares
+        """
+
+        if self.squares_table is None:
+            raise ValueError("Error. The summed-area table was built without squares.")
+        boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+        areas = ((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]))[:, None]
+        means = self._box_sums(self.table, boxes) / areas
+        return (self._box_sums(self.squares_table, boxes) / areas - means ** 2).sum(axis=1)
+
+    def mean(self, box):
+        """Calculates the average color of one box as (r, g, b)."""
+        return tuple(self.means([box])[0].tolist())
+
+    def grid_means(self, piece_width, piece_height, offset=(0, 0)):
+        """Calculates the average color of every piece of a grid that starts
+           at offset, like mean_colors_for_grid but for any piece size and
+           offset.
+
+           Returns:
+               (numpy.ndarray) (rows, cols, 3) float64 array of average colors
+        """
+
+        left, top = offset
+        cols = max(0, (self.width - left) // piece_width)
+        rows = max(0, (self.height - top) // piece_height)
+        xs = left + np.arange(cols + 1) * piece_width
+        ys = top + np.arange(rows + 1) * piece_height
+        corners = self.table[np.ix_(ys, xs)]
+        sums = corners[1:, 1:] - corners[:-1, 1:] - corners[1:, :-1] + corners[:-1, :-1]
+        return sums / (piece_width * piece_height)
+
+
+def quadtree_boxes(sat, piece_width, piece_height, levels, threshold):
+    """Tiles an image adaptively. The image, trimmed to whole pieces, is
+       covered by large tiles of piece size * 2^levels, and every tile whose
+       color variance exceeds the threshold is split into four, level by
+       level, down to the piece size. Tiles that stick out of the trimmed
+       image are always split and tiles fully outside it are dropped, so the
+       tiles cover the trimmed image exactly. The variances of each level
+       are calculated together from the summed-area table.
+
+       Args:
+           sat: (SummedAreaTable) table of the image, built with squares
+           piece_width: (int) the width of the smallest tile
+           piece_height: (int) the height of the smallest tile
+           levels: (int) number of times the largest tiles can be split
+           threshold: (float) variance above which a tile is split
+
+       Returns:
+           (numpy.ndarray) (n, 4) array of (left, top, right, bottom) tiles
+    """
+
+    width = sat.width // piece_width * piece_width
+    height = sat.height // piece_height * piece_height
+    tile_width, tile_height = piece_width << levels, piece_height << levels
+    boxes = np.array(grid_boxes(-(-width // tile_width) * tile_width, -(-height // tile_height) * tile_height,
+                                tile_width, tile_height), dtype=np.int64).reshape(-1, 4)
+
+    tiles = []
+    for level in range(levels + 1):
+        inside = (boxes[:, 2] <= width) & (boxes[:, 3] <= height)
+        split = ~inside
+        if level < levels and inside.any():
+            split[inside] = sat.variances(boxes[inside]) > threshold
+        tiles.append(boxes[inside & ~split])
+        if level == levels:
+            break
+
+        parents = boxes[split]
+        tile_width, tile_height = tile_width // 2, tile_height // 2
+        boxes = np.concatenate([parents + [dx, dy, dx - tile_width, dy - tile_height]
+                                for dy in (0, tile_height) for dx in (0, tile_width)]) \
+            if len(parents) else parents
+        boxes = boxes[(boxes[:, 0] < width) & (boxes[:, 1] < height)]
+    return np.concatenate(tiles)
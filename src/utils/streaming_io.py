@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""This script provides band-by-band image reading and writing for the TiledRenderer.py file."""
+
+import zlib
+import struct
+
+import numpy as np
+from PIL import Image
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+RAW_MODES = {"RGB": slice(None), "BGR": slice(None, None, -1)}
+
+
+def _raw_layout(image):
+    """Describes where the pixel rows of an uncompressed image are stored in
+       its file, e.g. for PPM, BMP and uncompressed TIFF images.
+
+       Args:
+           image: (PIL.image) an opened, not yet loaded, image
+
+       Returns:
+           (int, int, string, int) offset of the first row, bytes per row,
+           channel order and row orientation, or None if the rows cannot be
+           read directly from the file
+    """
+
+    if image.mode != "RGB" or len(image.tile) != 1:
+        return None
+    codec, extents, offset, args = image.tile[0]
+    if codec != "raw" or tuple(extents) != (0, 0) + image.size:
+        return None
+    rawmode, stride, orientation = (args, 0, 1) if isinstance(args, str) else args
+    if rawmode not in RAW_MODES:
+        return None
+    return offset, stride or image.size[0] * 3, rawmode, orientation
+
+
+def iter_image_bands(filename, band_height):
+    """Reads an image band by band from top to bottom. Uncompressed images
+       are memory-mapped, so only one band of pixels is in memory at a time.
+       Other formats cannot be decoded partially by PIL, so they are decoded
+       once, converted only if they are not RGB already, and each band is
+       cropped from the decoded image as it is handed out, so no second copy
+       of the whole image is made as an array.
+
+       Args:
+           filename: (string) the image file
+           band_height: (int) number of pixel rows in each band
+
+       Yields:
+           (int, numpy.ndarray) the top row of the band and the
+           (rows, width, 3) uint8 RGB pixels of the band
+    """
+
+    with Image.open(filename) as image:
+        width, height = image.size
+        layout = _raw_layout(image)
+        if layout is None:
+            rgb = image if image.mode == "RGB" else image.convert("RGB")
+            for top in range(0, height, band_height):
+                yield top, np.asarray(rgb.crop((0, top, width, min(top + band_height, height))))
+            return
+
+    offset, stride, rawmode, orientation = layout
+    rows = np.memmap(filename, dtype=np.uint8, mode="r", offset=offset, shape=(height, stride))
+    for top in range(0, height, band_height):
+        bottom = min(top + band_height, height)
+        if orientation < 0:
+            band = rows[height - bottom:height - top][::-1]
+        else:
+            band = rows[top:bottom]
+        band = np.array(band[:, :width * 3]).reshape(bottom - top, width, 3)
+        yield top, band[..., RAW_MODES[rawmode]]
+
+
+class StreamingPNGWriter(object):
+    """StreamingPNGWriter writes an RGB PNG image a band of rows at a time,
+       so the whole image never has to be held in memory. Every row is
+       stored with the PNG "Up" filter and compressed as it is written.
+
+       Attributes:
+           filename: (string) the PNG file
+           width: (int) the width of the image
+           height: (int) the height of the image
+           rows_written: (int) number of rows written so far
+    """
+
+    def __init__(self, filename, width, height, compress_level=6):
+        """Initializes StreamingPNGWriter with filename, width, height and
+           compress_level, and writes the PNG header."""
+        self.filename = filename
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self._previous_row = np.zeros(width * 3, dtype=np.uint8)
+        self._compressor = zlib.compressobj(compress_level)
+        self._out = open(filename, "wb")
+        self._out.write(PNG_SIGNATURE)
+        self._write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._out.close()
+
+    def _write_chunk(self, tag, data):
+        self._out.write(struct.pack(">I", len(data)))
+        self._out.write(tag + data)
+        self._out.write(struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff))
+
+    def write_rows(self, rows):
+        """Appends rows to the image.
+
+           Args:
+               rows: (numpy.ndarray) (n, width, 3) uint8 RGB pixels
+        """
+
+        rows = np.asarray(rows, dtype=np.uint8).reshape(len(rows), self.width * 3)
+        if not len(rows):
+            return
+        if self.rows_written + len(rows) > self.height:
+            raise ValueError("Error. More rows written than the height of the PNG.")
+        previous = np.vstack([self._previous_row[None], rows[:-1]])
+        filtered = np.empty((len(rows), self.width * 3 + 1), dtype=np.uint8)
+        filtered[:, 0] = 2
+        filtered[:, 1:] = rows - previous
+        compressed = self._compressor.compress(filtered.tobytes())
+        if compressed:
+            self._write_chunk(b"IDAT", compressed)
+        self._previous_row = rows[-1].copy()
+        self.rows_written += len(rows)
+
+    def close(self):
+        """Finishes the compressed data and writes the end of the PNG."""
+        if self.rows_written != self.height:
+            self._out.close()
+            raise ValueError(f"Error. Wrote {self.rows_written} of {self.height} PNG rows.")
+        self._write_chunk(b"IDAT", self._compressor.flush())
+        self._write_chunk(b"IEND", b"")
+        self._out.close()
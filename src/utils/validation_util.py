@@ -2,60 +2,58 @@
 """Decorators to test validity of command line arguments passed in."""
 
 import os
-import sys
 import functools
 
 from utils.helpers import validate_type
 
 
 def validate_sys_input(func):
-    """Validates the system inputs. First argument, after input keyword,
-       must be a image and the second argument, after directory keyword,
-       must be the image directory of thumbnails.
+    """Validates the system inputs. An input image, or a batch of input
+       images, and the image directory of thumbnails must be passed in.
     """
     @functools.wraps(func)
     def validated(*args):
-        if len(sys.argv) < 5:
-            raise ValueError("Need additional image and img_dir argument.")
         result = func(*args)
+        if not (result.input or result.inputs or result.input_list) or not result.directory:
+            raise ValueError("Need additional image and img_dir argument.")
         return result
     return validated
 
 
-@validate_sys_input
 def validate_input_is_image(func):
-    """Validates if the first argument, after input, has a png, jpg
-       extension. Even if none."""
+    """Validates if the input argument has a png, jpg extension. Even if
+       none. Batch inputs are filtered to images when they are expanded."""
     @functools.wraps(func)
     def validated(*args):
-        cli_arg = sys.argv[2]
-        if not (cli_arg.endswith(".png") or cli_arg.endswith(".jpg")):
-            raise ValueError("Input image argument does not end with "
-                             "an img extension.")
+        result = func(*args)
+        cli_arg = result.input
         if cli_arg is None:
+            if result.inputs or result.input_list:
+                return result
             raise ImportError("Did not specify the correct input file!")
         if not validate_type(cli_arg, str):
             raise TypeError("Error. {} is not of string type.".format(cli_arg))
-        result = func(*args)
+        if not (cli_arg.endswith(".png") or cli_arg.endswith(".jpg")):
+            raise ValueError("Input image argument does not end with "
+                             "an img extension.")
         return result
     return validated
 
 
-@validate_sys_input
 def validate_img_dir(func):
     """Validates if the image directory for the thumbnails exists."""
     @functools.wraps(func)
     def validated(*args):
-        dir_path = sys.argv[-1]
-        if not os.path.isdir(dir_path):
-            raise ValueError("Need to pass in existing (image) directory.")
-        if not os.listdir(dir_path):
-            raise ValueError("Image directory argument is empty.")
+        result = func(*args)
+        dir_path = result.directory
         if dir_path is None:
             raise ImportError('Did not specify the correct directory!')
         if not validate_type(dir_path, str):
             raise TypeError("Error. {} is not of string type.".format(dir_path))
-        result = func(*args)
+        if not os.path.isdir(dir_path):
+            raise ValueError("Need to pass in existing (image) directory.")
+        if not os.listdir(dir_path):
+            raise ValueError("Image directory argument is empty.")
         return result
     return validated
 
@@ -95,7 +93,7 @@ def validate_json_data(sample_json_data):
 
 def validate_filename(func):
     @functools.wraps(func)
-    def validated(*args):
+    def validated(*args, **kwargs):
         if args[-1] is None:
             raise ValueError("Error. None is not a correct file name.")
 
@@ -103,7 +101,7 @@ def validate_filename(func):
         # if not validate_type(args[-1], str):
         #     raise TypeError("Error. {} is not of type string.".format(args[-1]))
 
-        result = func(*args)
+        result = func(*args, **kwargs)
         return result
     return validated
 